@@ -0,0 +1,164 @@
+"""Prometheus metrics and request tracing for the agent server
+
+- tanggap_agent_http_requests_total / _http_request_seconds: per route
+  template (/run_sse, /run_stateless, session create/delete, ...), timed
+  until the last byte of a streamed response.
+- tanggap_agent_model_first_chunk_seconds / _model_seconds: LLM time to
+  first streamed chunk and total generation, per agent, from
+  before/after-model callbacks.
+- tanggap_agent_model_tokens_total{agent, kind}: prompt and output tokens.
+- Session store, compaction and stateless runner stats, as gauges.
+
+The backend sends a W3C ``traceparent``; its trace id is bound for the
+request, echoed in ``X-Trace-Id`` and printed with slow requests
+(SLOW_REQUEST_MS) and slow model calls, so one analysis can be followed
+from the backend's logs into the agent's.
+"""
+import contextvars
+import os
+import re
+import secrets
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "5000"))
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+MAX_TRACKED_CALLS = 10000  # model calls that errored never reach the after callback
+
+HTTP_REQUESTS = Counter(
+    "tanggap_agent_http_requests_total", "HTTP requests by route and status", ["method", "route", "status"],
+)
+HTTP_SECONDS = Histogram(
+    "tanggap_agent_http_request_seconds", "HTTP request latency by route, until the last body byte",
+    ["method", "route"], buckets=BUCKETS,
+)
+MODEL_FIRST_CHUNK_SECONDS = Histogram(
+    "tanggap_agent_model_first_chunk_seconds", "Time from model request to its first response chunk",
+    ["agent"], buckets=BUCKETS,
+)
+MODEL_SECONDS = Histogram(
+    "tanggap_agent_model_seconds", "Time from model request to its final response", ["agent"], buckets=BUCKETS,
+)
+MODEL_TOKENS = Counter(
+    "tanggap_agent_model_tokens_total", "Tokens reported by the model", ["agent", "kind"],
+)
+
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-[0-9a-f]{16}-[0-9a-f]{2}$")
+
+_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_id", default=None)
+_model_calls: OrderedDict = OrderedDict()  # invocation id -> [started, first chunk seen]
+
+
+def trace_id() -> Optional[str]:
+    """Trace id of the request being served, if any"""
+    return _trace_id.get()
+
+
+def before_model(callback_context, llm_request):
+    """ADK before_model_callback: start timing the model call"""
+    _model_calls[callback_context.invocation_id] = [time.perf_counter(), False]
+    while len(_model_calls) > MAX_TRACKED_CALLS:
+        _model_calls.popitem(last=False)
+    return None
+
+
+def after_model(callback_context, llm_response):
+    """ADK after_model_callback: runs for every streamed chunk and for the final response"""
+    call = _model_calls.get(callback_context.invocation_id)
+    if call is None:
+        return None
+    agent = callback_context.agent_name
+    elapsed = time.perf_counter() - call[0]
+    if not call[1]:
+        call[1] = True
+        MODEL_FIRST_CHUNK_SECONDS.labels(agent).observe(elapsed)
+    if llm_response.partial:
+        return None
+
+    del _model_calls[callback_context.invocation_id]
+    MODEL_SECONDS.labels(agent).observe(elapsed)
+    usage = llm_response.usage_metadata
+    if usage is not None:
+        MODEL_TOKENS.labels(agent, "prompt").inc(usage.prompt_token_count or 0)
+        MODEL_TOKENS.labels(agent, "output").inc(usage.candidates_token_count or 0)
+    if elapsed * 1000 >= SLOW_REQUEST_MS:
+        print(f"⚠️ Slow model call trace={trace_id()} agent={agent} {elapsed * 1000:.0f}ms")
+    return None
+
+
+_stats_sources: Dict[str, Callable[[], Dict]] = {}
+
+
+def register_stats(section: str, source: Callable[[], Dict]) -> None:
+    """Export the numbers in ``source()`` as tanggap_agent_<section>_<key> gauges on scrape"""
+    _stats_sources[section] = source
+
+
+class _StatsCollector:
+    def collect(self):
+        for section, source in list(_stats_sources.items()):
+            try:
+                values = source()
+            except Exception as e:
+                print(f"⚠️ Metrics source {section} failed: {e}")
+                continue
+            for key, value in _flatten(values):
+                name = re.sub(r"[^a-zA-Z0-9_]", "_", f"tanggap_agent_{section}_{key}")
+                yield GaugeMetricFamily(name, f"{key} from the {section} stats", value=value)
+
+
+def _flatten(values: Dict, prefix: str = ""):
+    for key, value in values.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}_")
+        elif isinstance(value, (bool, int, float)):
+            yield f"{prefix}{key}", float(value)
+
+
+REGISTRY.register(_StatsCollector())
+
+
+def render() -> tuple:
+    """Current metrics in the Prometheus text format, and its content type"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """Time every HTTP request and bind its trace id (plain ASGI, so SSE streams pass through)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        match = _TRACEPARENT.match(headers.get("traceparent", "").strip())
+        current = match.group(1) if match else secrets.token_hex(16)
+        token = _trace_id.set(current)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-trace-id", current.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUESTS.labels(scope["method"], route, str(status)).inc()
+            HTTP_SECONDS.labels(scope["method"], route).observe(elapsed)
+            if elapsed * 1000 >= SLOW_REQUEST_MS:
+                print(f"⚠️ Slow request trace={current} {scope['method']} {route} {status} {elapsed * 1000:.0f}ms")
+            _trace_id.reset(token)
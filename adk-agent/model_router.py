@@ -0,0 +1,282 @@
+"""Route model calls across several Ollama replicas
+
+OLLAMA_API_BASES lists the replicas (falling back to OLLAMA_API_BASE).
+Each call goes to the replica with the fewest calls in flight: among two
+random candidates ("p2c", default) or among all of them
+("least_outstanding"); "round_robin" ignores load and is kept for
+comparison.
+
+Health is passive: a call that fails with a connection error, timeout,
+429 or 5xx counts against its replica, and OLLAMA_CB_FAILURES failures in
+a row open the replica's circuit for OLLAMA_CB_COOLDOWN_SECONDS. After
+that one trial call is let through (half-open); only its result closes the
+circuit or opens it again. Results of calls that started before the
+circuit last opened are ignored for circuit state. A call that fails before returning any output is retried
+on another replica (OLLAMA_ROUTE_RETRIES). When every replica is open,
+calls still go to the one whose cooldown ends first rather than failing.
+
+Replicas in OLLAMA_BULK_API_BASES (e.g. a smaller GPU) serve the batch
+agent and requests the backend marks ``X-Priority: bulk``; interactive
+calls only use them while every other replica is open, and bulk calls
+fall back to the others the same way.
+"""
+import contextvars
+import itertools
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from google.adk.models.lite_llm import LiteLLMClient
+
+OLLAMA_API_BASES = os.getenv("OLLAMA_API_BASES", "")
+OLLAMA_BULK_API_BASES = os.getenv("OLLAMA_BULK_API_BASES", "")
+OLLAMA_LB_POLICY = os.getenv("OLLAMA_LB_POLICY", "p2c")  # "p2c", "least_outstanding" or "round_robin"
+OLLAMA_CB_FAILURES = int(os.getenv("OLLAMA_CB_FAILURES", "3"))
+OLLAMA_CB_COOLDOWN_SECONDS = float(os.getenv("OLLAMA_CB_COOLDOWN_SECONDS", "10"))
+OLLAMA_ROUTE_RETRIES = int(os.getenv("OLLAMA_ROUTE_RETRIES", "1"))
+
+EWMA_ALPHA = 0.2
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("priority", default="interactive")
+
+
+def _split(urls: str) -> List[str]:
+    return [url.strip().rstrip("/") for url in urls.split(",") if url.strip()]
+
+
+class Replica:
+    """One model server and its in-flight count, circuit state and latency"""
+
+    def __init__(self, url: str, pool: str):
+        self.url = url
+        self.pool = pool
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.opened_until: Optional[float] = None
+        self.opened = 0  # times the circuit has opened; calls started before the last one are stale
+        self.trial_in_flight = False
+        self.ewma_ms: Optional[float] = None
+
+    def state(self, now: float) -> str:
+        if self.opened_until is None:
+            return "closed"
+        return "open" if now < self.opened_until else "half_open"
+
+    def available(self, now: float) -> bool:
+        state = self.state(now)
+        return state == "closed" or (state == "half_open" and not self.trial_in_flight)
+
+    def stats(self, now: float) -> Dict:
+        return {
+            "url": self.url,
+            "pool": self.pool,
+            "state": self.state(now),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ewma_ms": round(self.ewma_ms, 2) if self.ewma_ms is not None else None,
+        }
+
+
+class ModelRouter:
+    """Pick a replica per call and track its outcome"""
+
+    def __init__(
+        self,
+        primary: Sequence[str],
+        bulk: Sequence[str] = (),
+        policy: str = OLLAMA_LB_POLICY,
+        failure_threshold: int = OLLAMA_CB_FAILURES,
+        cooldown_seconds: float = OLLAMA_CB_COOLDOWN_SECONDS,
+        retries: int = OLLAMA_ROUTE_RETRIES,
+        seed: Optional[int] = None,
+    ):
+        if policy not in ("p2c", "least_outstanding", "round_robin"):
+            raise ValueError(f"Unknown OLLAMA_LB_POLICY: {policy}")
+        self.replicas = [Replica(url, "primary") for url in primary] + [Replica(url, "bulk") for url in bulk]
+        if not self.replicas:
+            raise ValueError("No model replicas configured")
+        self.policy = policy
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.retries = retries
+        self._rng = random.Random(seed)
+        self._turn = itertools.count()
+        self._stats = {"calls": 0, "retries": 0, "all_open": 0}
+
+    @classmethod
+    def from_env(cls, default_api_base: str) -> "ModelRouter":
+        return cls(_split(OLLAMA_API_BASES) or [default_api_base], _split(OLLAMA_BULK_API_BASES))
+
+    def pick(self, lane: str = "interactive", exclude: Sequence[Replica] = ()) -> Replica:
+        """Choose a replica for one call, preferring the lane's pool"""
+        now = time.monotonic()
+        candidates = [r for r in self.replicas if r not in exclude] or self.replicas
+        preferred = "bulk" if lane == "bulk" else "primary"
+        for pool in (preferred, None):
+            available = [r for r in candidates if (pool is None or r.pool == pool) and r.available(now)]
+            if available:
+                return self._balance(available)
+        self._stats["all_open"] += 1
+        return min(candidates, key=lambda r: r.opened_until or 0.0)
+
+    def _balance(self, replicas: List[Replica]) -> Replica:
+        if len(replicas) == 1:
+            return replicas[0]
+        if self.policy == "round_robin":
+            return replicas[next(self._turn) % len(replicas)]
+        if self.policy == "p2c":
+            replicas = self._rng.sample(replicas, 2)
+        else:
+            self._rng.shuffle(replicas)  # break ties at random
+        return min(replicas, key=lambda r: (r.in_flight, r.ewma_ms or 0.0))
+
+    def acquire(self, replica: Replica) -> tuple:
+        """Count a call as in flight on ``replica``
+
+        Returns the call's ticket for ``release``: its start time, the
+        circuit's open count and whether it is the half-open trial.
+        """
+        now = time.monotonic()
+        trial = replica.state(now) == "half_open" and not replica.trial_in_flight
+        if trial:
+            replica.trial_in_flight = True
+        replica.in_flight += 1
+        replica.requests += 1
+        self._stats["calls"] += 1
+        return now, replica.opened, trial
+
+    def release(self, replica: Replica, ticket: tuple, outcome: str) -> None:
+        """Record the end of a call: "ok", "failed" or "aborted" (cancelled, or the request's own fault)"""
+        started, opened, trial = ticket
+        now = time.monotonic()
+        replica.in_flight -= 1
+        if trial:
+            replica.trial_in_flight = False
+        # A call that started before the circuit last opened says nothing about now
+        current = opened == replica.opened
+        if outcome == "ok":
+            elapsed_ms = (now - started) * 1000
+            replica.ewma_ms = elapsed_ms if replica.ewma_ms is None else (
+                EWMA_ALPHA * elapsed_ms + (1 - EWMA_ALPHA) * replica.ewma_ms
+            )
+            if current and (trial or replica.opened_until is None):
+                replica.consecutive_failures = 0
+                replica.opened_until = None
+        elif outcome == "failed":
+            replica.failures += 1
+            if not current:
+                return
+            replica.consecutive_failures += 1
+            if replica.opened_until is not None or replica.consecutive_failures >= self.failure_threshold:
+                if replica.state(now) != "open":
+                    print(f"⚠️ Model replica {replica.url} failing, opening its circuit for {self.cooldown_seconds:.0f}s")
+                    replica.opened += 1
+                replica.opened_until = now + self.cooldown_seconds
+
+    def should_retry(self, tried: Sequence[Replica]) -> bool:
+        """Whether a call that failed on ``tried`` gets another replica"""
+        if len(tried) > self.retries or len(tried) >= len(self.replicas):
+            return False
+        self._stats["retries"] += 1
+        return True
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "policy": self.policy,
+            **self._stats,
+            "replicas": {str(i): r.stats(now) for i, r in enumerate(self.replicas)},
+        }
+
+
+def is_replica_failure(error: BaseException) -> bool:
+    """Whether an error says the replica is unhealthy, not that the request was bad"""
+    status = getattr(error, "status_code", None)
+    return status is None or status >= 500 or status in (408, 429)
+
+
+class RoutedLiteLLMClient(LiteLLMClient):
+    """LiteLLM client that sends each completion to a replica picked by ``router``
+
+    Passed to LiteLlm as ``llm_client``; ``lane`` is "bulk" for agents
+    whose traffic may go to the bulk pool.
+    """
+
+    def __init__(self, router: ModelRouter, lane: str = "interactive"):
+        super().__init__()
+        self.router = router
+        self.lane = lane
+
+    def _lane(self) -> str:
+        return "bulk" if self.lane == "bulk" or _priority.get() == "bulk" else "interactive"
+
+    async def acompletion(self, model: Any, messages: Any, tools: Any, **kwargs: Any):
+        if kwargs.get("stream"):
+            return self._stream(model, messages, tools, kwargs)
+        tried: List[Replica] = []
+        while True:
+            replica = self.router.pick(self._lane(), tried)
+            ticket = self.router.acquire(replica)
+            try:
+                response = await super().acompletion(model, messages, tools, **{**kwargs, "api_base": replica.url})
+            except Exception as e:
+                failed = is_replica_failure(e)
+                self.router.release(replica, ticket, "failed" if failed else "aborted")
+                tried.append(replica)
+                if not (failed and self.router.should_retry(tried)):
+                    raise
+                continue
+            except BaseException:
+                self.router.release(replica, ticket, "aborted")
+                raise
+            self.router.release(replica, ticket, "ok")
+            return response
+
+    async def _stream(self, model: Any, messages: Any, tools: Any, kwargs: Dict):
+        """Yield the chunks of a streamed completion, retrying elsewhere until the first chunk"""
+        tried: List[Replica] = []
+        while True:
+            replica = self.router.pick(self._lane(), tried)
+            ticket = self.router.acquire(replica)
+            streamed = False
+            try:
+                stream = await super().acompletion(model, messages, tools, **{**kwargs, "api_base": replica.url})
+                async for chunk in stream:
+                    streamed = True
+                    yield chunk
+            except Exception as e:
+                failed = is_replica_failure(e)
+                self.router.release(replica, ticket, "failed" if failed else "aborted")
+                tried.append(replica)
+                if streamed or not (failed and self.router.should_retry(tried)):
+                    raise
+                continue
+            except BaseException:
+                self.router.release(replica, ticket, "aborted")
+                raise
+            self.router.release(replica, ticket, "ok")
+            return
+
+
+class PriorityMiddleware:
+    """Bind the request's ``X-Priority`` header ("bulk" or "interactive") for model routing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        priority = "interactive"
+        for key, value in scope["headers"]:
+            if key.lower() == b"x-priority" and value.decode("latin-1").strip().lower() == "bulk":
+                priority = "bulk"
+        token = _priority.set(priority)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _priority.reset(token)
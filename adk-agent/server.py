@@ -1,14 +1,66 @@
+import asyncio
+import hashlib
 import os
-import os
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from google.adk.cli.fast_api import get_fast_api_app
+from google.genai import types
 
 # Load environment variables
 load_dotenv()
 
+import metrics
+import model_router
+import session_store
+
 AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
-app_args = {"agents_dir": AGENT_DIR, "web": True}
+APP_NAMES = ["tanggap_agent", "tanggap_batch_agent"]
+
+# Startup warm-up, in the background: import the agents (LiteLLM and the
+# Google Cloud project lookup are slow), then load the model on Ollama and
+# prefill the instructions. /health/ready is 503 until it has finished.
+AGENT_WARMUP = os.getenv("AGENT_WARMUP", "true").lower() == "true"
+AGENT_WARMUP_TIMEOUT_SECONDS = float(os.getenv("AGENT_WARMUP_TIMEOUT_SECONDS", "120"))
+
+session_service_uri, session_service, session_compactor = session_store.install(AGENT_DIR, APP_NAMES)
+stateless_runner = session_store.StatelessRunner(APP_NAMES)
+warmup_status = {"ready": False, "ready_ms": None, "error": None}
+
+async def warm_up() -> None:
+    """Load the agents and, with AGENT_WARMUP, the model; then report ready"""
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(stateless_runner.load)
+        from tanggap_agent import agent
+
+        await asyncio.to_thread(agent.configure_google_cloud)
+        if AGENT_WARMUP:
+            await asyncio.wait_for(agent.warm_up(), AGENT_WARMUP_TIMEOUT_SECONDS)
+    except Exception as e:
+        print(f"⚠️ Agent warm-up failed: {e!r}")
+        warmup_status["error"] = repr(e)
+    warmup_status["ready_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    warmup_status["ready"] = True
+    print(f"✅ Agent ready in {warmup_status['ready_ms']:.0f}ms")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the warm-up and session compaction for ADK-managed stores"""
+    warmup_task = asyncio.create_task(warm_up())
+    if session_compactor is not None:
+        await session_compactor.start()
+    yield
+    warmup_task.cancel()
+    await asyncio.gather(warmup_task, return_exceptions=True)
+    if session_compactor is not None:
+        await session_compactor.stop()
+
+app_args = {"agents_dir": AGENT_DIR, "web": True, "lifespan": lifespan}
+if session_service_uri:
+    app_args["session_service_uri"] = session_service_uri
 
 # Create FastAPI app with ADK integration
 app: FastAPI = get_fast_api_app(**app_args)
@@ -18,11 +70,89 @@ print(f"🔵 Available routes: {[route.path for route in app.routes if not route
 app.title = "TanggapAI - Customer Feedback Analyzer"
 app.description = "Enterprise Customer Feedback Analyzer and Root Cause Intelligence powered by Gemma"
 app.version = "1.0.0"
+app.add_middleware(model_router.PriorityMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "service": "tanggap-ai-agent"}
 
+@app.get("/health/live")
+def liveness_check():
+    """Liveness: the process is up, whether or not the warm-up has finished"""
+    return {"status": "alive", "service": "tanggap-ai-agent"}
+
+@app.get("/health/ready")
+def readiness_check():
+    """Readiness: 503 until the agents are loaded and the model is warm"""
+    if not warmup_status["ready"]:
+        return JSONResponse(status_code=503, content=warmup_status)
+    return warmup_status
+
+@app.get("/agent-info")
+def agent_info():
+    """Model, instructions and instruction fingerprint
+
+    The backend keys its analysis cache on the fingerprint, and its direct
+    Ollama engine sends the same instructions as the system prompt.
+    """
+    from tanggap_agent.agent import TANGGAP_BATCH_INSTRUCTION, TANGGAP_INSTRUCTION, gemma_model_name
+
+    return {
+        "app_name": "tanggap_agent",
+        "model": gemma_model_name,
+        "instruction_sha256": hashlib.sha256(TANGGAP_INSTRUCTION.encode("utf-8")).hexdigest(),
+        "instruction": TANGGAP_INSTRUCTION,
+        "batch_instruction": TANGGAP_BATCH_INSTRUCTION,
+    }
+
+@app.post("/run_stateless")
+async def run_stateless(body: dict):
+    """Run an agent once without a session, streaming events like /run_sse
+
+    Body: {"app_name", "user_id", "newMessage", "streaming"}. The run uses a
+    throwaway session that is deleted when the stream ends.
+    """
+    app_name = body.get("app_name")
+    if app_name not in APP_NAMES:
+        raise HTTPException(status_code=404, detail=f"Unknown app: {app_name}")
+    message = types.Content.model_validate(body.get("newMessage") or body.get("new_message"))
+    events = stateless_runner.run(app_name, body.get("user_id", "default_user"), message, bool(body.get("streaming")))
+
+    async def sse():
+        async for event in events:
+            yield f"data: {event.model_dump_json(exclude_none=True, by_alias=True)}\n\n"
+
+    return StreamingResponse(sse(), media_type="text/event-stream")
+
+@app.get("/session-stats")
+def session_stats():
+    """Session store size and evictions, stateless runs and process RSS"""
+    store = {"store": session_store.AGENT_SESSION_STORE_URI.split("://")[0]}
+    if isinstance(session_service, session_store.BoundedSessionService):
+        store = session_service.stats()
+    elif session_compactor is not None:
+        store = session_compactor.stats()
+    return {"store": store, "stateless": stateless_runner.stats(), "rss_mb": session_store.rss_mb()}
+
+@app.get("/router-stats")
+def router_stats():
+    """Model replicas: balancing policy, calls in flight, failures and circuit state"""
+    from tanggap_agent.agent import router
+
+    return router.stats()
+
+metrics.register_stats("session", lambda: session_stats()["store"])
+metrics.register_stats("router", router_stats)
+metrics.register_stats("stateless", stateless_runner.stats)
+metrics.register_stats("warmup", lambda: warmup_status)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus metrics: request and model latency, tokens and session store gauges"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/")
 def root():
     return {
@@ -30,7 +160,11 @@ def root():
         "description": "Enterprise Customer Feedback Analyzer and Root Cause Intelligence",
         "version": "1.0.0",
         "docs": "/docs",
-        "health": "/health"
+        "health": "/health",
+        "liveness": "/health/live",
+        "readiness": "/health/ready",
+        "router_stats": "/router-stats",
+        "metrics": "/metrics"
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,292 @@
+"""Session storage for the agent server
+
+Every analysis runs on an ADK session. With ADK's default in-memory store,
+sessions that the backend never deletes pile up for the life of the
+container. AGENT_SESSION_STORE_URI chooses the store:
+
+- ``bounded://`` (default): in memory, at most AGENT_SESSION_MAX sessions
+  (least recently used evicted first). A session idle for
+  AGENT_SESSION_TTL_SECONDS expires, and only the last
+  AGENT_SESSION_MAX_EVENTS events of a session are kept. The agents run
+  with include_contents="none", so older events are never read.
+- ``sqlite:///sessions.db`` or any other ADK session URI: ADK's own store.
+  Every AGENT_SESSION_COMPACT_SECONDS, sessions idle longer than the TTL
+  are deleted and a SQLite file is vacuumed.
+- ``memory://``: ADK's unbounded default.
+
+An evicted or expired session returns 404 on /run_sse. The backend already
+handles that by creating a new session.
+
+StatelessRunner serves /run_stateless: each run gets a throwaway session
+that is deleted as soon as the run ends, so nothing is kept at all.
+"""
+import asyncio
+import importlib
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+
+AGENT_SESSION_STORE_URI = os.getenv("AGENT_SESSION_STORE_URI", "bounded://")
+AGENT_SESSION_MAX = int(os.getenv("AGENT_SESSION_MAX", "10000"))
+AGENT_SESSION_TTL_SECONDS = float(os.getenv("AGENT_SESSION_TTL_SECONDS", "3600"))
+AGENT_SESSION_MAX_EVENTS = int(os.getenv("AGENT_SESSION_MAX_EVENTS", "20"))
+AGENT_SESSION_COMPACT_SECONDS = float(os.getenv("AGENT_SESSION_COMPACT_SECONDS", "300"))
+
+# Scheme under which server.py hands ADK the service built here
+REGISTERED_SCHEME = "tanggap"
+
+
+class BoundedSessionService(InMemorySessionService):
+    """In-memory sessions with an LRU cap, an idle TTL and a per-session event cap"""
+
+    def __init__(
+        self,
+        max_sessions: int = AGENT_SESSION_MAX,
+        ttl_seconds: float = AGENT_SESSION_TTL_SECONDS,
+        max_events: int = AGENT_SESSION_MAX_EVENTS,
+    ):
+        super().__init__()
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_events = max_events
+        self._touched: OrderedDict = OrderedDict()  # (app, user, session) -> last use, oldest first
+        self._stats = {"created": 0, "evicted": 0, "expired": 0, "trimmed_events": 0}
+
+    async def create_session(self, *, app_name: str, user_id: str, state=None, session_id=None, **kwargs):
+        session = await super().create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id, **kwargs
+        )
+        self._touch((app_name, user_id, session.id))
+        self._stats["created"] += 1
+        self._evict()
+        return session
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str, **kwargs):
+        key = (app_name, user_id, session_id)
+        touched = self._touched.get(key)
+        if touched is not None and time.monotonic() - touched > self.ttl_seconds:
+            self._drop(key)
+            self._stats["expired"] += 1
+            return None
+        session = await super().get_session(app_name=app_name, user_id=user_id, session_id=session_id, **kwargs)
+        if session is not None:
+            self._touch(key)
+        return session
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        self._drop((app_name, user_id, session_id))
+
+    async def append_event(self, session, event):
+        event = await super().append_event(session=session, event=event)
+        stored = self.sessions.get(session.app_name, {}).get(session.user_id, {}).get(session.id)
+        if stored is not None and len(stored.events) > self.max_events:
+            excess = len(stored.events) - self.max_events
+            del stored.events[:excess]
+            self._stats["trimmed_events"] += excess
+        return event
+
+    def stats(self) -> Dict:
+        return {
+            "store": "bounded",
+            "sessions": len(self._touched),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "max_events": self.max_events,
+            **self._stats,
+        }
+
+    def _touch(self, key: tuple) -> None:
+        self._touched[key] = time.monotonic()
+        self._touched.move_to_end(key)
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._touched:
+            key, touched = next(iter(self._touched.items()))
+            if now - touched > self.ttl_seconds:
+                self._stats["expired"] += 1
+            elif len(self._touched) > self.max_sessions:
+                self._stats["evicted"] += 1
+            else:
+                break
+            self._drop(key)
+
+    def _drop(self, key: tuple) -> None:
+        """Forget a session, pruning empty per-app and per-user maps"""
+        app_name, user_id, session_id = key
+        self._touched.pop(key, None)
+        users = self.sessions.get(app_name)
+        if not users or user_id not in users:
+            return
+        users[user_id].pop(session_id, None)
+        if not users[user_id]:
+            del users[user_id]
+        if not users:
+            del self.sessions[app_name]
+
+
+class SessionCompactor:
+    """Periodically delete idle sessions from an ADK store and vacuum SQLite files"""
+
+    def __init__(self, service, uri: str, app_names: list, ttl_seconds: float = AGENT_SESSION_TTL_SECONDS):
+        self.service = service
+        self.app_names = app_names
+        self.ttl_seconds = ttl_seconds
+        self.sqlite_path = _sqlite_path(uri)
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"runs": 0, "deleted": 0, "last_run": None}
+
+    async def start(self) -> None:
+        if self._task is None and AGENT_SESSION_COMPACT_SECONDS > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def compact(self) -> int:
+        """Delete sessions idle longer than the TTL; returns how many were deleted"""
+        cutoff = time.time() - self.ttl_seconds
+        deleted = 0
+        for app_name in self.app_names:
+            response = await self.service.list_sessions(app_name=app_name, user_id=None)
+            for session in response.sessions:
+                if session.last_update_time < cutoff:
+                    await self.service.delete_session(
+                        app_name=app_name, user_id=session.user_id, session_id=session.id
+                    )
+                    deleted += 1
+        if deleted and self.sqlite_path:
+            await asyncio.to_thread(_vacuum, self.sqlite_path)
+        self._stats["runs"] += 1
+        self._stats["deleted"] += deleted
+        self._stats["last_run"] = time.time()
+        return deleted
+
+    def stats(self) -> Dict:
+        return {"store": "sqlite" if self.sqlite_path else "adk", "ttl_seconds": self.ttl_seconds, **self._stats}
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(AGENT_SESSION_COMPACT_SECONDS)
+            try:
+                deleted = await self.compact()
+                if deleted:
+                    print(f"✅ Compacted session store: deleted {deleted} idle sessions")
+            except Exception as e:
+                print(f"⚠️ Session compaction failed: {e}")
+
+
+class StatelessRunner:
+    """Single-shot runs on throwaway sessions that never reach the session store"""
+
+    def __init__(self, app_names: list):
+        self.app_names = app_names
+        self._sessions = InMemorySessionService()
+        self._runners: Dict[str, Runner] = {}
+        self._stats = {"runs": 0, "in_flight": 0}
+
+    def _runner(self, app_name: str) -> Runner:
+        if app_name not in self.app_names:
+            raise ValueError(f"Unknown app: {app_name}")
+        runner = self._runners.get(app_name)
+        if runner is None:
+            agent = importlib.import_module(app_name).root_agent
+            runner = Runner(app_name=app_name, agent=agent, session_service=self._sessions)
+            self._runners[app_name] = runner
+        return runner
+
+    def load(self) -> None:
+        """Import the agents and build their runners ahead of the first run"""
+        for app_name in self.app_names:
+            self._runner(app_name)
+
+    async def run(self, app_name: str, user_id: str, message, streaming: bool = False):
+        """Yield the events of one run; the session is deleted when the run ends"""
+        runner = self._runner(app_name)
+        session = await self._sessions.create_session(app_name=app_name, user_id=user_id)
+        run_config = RunConfig(streaming_mode=StreamingMode.SSE if streaming else StreamingMode.NONE)
+        self._stats["runs"] += 1
+        self._stats["in_flight"] += 1
+        try:
+            async for event in runner.run_async(
+                user_id=user_id, session_id=session.id, new_message=message, run_config=run_config
+            ):
+                yield event
+        finally:
+            self._stats["in_flight"] -= 1
+            await self._sessions.delete_session(app_name=app_name, user_id=user_id, session_id=session.id)
+
+    def stats(self) -> Dict:
+        users = self._sessions.sessions.values()
+        return {**self._stats, "sessions": sum(len(s) for per_user in users for s in per_user.values())}
+
+
+def rss_mb() -> float:
+    """Resident set size of this process (Linux), 0 when unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError):
+        return 0.0
+
+
+def _sqlite_path(uri: str) -> Optional[str]:
+    """File behind a sqlite:// URI, resolved the way ADK's sqlite factory does"""
+    parsed = urlparse(uri)
+    if not parsed.scheme.startswith("sqlite") or not parsed.path:
+        return None
+    return parsed.path[1:] if parsed.path.startswith("/") else parsed.path
+
+
+def _vacuum(path: str) -> None:
+    with sqlite3.connect(path) as connection:
+        connection.execute("VACUUM")
+
+
+def build_session_service(uri: str, agents_dir: str):
+    """Session service for ``uri``, built the way ADK would build it"""
+    if uri.startswith("bounded://"):
+        return BoundedSessionService()
+    from google.adk.cli.service_registry import get_service_registry
+
+    service = get_service_registry().create_session_service(uri, agents_dir=agents_dir)
+    if service is None:
+        from google.adk.sessions.database_session_service import DatabaseSessionService
+
+        service = DatabaseSessionService(db_url=uri)
+    return service
+
+
+def install(agents_dir: str, app_names: list) -> tuple:
+    """Build the configured store and register it with ADK
+
+    Returns (session_service_uri for get_fast_api_app, service, compactor).
+    With a google-adk that has no service registry, the URI is passed
+    through and ADK builds (and owns) the store itself.
+    """
+    uri = AGENT_SESSION_STORE_URI
+    if uri.startswith("memory://"):
+        return uri, None, None
+    try:
+        from google.adk.cli.service_registry import get_service_registry
+    except ImportError:
+        print("⚠️ google-adk has no service registry, using its own session store without bounds")
+        return (None if uri.startswith("bounded://") else uri), None, None
+
+    service = build_session_service(uri, agents_dir)
+    get_service_registry().register_session_service(REGISTERED_SCHEME, lambda _uri, **kwargs: service)
+    compactor = None
+    if not isinstance(service, BoundedSessionService):
+        compactor = SessionCompactor(service, uri, app_names)
+    print(f"✅ Session store: {uri.split('://')[0]}")
+    return f"{REGISTERED_SCHEME}://", service, compactor
@@ -1,32 +1,136 @@
+import asyncio
 import os
 from pathlib import Path
-from typing import Any
+from typing import Any, Dict, List, Literal, Optional
 
 from dotenv import load_dotenv
 from google.adk.agents import Agent
 from google.adk.models.lite_llm import LiteLlm
-import google.auth
+from pydantic import BaseModel, ConfigDict, Field
+
+import metrics
 
 # Load environment variables
 root_dir = Path(__file__).parent.parent
 dotenv_path = root_dir / ".env"
 load_dotenv(dotenv_path=dotenv_path)
 
-# Configure Google Cloud
-try:
-    _, project_id = google.auth.default()
-    os.environ.setdefault("GOOGLE_CLOUD_PROJECT", project_id)
-except Exception:
-    pass
-
 os.environ.setdefault("GOOGLE_CLOUD_LOCATION", "europe-west1")
 
+# Local models have no price; skip LiteLLM's download of its cost map on first use
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
 
 
 # Configure model connection - Using larger model for better instruction following
 gemma_model_name = os.getenv("GEMMA_MODEL_NAME", "gemma3:4b")
 api_base = os.getenv("OLLAMA_API_BASE", "localhost:10010")  # Location of Ollama server
 
+# Prefix reuse: Ollama keeps each slot's KV cache and reuses the longest
+# matching prompt prefix, so the long instruction is prefilled once as long
+# as it reaches the model byte-for-byte identical and the model stays loaded.
+# keep_alive is only sent when set; otherwise the server's OLLAMA_KEEP_ALIVE
+# applies (-1, never unload, in ollama-backend).
+ollama_keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "")
+ollama_num_keep = int(os.getenv("OLLAMA_NUM_KEEP", "0"))  # 0 = estimate from the instruction
+
+# Constrained decoding: "schema" sends the output schema as Ollama's format,
+# which compiles it to a grammar, so every answer parses and validates and
+# generation ends at the closing bracket; "json" only guarantees JSON
+# syntax; "none" relies on the instruction alone
+agent_output_format = os.getenv("AGENT_OUTPUT_FORMAT", "schema")
+
+# Model calls are spread over OLLAMA_API_BASES (default: OLLAMA_API_BASE);
+# imported after load_dotenv since it reads its settings at import
+import model_router
+
+router = model_router.ModelRouter.from_env(api_base)
+
+
+def configure_google_cloud() -> None:
+    """Default GOOGLE_CLOUD_PROJECT to the project of the ambient credentials
+
+    Called from the server's startup warm-up rather than at import: without
+    credentials, google.auth probes the metadata server for seconds.
+    """
+    if os.getenv("GOOGLE_CLOUD_PROJECT"):
+        return
+    import google.auth
+
+    try:
+        _, project_id = google.auth.default()
+    except Exception:
+        return
+    if project_id:
+        os.environ.setdefault("GOOGLE_CLOUD_PROJECT", project_id)
+
+
+class AnalysisOutput(BaseModel):
+    """One analysis as the model writes it (the backend's ModelAnalysis)"""
+    model_config = ConfigDict(extra="forbid")
+
+    sentiment: Literal["positive", "neutral", "negative"]
+    category: Literal["delivery", "product", "service", "payment", "technical"]
+    priority: int = Field(..., ge=1, le=5)
+    keywords: List[str] = Field(..., max_length=8)
+    root_cause: str
+    recommendation: str
+    summary: str
+
+
+ANALYSIS_SCHEMA = AnalysisOutput.model_json_schema()
+
+BATCH_SCHEMA = {
+    "type": "array",
+    "items": {
+        **ANALYSIS_SCHEMA,
+        "properties": {"index": {"type": "integer", "minimum": 0}, **ANALYSIS_SCHEMA["properties"]},
+        "required": ["index", *ANALYSIS_SCHEMA["required"]],
+    },
+}
+
+
+def response_format(name: str, schema: Dict, output_format: str = agent_output_format) -> Optional[Dict]:
+    """LiteLLM response_format for AGENT_OUTPUT_FORMAT; ollama_chat sends it as Ollama's format"""
+    if output_format == "schema":
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": schema}}
+    if output_format == "json":
+        return {"type": "json_object"}
+    if output_format != "none":
+        raise ValueError(f"Unknown AGENT_OUTPUT_FORMAT: {output_format}")
+    return None
+
+
+def _ollama_model(instruction: str, lane: str = "interactive", output: Optional[Dict] = None) -> LiteLlm:
+    """Gemma via Ollama, keeping the model loaded and the instruction tokens pinned
+
+    Each call goes to a replica picked by ``router``; "bulk" lane calls
+    prefer the bulk pool. ``output`` is the response_format constraining
+    the answer, if any.
+    """
+    return LiteLlm(
+        model=f"ollama_chat/{gemma_model_name}",
+        api_base=api_base,
+        llm_client=model_router.RoutedLiteLLMClient(router, lane),
+        **({"keep_alive": ollama_keep_alive} if ollama_keep_alive else {}),
+        # Tokens kept from the start of the context on a context shift;
+        # roughly 3 characters per Gemma token
+        num_keep=ollama_num_keep or len(instruction) // 3,
+        **({"response_format": output} if output else {}),
+    )
+
+
+def _fixed_instruction(text: str):
+    """Instruction provider returning ``text`` verbatim
+
+    A plain string instruction goes through ADK's {state} templating, which
+    scans the JSON braces in the examples on every call; a provider is sent
+    as is, keeping the prompt prefix stable.
+    """
+    def provider(context) -> str:
+        return text
+    return provider
+
 # TanggapAgent - Customer Feedback Analyzer & Root Cause Intelligence
 TANGGAP_INSTRUCTION = """You are TanggapAgent - an AI that analyzes customer feedback.
 
@@ -90,15 +194,113 @@ Now analyze this feedback:"""
 
 # TanggapAgent - Production Feedback Analysis Agent
 tanggap_agent = Agent(
-    model=LiteLlm(
-        model=f"ollama_chat/{gemma_model_name}",
-        api_base=api_base
-    ),
+    model=_ollama_model(TANGGAP_INSTRUCTION, output=response_format("analysis", ANALYSIS_SCHEMA)),
     name="tanggap_agent",
     description="TanggapAgent - Enterprise Customer Feedback Analyzer and Root Cause Intelligence system.",
-    instruction=TANGGAP_INSTRUCTION,
+    instruction=_fixed_instruction(TANGGAP_INSTRUCTION),
     tools=[],  # No tools - just return JSON analysis
+    include_contents="none",  # Single-turn: ignore earlier turns when sessions are reused
+    before_model_callback=metrics.before_model,  # model latency and tokens for /metrics
+    after_model_callback=metrics.after_model,
+)
+
+# Batched mode: K feedback items per prompt, so the instruction and
+# examples are paid for once per batch instead of once per item
+TANGGAP_BATCH_INSTRUCTION = """You are TanggapAgent - an AI that analyzes customer feedback in batches.
+
+YOUR TASK:
+You receive several feedback items, one per line, each prefixed with its index in square brackets and given as a JSON string.
+Analyze EVERY item independently and return ONLY a JSON array (no markdown, no explanations) with one object per item:
+
+[
+  {
+    "index": 0,
+    "sentiment": "positive" | "neutral" | "negative",
+    "category": "delivery" | "product" | "service" | "payment" | "technical",
+    "priority": 1-5 (integer: 1=low, 5=critical),
+    "keywords": ["keyword1", "keyword2", ...],
+    "root_cause": "explanation of what caused this issue",
+    "recommendation": "actionable solution to address the issue",
+    "summary": "one-sentence description of the feedback"
+  },
+  ...
+]
+
+IMPORTANT:
+- Return ONLY the JSON array, nothing else
+- No markdown code blocks (no ```json)
+- Exactly one object per input item, with "index" equal to the item's index
+- All fields are required
+
+EXAMPLE:
+
+Feedback items:
+[0] "Delivery saya telat 3 hari"
+[1] "Product quality is excellent"
+[
+  {
+    "index": 0,
+    "sentiment": "negative",
+    "category": "delivery",
+    "priority": 4,
+    "keywords": ["delivery", "late", "3 days"],
+    "root_cause": "Shipping delay",
+    "recommendation": "Improve logistics tracking",
+    "summary": "Delivery delayed by 3 days."
+  },
+  {
+    "index": 1,
+    "sentiment": "positive",
+    "category": "product",
+    "priority": 1,
+    "keywords": ["product", "quality", "excellent"],
+    "root_cause": "Good manufacturing standards",
+    "recommendation": "Maintain current quality",
+    "summary": "Customer satisfied with product quality."
+  }
+]
+
+Now analyze these feedback items:"""
+
+tanggap_batch_agent = Agent(
+    model=_ollama_model(TANGGAP_BATCH_INSTRUCTION, lane="bulk", output=response_format("analyses", BATCH_SCHEMA)),
+    name="tanggap_batch_agent",
+    description="TanggapAgent batch mode - analyzes several feedback items per call.",
+    instruction=_fixed_instruction(TANGGAP_BATCH_INSTRUCTION),
+    tools=[],
+    include_contents="none",
+    before_model_callback=metrics.before_model,
+    after_model_callback=metrics.after_model,
 )
 
 # Set as root agent
-root_agent = tanggap_agent
\ No newline at end of file
+root_agent = tanggap_agent
+
+
+async def warm_up() -> None:
+    """Load the model on every Ollama replica and prefill both instruction prefixes
+
+    Sends each instruction through LiteLLM the way the agents do, asking
+    for a single token, so the first analysis skips the model load and
+    the instruction prefill. A replica that fails is skipped; its circuit
+    breaker deals with it once real traffic arrives.
+    """
+    import litellm
+
+    async def warm(replica: model_router.Replica) -> None:
+        for instruction in (TANGGAP_INSTRUCTION, TANGGAP_BATCH_INSTRUCTION):
+            await litellm.acompletion(
+                model=f"ollama_chat/{gemma_model_name}",
+                api_base=replica.url,
+                messages=[{"role": "system", "content": instruction}, {"role": "user", "content": "ping"}],
+                max_tokens=1,
+                **({"keep_alive": ollama_keep_alive} if ollama_keep_alive else {}),
+                num_keep=ollama_num_keep or len(instruction) // 3,
+            )
+
+    results = await asyncio.gather(*(warm(replica) for replica in router.replicas), return_exceptions=True)
+    for replica, result in zip(router.replicas, results):
+        if isinstance(result, Exception):
+            print(f"⚠️ Could not warm model replica {replica.url}: {result!r}")
+    if all(isinstance(result, Exception) for result in results):
+        raise results[0]
@@ -0,0 +1,8 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+
+# Served as its own ADK app so the backend can target it with app_name
+from tanggap_agent.agent import tanggap_batch_agent as root_agent
+
+__all__ = ["root_agent"]
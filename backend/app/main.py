@@ -3,19 +3,79 @@
 Simplified backend that delegates to ADK Agent.
 Agent autonomously handles analysis + BigQuery storage via tool functions.
 """
-import uuid
+import asyncio
+import json
+import os
+import sys
+from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.models import FeedbackInput, FeedbackAnalysis
-from app.services.agent_client import analyze_feedback
+from app.models import (
+    FeedbackInput,
+    FeedbackAnalysis,
+    BatchFeedbackInput,
+    BatchItemResult,
+    BatchAnalysisResponse,
+    JobInfo,
+)
+from app.services import agent_client, metrics
+from app.services.analysis_cache import ANALYSIS_CACHE_ENABLED, analysis_cache
+from app.services.semantic_cache import semantic_cache
+from app.services.root_causes import root_cause_clusters
+from app.services.analysis import run_analysis, to_bq_row
+from app.services.bq_writer import bq_writer
+from app.services.stats import stats_aggregator
+from app.services.jobs import FINISHED_STATUSES, QueueFullError, job_queue
+from app.services.ingest import DuplexStreamingResponse, run_ingest
+from app.services.limiter import AgentOverloadedError
+from app.services.preclassifier import preclassifier
+from app.services.sse_parser import parse_stats
+from app.services.warmup import startup_steps, startup_warmup
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+def on_rows_written(rows: list) -> None:
+    """Drop cached /api/query results once new rows land in BigQuery"""
+    from app.services.bq_client import invalidate_query_cache
+    invalidate_query_cache()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background workers and the warm-up on startup, release clients on shutdown"""
+    await agent_client.start_client()
+    bq_writer.add_listener(on_rows_written)
+    bq_writer.add_listener(stats_aggregator.record)
+    await bq_writer.start()
+    await stats_aggregator.start()
+    await job_queue.start()
+    await startup_warmup.start(startup_steps())
+    if root_cause_clusters is not None:
+        await root_cause_clusters.start()
+    yield
+    await startup_warmup.stop()
+    if root_cause_clusters is not None:
+        await root_cause_clusters.stop()
+    await job_queue.stop()
+    await bq_writer.stop()
+    await stats_aggregator.stop()
+    await agent_client.close_client()
+    if "app.services.bq_client" in sys.modules:  # only loaded once BigQuery was used
+        sys.modules["app.services.bq_client"].close_client()
+    analysis_cache.close()
+    if semantic_cache is not None:
+        semantic_cache.close()
 
 # Create FastAPI app
 app = FastAPI(
     title="TanggapAI API",
     description="Customer Feedback Analyzer and Root Cause Intelligence API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -25,7 +85,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "Server-Timing"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Counters behind the JSON stats endpoints, exported on /metrics
+metrics.register_stats("cache", analysis_cache.stats)
+if semantic_cache is not None:
+    metrics.register_stats("semantic_cache", semantic_cache.stats)
+metrics.register_stats("singleflight", agent_client.singleflight_stats)
+metrics.register_stats("micro_batch", agent_client.batch_stats)
+metrics.register_stats("limiter", lambda: agent_client._limiter.stats())
+metrics.register_stats("preclassifier", preclassifier.stats)
+metrics.register_stats("tokens", agent_client.token_stats)
+metrics.register_stats("parse", lambda: dict(parse_stats))
+metrics.register_stats("writer", bq_writer.stats)
+metrics.register_stats("jobs", job_queue.stats)
+metrics.register_stats("warmup", startup_warmup.status)
 
 @app.get("/")
 def root():
@@ -35,8 +111,21 @@ def root():
         "version": "1.0.0",
         "endpoints": {
             "analyze": "POST /api/analyze",
+            "analyze_batch": "POST /api/analyze/batch",
+            "ingest": "POST /api/ingest",
+            "jobs": "POST /api/jobs",
+            "job_status": "GET /api/jobs/{id}",
+            "job_events": "GET /api/jobs/{id}/events",
             "query": "GET /api/query",
-            "health": "GET /health"
+            "stats": "GET /api/stats",
+            "root_causes": "GET /api/root-causes",
+            "cache_stats": "GET /api/cache/stats",
+            "agent_stats": "GET /api/agent/stats",
+            "writer_stats": "GET /api/writer/stats",
+            "metrics": "GET /metrics",
+            "health": "GET /health",
+            "liveness": "GET /health/live",
+            "readiness": "GET /health/ready"
         }
     }
 
@@ -45,6 +134,25 @@ def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "tanggap-ai-backend"}
 
+@app.get("/health/live")
+def liveness_check():
+    """Liveness: the process is up and serving, whether or not the warm-up has finished"""
+    return {"status": "alive", "service": "tanggap-ai-backend"}
+
+@app.get("/health/ready")
+def readiness_check():
+    """Readiness: 503 until the startup warm-up has finished, then its per-step results"""
+    status = startup_warmup.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus metrics: per-stage and HTTP latency histograms, counters and exported stats"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
 @app.post("/api/analyze", response_model=FeedbackAnalysis)
 async def analyze_feedback_endpoint(input_data: FeedbackInput):
     """
@@ -76,76 +184,274 @@ async def analyze_feedback_endpoint(input_data: FeedbackInput):
         "created_at": "2025-11-30T10:00:00Z"
     }
     
+    Returns 503 with Retry-After when the model is saturated.
     """
     try:
-        from app.services.bq_client import insert_feedback_analysis
+        feedback_analysis = await run_analysis(input_data.feedback)
         
-        # Generate unique ID and timestamp
-        analysis_id = str(uuid.uuid4())
-        created_at = datetime.utcnow()
-        created_at_iso = created_at.isoformat() + "Z"
-        
-        # Call ADK Agent for analysis (returns JSON only, no tools)
-        analysis = await analyze_feedback(
-            feedback_text=input_data.feedback,
-            record_id=analysis_id,
-            created_at=created_at_iso
-        )
-        
-        # Backend stores to BigQuery
-        bq_result = insert_feedback_analysis(
-            record_id=analysis_id,
-            feedback_text=input_data.feedback,
-            sentiment=analysis["sentiment"],
-            category=analysis["category"],
-            priority=analysis["priority"],
-            keywords=analysis["keywords"],
-            root_cause=analysis["root_cause"],
-            recommendation=analysis["recommendation"],
-            summary=analysis["summary"],
-            created_at=created_at_iso
-        )
-        
-        if not bq_result.get("success"):
-            print(f"⚠️ BigQuery insert failed: {bq_result.get('error')}")
-        
-        # Create full analysis object for response
-        feedback_analysis = FeedbackAnalysis(
-            id=analysis_id,
-            feedback_text=input_data.feedback,
-            sentiment=analysis["sentiment"],
-            category=analysis["category"],
-            priority_score=analysis["priority"],
-            keywords=analysis["keywords"],
-            root_cause=analysis["root_cause"],
-            recommendation=analysis["recommendation"],
-            summary=analysis["summary"],
-            created_at=created_at
-        )
+        # Queue the row for the background BigQuery writer
+        await bq_writer.submit([to_bq_row(feedback_analysis)])
         
         return feedback_analysis
         
+    except AgentOverloadedError as e:
+        return JSONResponse(status_code=503, content={"detail": str(e)}, headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+@app.post("/api/analyze/batch", response_model=BatchAnalysisResponse)
+async def analyze_feedback_batch_endpoint(input_data: BatchFeedbackInput):
+    """
+    Analyze many feedback items and queue them for BigQuery together
+    
+    Items are analyzed concurrently (at most BATCH_CONCURRENCY agent calls
+    at a time). Results are returned in input order; a failed item is
+    reported in its slot and does not fail the batch.
+    
+    Example Input:
+    {
+        "items": [
+            {"feedback": "Delivery was 3 days late"},
+            {"feedback": "Great product quality"}
+        ]
+    }
+    """
+    if len(input_data.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(input_data.items)} items (max {BATCH_MAX_ITEMS})"
+        )
+    
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def run_item(index: int, item: FeedbackInput) -> BatchItemResult:
+        async with semaphore:
+            try:
+                analysis = await run_analysis(item.feedback, lane="bulk")
+                return BatchItemResult(index=index, success=True, analysis=analysis)
+            except Exception as e:
+                return BatchItemResult(index=index, success=False, error=str(e))
+    
+    results = await asyncio.gather(
+        *(run_item(index, item) for index, item in enumerate(input_data.items))
+    )
+    
+    rows = [to_bq_row(result.analysis) for result in results if result.success]
+    await bq_writer.submit(rows)
+    
+    succeeded = len(rows)
+    return BatchAnalysisResponse(
+        total=len(results),
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        queued=len(rows),
+        results=results
+    )
+
+@app.post("/api/ingest")
+async def ingest_feedback_endpoint(request: Request, format: Optional[str] = None):
+    """
+    Stream a large NDJSON or CSV feedback export through analysis and storage
+    
+    The body is read incrementally and results are streamed back per row
+    while the upload is still in progress (NDJSON, or SSE when the client
+    sends Accept: text/event-stream). The last message is a summary with
+    "done": true.
+    
+    Parameters:
+    - format: ndjson or csv (default: from Content-Type, else ndjson)
+    
+    Input records:
+    - NDJSON: {"feedback": "..."} per line (or a bare JSON string)
+    - CSV: header row with a "feedback" column (first column otherwise)
+    
+    Example:
+    - curl -T feedback.ndjson -H "Content-Type: application/x-ndjson" $BACKEND_URL/api/ingest
+    """
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}")
+    
+    use_sse = "text/event-stream" in request.headers.get("accept", "")
+    
+    async def results(body):
+        async for result in run_ingest(body, fmt):
+            line = json.dumps(result)
+            yield f"data: {line}\n\n" if use_sse else f"{line}\n"
+    
+    return DuplexStreamingResponse(
+        results,
+        media_type="text/event-stream" if use_sse else "application/x-ndjson"
+    )
+
+@app.post("/api/jobs", status_code=202)
+async def create_job_endpoint(input_data: FeedbackInput, request: Request):
+    """
+    Queue feedback for analysis and return immediately with a job id
+    
+    Poll GET /api/jobs/{id} or subscribe to GET /api/jobs/{id}/events (SSE)
+    for the result. Returns 503 when the job queue is full. Jobs run in the
+    interactive lane unless the request sends X-Priority: bulk.
+    """
+    lane = "bulk" if request.headers.get("x-priority", "").lower() == "bulk" else "interactive"
+    try:
+        job = job_queue.submit(input_data.feedback, lane)
+    except QueueFullError as e:
+        return JSONResponse(status_code=503, content={"detail": str(e)}, headers={"Retry-After": "5"})
+    
+    return {
+        **job,
+        "status_url": f"/api/jobs/{job['id']}",
+        "events_url": f"/api/jobs/{job['id']}/events"
+    }
+
+@app.get("/api/jobs/{job_id}", response_model=JobInfo)
+def get_job_endpoint(job_id: str):
+    """Current state of an analysis job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events_endpoint(job_id: str):
+    """
+    Server-sent events for a job: a "status" event now, then a "result"
+    event (status done or failed) when it finishes, after which the stream closes
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def events():
+        current = job
+        yield f"event: status\ndata: {json.dumps(current)}\n\n"
+        while current["status"] not in FINISHED_STATUSES:
+            current = await job_queue.wait(job_id, timeout=15)
+            if current is None:
+                return
+            if current["status"] not in FINISHED_STATUSES:
+                yield ": keep-alive\n\n"
+        yield f"event: result\ndata: {json.dumps(current)}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/cache/stats")
+def cache_stats():
+    """Exact and semantic cache hit/miss counters, request coalescing and micro-batching counters"""
+    return {
+        "enabled": ANALYSIS_CACHE_ENABLED,
+        **analysis_cache.stats(),
+        "semantic": semantic_cache.stats() if semantic_cache is not None else {"enabled": False},
+        "singleflight": agent_client.singleflight_stats(),
+        "micro_batch": agent_client.batch_stats()
+    }
+
+@app.get("/api/agent/stats")
+def agent_stats(recent: int = Query(20, ge=0, le=1000)):
+    """Model token counts, time to first token and the latest per-request timings"""
+    return agent_client.agent_stats(recent)
+
+@app.get("/api/writer/stats")
+def writer_stats():
+    """Background BigQuery writer counters"""
+    return bq_writer.stats()
+
+@app.get("/api/stats")
+def feedback_stats(window_hours: int = 24, bucket_hours: int = 1, top_keywords: int = 10):
+    """
+    Feedback rollups served from memory (no BigQuery job per request)
+    
+    Parameters:
+    - window_hours: How far back to look (default: 24, max: STATS_RETENTION_HOURS)
+    - bucket_hours: Width of each time bucket (default: 1)
+    - top_keywords: Number of top keywords over the window (default: 10, max: 100)
+    
+    Returns counts by sentiment x category x priority_score per bucket,
+    overall totals, and top keywords over the window.
+    """
+    from app.services.stats import STATS_RETENTION_HOURS
+    
+    window_hours = max(1, min(window_hours, STATS_RETENTION_HOURS))
+    bucket_hours = max(1, min(bucket_hours, window_hours))
+    return stats_aggregator.summary(
+        window_hours=window_hours,
+        bucket_hours=bucket_hours,
+        top_keywords=max(0, min(top_keywords, 100))
+    )
+
+@app.get("/api/root-causes")
+def root_causes(
+    limit: int = Query(20, ge=1, le=500),
+    sentiment: Optional[str] = None,
+    category: Optional[str] = None,
+    min_count: int = Query(1, ge=1)
+):
+    """
+    Recurring root causes, largest group first
+    
+    Parameters:
+    - limit: Number of groups to return (default: 20, max: 500)
+    - sentiment: Only groups containing this sentiment
+    - category: Only groups containing this category
+    - min_count: Skip groups with fewer rows (default: 1)
+    
+    Groups are updated incrementally from BigQuery every
+    ROOT_CAUSE_REFRESH_SECONDS; each has a label (its most common
+    root_cause), row count and share, sentiment/category breakdown,
+    top keywords, average priority and first/last seen timestamps.
+    """
+    if root_cause_clusters is None:
+        raise HTTPException(status_code=503, detail="Root-cause clustering is disabled")
+    return root_cause_clusters.groups(limit=limit, sentiment=sentiment, category=category, min_count=min_count)
+
 @app.get("/api/query")
-async def query_feedbacks(limit: int = 10, sentiment: str = None, category: str = None):
+async def query_feedbacks(
+    limit: int = Query(10, ge=1, le=100),
+    sentiment: str = None,
+    category: str = None,
+    fields: str = None,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    cursor: Optional[str] = None
+):
     """
-    Query feedback analysis from BigQuery
+    Query feedback analysis from BigQuery, newest first
     
     Parameters:
     - limit: Number of records to return (default: 10, max: 100)
     - sentiment: Filter by sentiment (positive, neutral, negative)
     - category: Filter by category (delivery, product, service, payment, technical)
+    - fields: Comma-separated columns to return (default: all)
+    - from / to: ISO 8601 time range on created_at (from inclusive, to exclusive)
+    - cursor: next_cursor from the previous page
     
     Examples:
     - GET /api/query?limit=5
     - GET /api/query?sentiment=negative&limit=20
     - GET /api/query?category=technical
+    - GET /api/query?fields=created_at,feedback_text,sentiment
+    - GET /api/query?from=2025-11-01T00:00:00Z&to=2025-12-01T00:00:00Z
     """
+    from app.services.bq_client import QUERY_COLUMNS, decode_cursor, query_feedback
+    
+    columns = QUERY_COLUMNS
+    if fields:
+        columns = tuple(field.strip() for field in fields.split(",") if field.strip())
+        unknown = [column for column in columns if column not in QUERY_COLUMNS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {unknown}")
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
     try:
-        from app.services.bq_client import query_feedback
-        
         # Build filters
         filters = {}
         if sentiment:
@@ -153,8 +459,16 @@ async def query_feedbacks(limit: int = 10, sentiment: str = None, category: str
         if category:
             filters["category"] = category
         
-        # Query BigQuery
-        result = query_feedback(limit=min(limit, 100), filters=filters)
+        # Query BigQuery off the event loop
+        result = await asyncio.to_thread(
+            query_feedback,
+            limit=limit,
+            filters=filters,
+            columns=columns,
+            start=from_,
+            end=to,
+            cursor=cursor
+        )
         
         if not result.get("success"):
             raise HTTPException(status_code=500, detail=result.get("error"))
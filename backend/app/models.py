@@ -1,17 +1,37 @@
-from pydantic import BaseModel, Field
-from typing import List
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Literal, Optional
 from datetime import datetime
 
+Sentiment = Literal["positive", "neutral", "negative"]
+Category = Literal["delivery", "product", "service", "payment", "technical"]
+MAX_KEYWORDS = 8
+
 class FeedbackInput(BaseModel):
     """Input model for feedback analysis request"""
     feedback: str = Field(..., min_length=1, max_length=5000, description="Customer feedback text")
 
+class ModelAnalysis(BaseModel):
+    """Analysis fields as the model writes them; their JSON schema constrains decoding
+
+    The schema is strict. Unconstrained answers get extra keys dropped and
+    keywords truncated before they are checked (agent_client.validate_analysis).
+    """
+    model_config = ConfigDict(extra="forbid")
+
+    sentiment: Sentiment
+    category: Category
+    priority: int = Field(..., ge=1, le=5)
+    keywords: List[str] = Field(..., max_length=MAX_KEYWORDS)
+    root_cause: str
+    recommendation: str
+    summary: str
+
 class FeedbackAnalysis(BaseModel):
     """Complete feedback analysis with metadata for storage"""
     id: str = Field(..., description="Unique ID")
     feedback_text: str = Field(..., description="Original feedback")
-    sentiment: str = Field(..., description="positive, neutral, or negative")
-    category: str = Field(..., description="delivery, product, service, payment, technical")
+    sentiment: Sentiment = Field(..., description="positive, neutral, or negative")
+    category: Category = Field(..., description="delivery, product, service, payment, technical")
     priority_score: int = Field(..., ge=1, le=5, description="Priority score 1-5")
     keywords: List[str] = Field(default_factory=list, description="Extracted keywords")
     root_cause: str = Field(..., description="Root cause analysis")
@@ -34,4 +54,31 @@ class FeedbackAnalysis(BaseModel):
                 "summary": "Performance issues during high traffic.",
                 "created_at": "2025-11-30T10:00:00"
             }
-        }
\ No newline at end of file
+        }
+
+class BatchFeedbackInput(BaseModel):
+    """Input model for batch feedback analysis request"""
+    items: List[FeedbackInput] = Field(..., min_length=1, description="Feedback items to analyze")
+
+class BatchItemResult(BaseModel):
+    """Outcome of one item in a batch, in input order"""
+    index: int = Field(..., description="Position of the item in the request")
+    success: bool = Field(..., description="Whether the item was analyzed")
+    analysis: Optional[FeedbackAnalysis] = Field(None, description="Analysis when successful")
+    error: Optional[str] = Field(None, description="Error message when the item failed")
+
+class BatchAnalysisResponse(BaseModel):
+    """Batch analysis results"""
+    total: int = Field(..., description="Number of items received")
+    succeeded: int = Field(..., description="Number of items analyzed")
+    failed: int = Field(..., description="Number of items that failed")
+    queued: int = Field(..., description="Successful analyses queued for the background BigQuery writer")
+    results: List[BatchItemResult] = Field(default_factory=list, description="Per-item results in input order")
+
+class JobInfo(BaseModel):
+    """State of an asynchronous analysis job"""
+    id: str = Field(..., description="Job ID")
+    status: str = Field(..., description="queued, running, done, or failed")
+    created_at: datetime = Field(..., description="When the job was accepted")
+    result: Optional[FeedbackAnalysis] = Field(None, description="Analysis once the job is done")
+    error: Optional[str] = Field(None, description="Error message if the job failed")
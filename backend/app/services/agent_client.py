@@ -1,15 +1,201 @@
-"""Client for calling ADK Agent API"""
+"""Client for calling ADK Agent API (or Ollama directly, see ollama_engine)"""
+import asyncio
+import contextvars
 import os
 import httpx
 import json
 import re
-from typing import Dict
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from pydantic import ValidationError
+
+from app.models import MAX_KEYWORDS, ModelAnalysis
+from app.services import metrics, ollama_engine
+from app.services.analysis_cache import ANALYSIS_CACHE_ENABLED, analysis_cache
+from app.services.limiter import AGENT_LIMITER_ENABLED, AdaptiveLimiter
+from app.services.micro_batcher import MicroBatcher
+from app.services.preclassifier import PRECLASSIFIER_ENABLED, preclassifier
+from app.services.semantic_cache import semantic_cache
+from app.services.sse_parser import AgentStreamParser, BatchStreamParser, parse_stats
 
 AGENT_URL = os.getenv("AGENT_URL", "https://tanggap-ai-adk-agent-gatfv4h2ua-ew.a.run.app")
 AGENT_TIMEOUT = 60  # seconds
 
+# "adk" runs analyses through the agent's /run_sse; "ollama" calls Ollama's
+# /api/chat directly with the same instruction (see ollama_engine)
+AGENT_ENGINE = os.getenv("AGENT_ENGINE", "adk")
+
+# Until the engine's fingerprint has been fetched, requests retry the fetch
+# at most this often (seconds)
+ENGINE_INFO_RETRY_SECONDS = float(os.getenv("ENGINE_INFO_RETRY_SECONDS", "10"))
+
+APP_NAME = "tanggap_agent"
+BATCH_APP_NAME = "tanggap_batch_agent"
+USER_ID = "default_user"
+
+# Connection pool tuning. Cloud Run's front end keeps idle connections for
+# several minutes, so a long keep-alive lets steady traffic skip the TLS handshake.
+AGENT_HTTP2 = os.getenv("AGENT_HTTP2", "true").lower() == "true"
+AGENT_MAX_CONNECTIONS = int(os.getenv("AGENT_MAX_CONNECTIONS", "100"))
+AGENT_MAX_KEEPALIVE = int(os.getenv("AGENT_MAX_KEEPALIVE", "20"))
+AGENT_KEEPALIVE_EXPIRY = float(os.getenv("AGENT_KEEPALIVE_EXPIRY", "300"))  # seconds
+
+# Session handling: "pool" recycles agent sessions across requests,
+# "per_request" creates (and afterwards deletes) a session for every
+# analysis, "stateless" uses the agent's /run_stateless and no session at all.
+AGENT_SESSION_MODE = os.getenv("AGENT_SESSION_MODE", "pool")
+AGENT_SESSION_POOL_SIZE = int(os.getenv("AGENT_SESSION_POOL_SIZE", "16"))
+AGENT_SESSION_MAX_USES = int(os.getenv("AGENT_SESSION_MAX_USES", "50"))
+AGENT_WARM_SESSIONS = int(os.getenv("AGENT_WARM_SESSIONS", "4"))  # pooled sessions created at startup
+
+# Ask ADK for token-level partial events so parsing can finish early
+AGENT_STREAMING = os.getenv("AGENT_STREAMING", "true").lower() == "true"
+
+# Coalesce concurrent requests for the same normalized feedback into one agent call
+AGENT_SINGLEFLIGHT = os.getenv("AGENT_SINGLEFLIGHT", "true").lower() == "true"
+
+# Micro-batching: pack up to AGENT_BATCH_SIZE concurrent items into one prompt
+# for the batch agent, waiting at most AGENT_BATCH_WINDOW_MS. 1 disables it.
+AGENT_BATCH_SIZE = int(os.getenv("AGENT_BATCH_SIZE", "1"))
+AGENT_BATCH_WINDOW_MS = float(os.getenv("AGENT_BATCH_WINDOW_MS", "20"))
+
+_client: Optional[httpx.AsyncClient] = None
+
+_inflight: Dict[str, asyncio.Task] = {}
+_engine_info: Optional[Dict] = None
+_engine_info_lock = asyncio.Lock()
+_engine_info_tried = 0.0  # monotonic time of the last fetch
+_engine_info_task: Optional[asyncio.Task] = None
+_singleflight_stats = {"agent_calls": 0, "coalesced": 0}
+_token_stats = {"runs": 0, "prompt_tokens": 0, "output_tokens": 0}
+_recent_runs: deque = deque(maxlen=1000)  # per-request token counts and timings
+
+# Lane of the analysis being run; bulk runs are marked so the agent can
+# send them to its bulk model replicas
+_lane: contextvars.ContextVar[str] = contextvars.ContextVar("lane", default="interactive")
+
+
+def _build_client() -> httpx.AsyncClient:
+    http2 = AGENT_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("⚠️ h2 not installed, falling back to HTTP/1.1 for agent calls")
+            http2 = False
+
+    return httpx.AsyncClient(
+        timeout=AGENT_TIMEOUT,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=AGENT_MAX_CONNECTIONS,
+            max_keepalive_connections=AGENT_MAX_KEEPALIVE,
+            keepalive_expiry=AGENT_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+async def start_client() -> None:
+    """Open the shared agent HTTP client (called from the app lifespan)"""
+    global _client
+    if _client is None:
+        _client = _build_client()
+
+
+async def close_client() -> None:
+    """Close the shared agent HTTP client and forget pooled sessions"""
+    global _client
+    await _micro_batcher.drain()
+    await _session_pool.drain()
+    await _batch_session_pool.drain()
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _session_pool.clear()
+    _batch_session_pool.clear()
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily outside the app lifespan"""
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
+
+class SessionPool:
+    """Pool of reusable ADK sessions
+
+    Each session is handed out to one request at a time and retired after
+    AGENT_SESSION_MAX_USES runs so the agent's session store stays small.
+    """
+
+    def __init__(self, size: int, max_uses: int, app_name: str = APP_NAME):
+        self.size = size
+        self.max_uses = max_uses
+        self.app_name = app_name
+        self._idle: list = []  # [(session_id, uses)]
+        self._cleanup_tasks: set = set()
+
+    def clear(self) -> None:
+        self._idle.clear()
+
+    async def drain(self) -> None:
+        """Wait for pending session deletes, before the client is closed"""
+        if self._cleanup_tasks:
+            await asyncio.gather(*self._cleanup_tasks, return_exceptions=True)
+
+    async def acquire(self, client: httpx.AsyncClient) -> tuple:
+        if self._idle:
+            return self._idle.pop()
+        return await create_session(client, self.app_name), 0
+
+    def release(self, client: httpx.AsyncClient, session_id: str, uses: int, reusable: bool = True) -> None:
+        if reusable and uses < self.max_uses and len(self._idle) < self.size:
+            self._idle.append((session_id, uses))
+        else:
+            task = asyncio.create_task(delete_session(client, session_id, self.app_name))
+            self._cleanup_tasks.add(task)
+            task.add_done_callback(self._cleanup_tasks.discard)
+
+
+_session_pool = SessionPool(AGENT_SESSION_POOL_SIZE, AGENT_SESSION_MAX_USES)
+_batch_session_pool = SessionPool(AGENT_SESSION_POOL_SIZE, AGENT_SESSION_MAX_USES, BATCH_APP_NAME)
+
+
+async def create_session(client: httpx.AsyncClient, app_name: str = APP_NAME) -> str:
+    """Create a new agent session and return its id"""
+    with metrics.stage("session_create"):
+        session_response = await client.post(
+            f"{AGENT_URL}/apps/{app_name}/users/{USER_ID}/sessions",
+            json={},
+            headers=metrics.trace_headers()
+        )
+    session_response.raise_for_status()
+    session_data = session_response.json()
+    return session_data.get("id") or session_data.get("session_id")
+
+
+async def delete_session(client: httpx.AsyncClient, session_id: str, app_name: str = APP_NAME) -> None:
+    """Best-effort removal of a retired session from the agent"""
+    try:
+        await client.delete(
+            f"{AGENT_URL}/apps/{app_name}/users/{USER_ID}/sessions/{session_id}",
+            headers=metrics.trace_headers()
+        )
+    except (httpx.HTTPError, RuntimeError) as e:
+        print(f"⚠️ Failed to delete agent session {session_id}: {e}")
+
+
 def extract_json_from_text(text: str) -> Dict:
     """Extract JSON from response text that might have markdown formatting"""
+    with metrics.stage("json_extract"):
+        return _extract_json(text)
+
+
+def _extract_json(text: str) -> Dict:
     # Try to find JSON in code blocks
     json_match = re.search(r'```(?:json)?\s*(\{[\s\S]*?\})\s*```', text)
     if json_match:
@@ -28,125 +214,458 @@ def extract_json_from_text(text: str) -> Dict:
     
     raise ValueError(f"Could not extract valid JSON from response: {text[:200]}")
 
-async def analyze_feedback(feedback_text: str, record_id: str, created_at: str) -> Dict:
+async def fetch_agent_info() -> Optional[Dict]:
+    """Fetch the agent's model name and instruction hash, or None if unavailable"""
+    try:
+        response = await get_client().get(f"{AGENT_URL}/agent-info", timeout=10)
+        response.raise_for_status()
+        return response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"⚠️ Could not fetch agent info: {e}")
+        return None
+
+
+def token_stats() -> Dict:
+    """Token counts reported by the model, summed over runs"""
+    return dict(_token_stats)
+
+
+def agent_stats(recent: int = 20) -> Dict:
+    """Concurrency limit, pre-classifier offload, token totals, TTFT/latency percentiles and the latest per-request timings"""
+    runs = list(_recent_runs)
+    ttft = sorted(r["ttft_ms"] for r in runs if r["ttft_ms"] is not None)
+    total = sorted(r["total_ms"] for r in runs)
+    return {
+        "engine": AGENT_ENGINE,
+        "limiter": _limiter.stats(),
+        "preclassifier": preclassifier.stats(),
+        **_token_stats,
+        "ttft_ms": {"p50": _percentile(ttft, 50), "p95": _percentile(ttft, 95)},
+        "total_ms": {"p50": _percentile(total, 50), "p95": _percentile(total, 95)},
+        "recent": runs[-recent:] if recent else [],
+    }
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * pct / 100))], 2)
+
+
+def _record_run(run: Dict) -> None:
+    if run["ttft_ms"] is not None:
+        metrics.observe("agent_first_token", run["ttft_ms"] / 1000)
+        metrics.observe("agent_generate", (run["total_ms"] - run["ttft_ms"]) / 1000)
+    run = {**run, "trace_id": metrics.trace_id()}
+    _token_stats["runs"] += 1
+    _token_stats["prompt_tokens"] += run["prompt_tokens"]
+    _token_stats["output_tokens"] += run["output_tokens"]
+    _recent_runs.append({
+        key: round(value, 2) if isinstance(value, float) else value
+        for key, value in run.items()
+    })
+
+
+async def warm_up() -> None:
+    """Open connections ahead of the first request
+    
+    The Ollama engine loads the model and primes its prompt prefixes. The
+    ADK engine connects to the agent and, in pool mode, fills the session
+    pool with AGENT_WARM_SESSIONS sessions.
+    """
+    client = get_client()
+    if AGENT_ENGINE == "ollama":
+        await ollama_engine.prime(client)
+        return
+
+    response = await client.get(f"{AGENT_URL}/health", headers=metrics.trace_headers())
+    response.raise_for_status()
+    if AGENT_SESSION_MODE == "pool":
+        missing = min(AGENT_WARM_SESSIONS, AGENT_SESSION_POOL_SIZE) - len(_session_pool._idle)
+        sessions = await asyncio.gather(*(create_session(client) for _ in range(missing)))
+        for session_id in sessions:
+            _session_pool.release(client, session_id, 0)
+
+
+async def fetch_engine_info() -> Optional[Dict]:
+    """Model and instruction fingerprint of the active engine
+    
+    For the Ollama engine this also loads the instructions it sends.
+    """
+    if AGENT_ENGINE == "ollama":
+        needs_agent = not (ollama_engine.OLLAMA_INSTRUCTION_PATH and ollama_engine.OLLAMA_BATCH_INSTRUCTION_PATH)
+        return ollama_engine.configure(await fetch_agent_info() if needs_agent else None)
+    return await fetch_agent_info()
+
+
+def engine_info_needed() -> bool:
+    """Whether the caches or the Ollama engine depend on the engine info"""
+    return ANALYSIS_CACHE_ENABLED or semantic_cache is not None or AGENT_ENGINE == "ollama"
+
+
+async def ensure_engine_info(force: bool = False) -> Optional[Dict]:
+    """Fetch the engine info and set the cache fingerprint, once it succeeds
+
+    The warm-up calls this with ``force``; until a fetch succeeds, requests
+    try again at most every ENGINE_INFO_RETRY_SECONDS.
+    """
+    global _engine_info, _engine_info_tried
+    if _engine_info is not None or not engine_info_needed():
+        return _engine_info
+    async with _engine_info_lock:
+        if _engine_info is None and (force or time.monotonic() - _engine_info_tried >= ENGINE_INFO_RETRY_SECONDS):
+            _engine_info_tried = time.monotonic()
+            info = await fetch_engine_info()
+            if info:
+                analysis_cache.set_fingerprint(info["model"], info["instruction_sha256"])
+                _engine_info = info
+    return _engine_info
+
+
+async def _ensure_engine_info_on_use() -> None:
+    """Retry a missing engine info fetch; only the Ollama engine waits for it"""
+    global _engine_info_task
+    if _engine_info is not None or not engine_info_needed():
+        return
+    if AGENT_ENGINE == "ollama":
+        # Without an instruction the engine cannot run at all
+        await ensure_engine_info()
+    elif _engine_info_task is None or _engine_info_task.done():
+        # Caching waits for the fingerprint; the request does not
+        _engine_info_task = asyncio.create_task(ensure_engine_info())
+
+
+async def _run_agent(
+    client: httpx.AsyncClient,
+    session_id: Optional[str],
+    prompt: str,
+    app_name: str = APP_NAME,
+    parser: Optional[AgentStreamParser] = None,
+):
+    """Run the agent on an existing session and return the parsed analysis
+    
+    Events are parsed as they arrive; the stream is closed as soon as a
+    complete analysis object has been received. Without a session id the
+    run goes to /run_stateless.
+    """
+    parser = parser or AgentStreamParser()
+    started = time.perf_counter()
+    body = {
+        "app_name": app_name,
+        "user_id": USER_ID,
+        "newMessage": {
+            "role": "user",
+            "parts": [{"text": prompt}]
+        },
+        "streaming": AGENT_STREAMING,
+        "model_config": {}
+    }
+    if session_id is not None:
+        body["session_id"] = session_id
+    endpoint = "run_sse" if session_id is not None else "run_stateless"
+    headers = metrics.trace_headers()
+    if _lane.get() == "bulk":
+        headers["X-Priority"] = "bulk"
+    async with client.stream("POST", f"{AGENT_URL}/{endpoint}", json=body, headers=headers) as response:
+        if response.is_error:
+            await response.aread()
+        response.raise_for_status()
+        
+        try:
+            async for line in response.aiter_lines():
+                analysis = parser.feed_line(line)
+                if analysis is not None:
+                    return analysis
+        finally:
+            _record_run({
+                "prompt_tokens": parser.usage.get("promptTokenCount") or 0,
+                "output_tokens": parser.usage.get("candidatesTokenCount") or 0,
+                "ttft_ms": (parser.first_text_at - started) * 1000 if parser.first_text_at else None,
+                "total_ms": (time.perf_counter() - started) * 1000,
+            })
+    
+    return parser.finish()
+
+
+async def _run_pooled(
+    client: httpx.AsyncClient,
+    prompt: str,
+    pool: SessionPool = _session_pool,
+    make_parser=AgentStreamParser,
+):
+    """Run the agent on a pooled session, replacing it if the agent lost it"""
+    session_id, uses = await pool.acquire(client)
+    try:
+        analysis = await _run_agent(client, session_id, prompt, pool.app_name, make_parser())
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code != 404:
+            pool.release(client, session_id, uses, reusable=False)
+            raise
+        # Session is gone (agent restarted or another instance served the
+        # call), retry once on a fresh session
+        session_id, uses = await create_session(client, pool.app_name), 0
+        try:
+            analysis = await _run_agent(client, session_id, prompt, pool.app_name, make_parser())
+        except Exception:
+            pool.release(client, session_id, uses, reusable=False)
+            raise
+    except Exception:
+        pool.release(client, session_id, uses, reusable=False)
+        raise
+    
+    pool.release(client, session_id, uses + 1)
+    return analysis
+
+
+async def _run_once(
+    client: httpx.AsyncClient,
+    prompt: str,
+    pool: SessionPool,
+    parser: Optional[AgentStreamParser] = None,
+    fallback_id: Optional[str] = None,
+):
+    """Run the agent on a new session and delete the session afterwards"""
+    session_id = await create_session(client, pool.app_name) or fallback_id
+    try:
+        return await _run_agent(client, session_id, prompt, pool.app_name, parser)
+    finally:
+        pool.release(client, session_id, 0, reusable=False)
+
+
+def build_batch_prompt(texts: List[str]) -> str:
+    """One line per item: its index and the feedback as a JSON string"""
+    lines = [f"[{i}] {json.dumps(text, ensure_ascii=False)}" for i, text in enumerate(texts)]
+    return "Feedback items:\n" + "\n".join(lines)
+
+
+async def run_batch(texts: List[str]) -> Dict[int, Dict]:
+    """Analyze several feedback items in one batch agent call
+    
+    Returns the analyses that came back, keyed by input index; items the
+    model skipped, garbled or filled with values outside ModelAnalysis are
+    simply absent.
+    """
+    client = get_client()
+    prompt = build_batch_prompt(texts)
+    make_parser = lambda: BatchStreamParser(len(texts))  # noqa: E731
+    if AGENT_ENGINE == "ollama":
+        results, run = await ollama_engine.analyze_batch(client, prompt, len(texts))
+        _record_run(run)
+    elif AGENT_SESSION_MODE == "pool":
+        results = await _run_pooled(client, prompt, _batch_session_pool, make_parser)
+    elif AGENT_SESSION_MODE == "stateless":
+        results = await _run_agent(client, None, prompt, BATCH_APP_NAME, make_parser())
+    else:
+        results = await _run_once(client, prompt, _batch_session_pool, make_parser())
+    valid = {}
+    for index, analysis in results.items():
+        try:
+            valid[index] = validate_analysis(analysis)
+        except ValidationError:
+            pass  # retried on its own like a missing item
+    return valid
+
+
+def batch_stats() -> Dict:
+    """Micro-batching counters"""
+    return {"enabled": AGENT_BATCH_SIZE > 1, **_micro_batcher.stats()}
+
+
+async def analyze_feedback(feedback_text: str, record_id: str, created_at: str, lane: str = "interactive") -> Dict:
     """
     Call ADK Agent to analyze feedback and return JSON analysis
     
+    Short, unambiguous feedback is answered by the lexicon pre-classifier
+    when PRECLASSIFIER_ENABLED is set. Identical feedback (after
+    normalization) is served from the analysis cache when
+    ANALYSIS_CACHE_ENABLED is set, and close paraphrases from the semantic
+    cache when SEMANTIC_CACHE_ENABLED is set.
+    
+    Model calls go through the adaptive concurrency limiter, which raises
+    AgentOverloadedError instead of queueing without bound.
+    
     Args:
         feedback_text: Customer feedback to analyze
-        record_id: Unique ID for the feedback record (not used by agent, kept for API compatibility)
+        record_id: Unique ID for the feedback record (used as session fallback in per_request mode)
         created_at: ISO 8601 timestamp (not used by agent, kept for API compatibility)
+        lane: "interactive" or "bulk"; interactive calls are served first when the model is busy
         
     Returns:
         Dict with analysis: sentiment, category, priority, keywords, root_cause, recommendation, summary
     """
-    async with httpx.AsyncClient(timeout=AGENT_TIMEOUT) as client:
-        try:
-            # Prepare simple prompt for analysis
-            prompt = f"Analyze this feedback: {feedback_text}"
-            
-            # First, create a session
-            session_response = await client.post(
-                f"{AGENT_URL}/apps/tanggap_agent/users/default_user/sessions",
-                json={}
-            )
-            session_response.raise_for_status()
-            session_data = session_response.json()
-            session_id = session_data.get("id") or session_data.get("session_id") or record_id
-            
-            # Now call ADK Agent API using /run_sse endpoint
-            async with client.stream(
-                "POST",
-                f"{AGENT_URL}/run_sse",
-                json={
-                    "app_name": "tanggap_agent",
-                    "user_id": "default_user",
-                    "session_id": session_id,
-                    "newMessage": {
-                        "role": "user",
-                        "parts": [{"text": prompt}]
-                    },
-                    "model_config": {}
-                }
-            ) as response:
-                response.raise_for_status()
-                
-                # Collect SSE events
-                full_response = ""
-                async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        data_str = line[6:]  # Remove "data: " prefix
-                        if data_str and data_str != "[DONE]":
-                            try:
-                                event_data = json.loads(data_str)
-                                # Accumulate response content
-                                if "content" in event_data:
-                                    content_val = event_data["content"]
-                                    if isinstance(content_val, str):
-                                        full_response += content_val
-                                    elif isinstance(content_val, dict):
-                                        full_response += json.dumps(content_val)
-                                elif "message" in event_data and "parts" in event_data["message"]:
-                                    for part in event_data["message"]["parts"]:
-                                        if "text" in part:
-                                            text_val = part["text"]
-                                            if isinstance(text_val, str):
-                                                full_response += text_val
-                                            elif isinstance(text_val, dict):
-                                                full_response += json.dumps(text_val)
-                            except json.JSONDecodeError:
-                                continue
-            
-            # Use accumulated response as content
-            content = full_response if full_response else ""
-            
-            if not content:
-                raise ValueError("No content received from agent")
-            
-            # Parse the accumulated content as JSON
-            # Agent returns SSE format with parts array
-            try:
-                parsed = json.loads(content)
-            except json.JSONDecodeError:
-                raise ValueError(f"Could not parse JSON from agent response: {content[:200]}")
-            
-            print(f"🔵 Parsed structure: {parsed.keys() if isinstance(parsed, dict) else type(parsed)}")
-            
-            # Extract text from parts array if present
-            analysis_text = None
-            if "parts" in parsed and isinstance(parsed["parts"], list):
-                for part in parsed["parts"]:
-                    if "text" in part:
-                        analysis_text = part["text"]
-                        break
-            
-            if not analysis_text:
-                raise ValueError(f"No text found in parts. Response: {parsed}")
-            
-            print(f"🔵 Analysis text: {analysis_text[:200]}")
-            
-            # Parse the analysis text as JSON
-            try:
-                analysis = json.loads(analysis_text)
-            except json.JSONDecodeError:
-                # Try extracting JSON from markdown
-                analysis = extract_json_from_text(analysis_text)
-            
-            # Validate required fields
-            required_fields = ["sentiment", "category", "priority", "keywords", "root_cause", "recommendation", "summary"]
-            missing = [f for f in required_fields if f not in analysis]
-            
-            if missing:
-                raise ValueError(f"Missing required fields: {missing}. Got fields: {list(analysis.keys())}")
-            
+    await _ensure_engine_info_on_use()
+    
+    if PRECLASSIFIER_ENABLED:
+        analysis = preclassifier.classify(feedback_text)
+        if analysis is not None:
+            metrics.ANALYSES.labels("preclassifier").inc()
             return analysis
-            
-        except httpx.HTTPStatusError as e:
-            error_detail = e.response.text if hasattr(e.response, 'text') else str(e)
-            raise Exception(f"Failed to call ADK Agent: {e} - Response: {error_detail}")
-        except httpx.HTTPError as e:
-            raise Exception(f"Failed to call ADK Agent: {e}")
-        except json.JSONDecodeError as e:
-            raise Exception(f"Failed to parse agent response: {e}")
-        except Exception as e:
-            raise Exception(f"Error analyzing feedback: {e}")
\ No newline at end of file
+    
+    if ANALYSIS_CACHE_ENABLED:
+        cached = analysis_cache.get(feedback_text)
+        if cached is not None:
+            metrics.ANALYSES.labels("cache").inc()
+            return cached
+    
+    if semantic_cache is not None:
+        similar = await asyncio.to_thread(semantic_cache.get, feedback_text)
+        if similar is not None:
+            metrics.ANALYSES.labels("semantic_cache").inc()
+            return similar
+    
+    if AGENT_SINGLEFLIGHT:
+        return await _call_agent_coalesced(feedback_text, record_id, lane)
+    
+    analysis = await _call_agent(feedback_text, record_id, lane)
+    await _remember(feedback_text, analysis)
+    return analysis
+
+
+def validate_analysis(analysis: Dict) -> Dict:
+    """Check a model answer against ModelAnalysis before it is used or cached
+
+    With AGENT_OUTPUT_FORMAT=schema the model cannot produce anything else,
+    but with json/none an answer can carry e.g. sentiment "mixed"; caching
+    it would fail every later request for the same text. Harmless drift is
+    repaired instead of rejected: extra keys are dropped and keywords
+    truncated to MAX_KEYWORDS.
+    """
+    analysis = {field: analysis[field] for field in ModelAnalysis.model_fields if field in analysis}
+    if isinstance(analysis.get("keywords"), list):
+        analysis["keywords"] = analysis["keywords"][:MAX_KEYWORDS]
+    try:
+        ModelAnalysis.model_validate(analysis)
+    except ValidationError:
+        parse_stats["invalid"] += 1
+        raise
+    return analysis
+
+
+async def _remember(feedback_text: str, analysis: Dict) -> None:
+    """Store a fresh model analysis in the exact and semantic caches
+
+    Skipped until the agent's fingerprint is known, so analyses are never
+    keyed to a model or instruction the agent may not be running.
+    """
+    if not analysis_cache.fingerprint_known:
+        return
+    if ANALYSIS_CACHE_ENABLED:
+        analysis_cache.put(feedback_text, analysis)
+    if semantic_cache is not None:
+        # put() appends to the sidecar and may compact it; keep that off the loop
+        await asyncio.to_thread(semantic_cache.put, feedback_text, analysis)
+
+
+def singleflight_stats() -> Dict:
+    """Counters for request coalescing"""
+    return {**_singleflight_stats, "in_flight": len(_inflight)}
+
+
+async def _call_agent_coalesced(feedback_text: str, record_id: str, lane: str) -> Dict:
+    """Share one agent call between concurrent requests with the same normalized text
+    
+    The call runs as its own task so a waiter that is cancelled (e.g. the
+    client disconnected) does not cancel it for everyone else.
+    """
+    key = analysis_cache.key(feedback_text)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_call_agent_and_cache(feedback_text, record_id, lane))
+        _inflight[key] = task
+        _singleflight_stats["agent_calls"] += 1
+        task.add_done_callback(lambda t: _finish_inflight(key, t))
+    else:
+        _singleflight_stats["coalesced"] += 1
+        metrics.ANALYSES.labels("coalesced").inc()
+    
+    analysis = await asyncio.shield(task)
+    return {**analysis, "keywords": list(analysis["keywords"])}
+
+
+def _finish_inflight(key: str, task: asyncio.Task) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()  # Mark retrieved in case every waiter went away
+
+
+async def _call_agent_and_cache(feedback_text: str, record_id: str, lane: str) -> Dict:
+    analysis = await _call_agent(feedback_text, record_id, lane)
+    await _remember(feedback_text, analysis)
+    return analysis
+
+
+async def _call_agent(feedback_text: str, record_id: str, lane: str = "interactive") -> Dict:
+    """Run one analysis on the agent, bypassing the cache
+
+    A single call holds one limiter slot. Micro-batched items wait for their
+    batch without one; the batch takes a single slot when it is dispatched.
+    """
+    metrics.ANALYSES.labels("model").inc()
+    outcome = "error"
+    try:
+        with metrics.stage("agent_call"):
+            if AGENT_BATCH_SIZE > 1:
+                analysis = await _micro_batcher.submit(feedback_text, record_id, lane)
+            else:
+                analysis = await _limited(lane, _call_agent_single, feedback_text, record_id)
+        outcome = "ok"
+        return analysis
+    finally:
+        metrics.AGENT_CALLS.labels(AGENT_ENGINE, outcome).inc()
+
+
+async def _limited(lane: str, call, *args):
+    """Await ``call(*args)`` while holding one limiter slot in ``lane``"""
+    _lane.set(lane)
+    if not AGENT_LIMITER_ENABLED:
+        return await call(*args)
+    async with _limiter.slot(lane):
+        return await call(*args)
+
+
+async def _run_batch_limited(texts: List[str], lane: str) -> Dict[int, Dict]:
+    return await _limited(lane, run_batch, texts)
+
+
+async def _run_single_limited(feedback_text: str, record_id: str, lane: str) -> Dict:
+    return await _limited(lane, _call_agent_single, feedback_text, record_id)
+
+
+async def _call_agent_single(feedback_text: str, record_id: str) -> Dict:
+    """Run one analysis with the single-item agent"""
+    client = get_client()
+    try:
+        # Prepare simple prompt for analysis
+        prompt = f"Analyze this feedback: {feedback_text}"
+        
+        if AGENT_ENGINE == "ollama":
+            analysis, run = await ollama_engine.analyze(client, prompt)
+            _record_run(run)
+        elif AGENT_SESSION_MODE == "pool":
+            analysis = await _run_pooled(client, prompt)
+        elif AGENT_SESSION_MODE == "stateless":
+            analysis = await _run_agent(client, None, prompt)
+        else:
+            analysis = await _run_once(client, prompt, _session_pool, fallback_id=record_id)
+        
+        return validate_analysis(analysis)
+        
+    except httpx.HTTPStatusError as e:
+        error_detail = e.response.text if hasattr(e.response, 'text') else str(e)
+        raise Exception(f"Failed to call {_engine_label()}: {e} - Response: {error_detail}")
+    except httpx.HTTPError as e:
+        raise Exception(f"Failed to call {_engine_label()}: {e}")
+    except json.JSONDecodeError as e:
+        raise Exception(f"Failed to parse agent response: {e}")
+    except Exception as e:
+        raise Exception(f"Error analyzing feedback: {e}")
+
+
+
+def _engine_label() -> str:
+    return "Ollama" if AGENT_ENGINE == "ollama" else "ADK Agent"
+
+
+_limiter = AdaptiveLimiter()
+_micro_batcher = MicroBatcher(_run_batch_limited, _run_single_limited, AGENT_BATCH_SIZE, AGENT_BATCH_WINDOW_MS)
@@ -0,0 +1,60 @@
+"""Shared analysis flow used by the single and batch analyze endpoints"""
+import uuid
+from datetime import datetime
+
+from app.models import FeedbackAnalysis
+from app.services.agent_client import analyze_feedback
+
+
+def to_iso(created_at: datetime) -> str:
+    """Format a naive UTC timestamp the way it is stored in BigQuery"""
+    return created_at.isoformat() + "Z"
+
+
+async def run_analysis(feedback: str, lane: str = "interactive") -> FeedbackAnalysis:
+    """Mint an ID and timestamp, call the agent and build the analysis object
+    
+    ``lane`` is "interactive" for a waiting user and "bulk" for batch work.
+    """
+    # Generate unique ID and timestamp
+    analysis_id = str(uuid.uuid4())
+    created_at = datetime.utcnow()
+    
+    # Call ADK Agent for analysis (returns JSON only, no tools)
+    analysis = await analyze_feedback(
+        feedback_text=feedback,
+        record_id=analysis_id,
+        created_at=to_iso(created_at),
+        lane=lane
+    )
+    
+    return FeedbackAnalysis(
+        id=analysis_id,
+        feedback_text=feedback,
+        sentiment=analysis["sentiment"],
+        category=analysis["category"],
+        priority_score=analysis["priority"],
+        keywords=analysis["keywords"],
+        root_cause=analysis["root_cause"],
+        recommendation=analysis["recommendation"],
+        summary=analysis["summary"],
+        created_at=created_at
+    )
+
+
+def to_bq_row(analysis: FeedbackAnalysis) -> dict:
+    """Convert an analysis into a feedback_analysis table row"""
+    from app.services.bq_client import build_row
+
+    return build_row(
+        record_id=analysis.id,
+        feedback_text=analysis.feedback_text,
+        sentiment=analysis.sentiment,
+        category=analysis.category,
+        priority=analysis.priority_score,
+        keywords=analysis.keywords,
+        root_cause=analysis.root_cause,
+        recommendation=analysis.recommendation,
+        summary=analysis.summary,
+        created_at=to_iso(analysis.created_at)
+    )
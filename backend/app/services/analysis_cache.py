@@ -0,0 +1,147 @@
+"""Content-addressed cache of agent analyses
+
+Keys are derived from the normalized feedback text plus the model name and
+a hash of the agent instruction, so changing either invalidates old
+entries. An in-process LRU with TTL sits in front of an optional SQLite
+tier (ANALYSIS_CACHE_PATH) that survives restarts.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional
+
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "10000"))
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", "")  # SQLite file, empty = memory only
+
+# Fallbacks used until the agent reports its own fingerprint at startup
+GEMMA_MODEL_NAME = os.getenv("GEMMA_MODEL_NAME", "gemma3:4b")
+TANGGAP_INSTRUCTION_SHA = os.getenv("TANGGAP_INSTRUCTION_SHA", "")
+
+CACHED_FIELDS = ("sentiment", "category", "priority", "keywords", "root_cause", "recommendation", "summary")
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize feedback so trivially different duplicates share a key"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class AnalysisCache:
+    """LRU + TTL cache with an optional SQLite second tier"""
+
+    def __init__(self, max_size: int, ttl: float, path: str = ""):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.model = GEMMA_MODEL_NAME
+        self.instruction_sha = TANGGAP_INSTRUCTION_SHA
+        # Without a configured hash, nothing is stored until the agent reports one
+        self.fingerprint_known = bool(TANGGAP_INSTRUCTION_SHA)
+        self._memory: OrderedDict = OrderedDict()  # key -> (expires_at, analysis)
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "stores": 0}
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache "
+                "(key TEXT PRIMARY KEY, analysis TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM analysis_cache WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+
+    def set_fingerprint(self, model: str, instruction_sha: str) -> None:
+        self.model = model
+        self.instruction_sha = instruction_sha
+        self.fingerprint_known = True
+
+    def key(self, feedback_text: str) -> str:
+        material = f"{self.model}\0{self.instruction_sha}\0{normalize_text(feedback_text)}"
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, feedback_text: str) -> Optional[Dict]:
+        key = self.key(feedback_text)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] > now:
+                self._memory.move_to_end(key)
+                self._stats["hits"] += 1
+                self._stats["memory_hits"] += 1
+                return _copy(entry[1])
+            if entry:
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT analysis, expires_at FROM analysis_cache WHERE key = ? AND expires_at > ?",
+                    (key, now),
+                ).fetchone()
+                if row:
+                    analysis = json.loads(row[0])
+                    self._remember(key, row[1], analysis)
+                    self._stats["hits"] += 1
+                    self._stats["disk_hits"] += 1
+                    return _copy(analysis)
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, feedback_text: str, analysis: Dict) -> None:
+        key = self.key(feedback_text)
+        expires_at = time.time() + self.ttl
+        value = {field: analysis[field] for field in CACHED_FIELDS}
+        with self._lock:
+            self._remember(key, expires_at, value)
+            self._stats["stores"] += 1
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO analysis_cache (key, analysis, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at),
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, expires_at: float, analysis: Dict) -> None:
+        self._memory[key] = (expires_at, analysis)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_enabled": self._db is not None,
+                "model": self.model,
+                "instruction_sha": self.instruction_sha,
+                "fingerprint_known": self.fingerprint_known,
+            }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def _copy(analysis: Dict) -> Dict:
+    copied = dict(analysis)
+    copied["keywords"] = list(copied.get("keywords") or [])
+    return copied
+
+
+analysis_cache = AnalysisCache(ANALYSIS_CACHE_SIZE, ANALYSIS_CACHE_TTL, ANALYSIS_CACHE_PATH)
@@ -1,19 +1,70 @@
 """BigQuery client for storing and querying feedback analysis"""
+import base64
+import json
 import os
-from typing import Dict, List
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
 from google.cloud import bigquery
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT", "bnb25-labs")
 DATASET_ID = "tanggapai_dataset"
 TABLE_ID = "feedback_analysis"
 FULL_TABLE_ID = f"{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}"
 
-# Initialize BigQuery client
-bq_client = bigquery.Client(project=PROJECT_ID)
+# Columns /api/query may return, and the filters it accepts
+QUERY_COLUMNS = (
+    "id",
+    "feedback_text",
+    "sentiment",
+    "category",
+    "priority_score",
+    "keywords",
+    "root_cause",
+    "recommendation",
+    "summary",
+    "created_at",
+)
+FILTER_FIELDS = ("sentiment", "category")
 
+# Without an explicit "from", a page only looks this far back from its
+# upper bound so each query scans a bounded number of daily partitions
+QUERY_DEFAULT_WINDOW_DAYS = int(os.getenv("QUERY_DEFAULT_WINDOW_DAYS", "0"))  # 0 = unbounded
 
-def insert_feedback_analysis(
+# Short-lived cache of query results, cleared when new rows are written
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "30"))  # seconds
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+_query_cache: OrderedDict = OrderedDict()
+_query_cache_lock = threading.Lock()
+
+# Created on first use (or by the startup warm-up) rather than at import,
+# since resolving credentials can block for a metadata-server round trip
+_client: Optional[bigquery.Client] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> bigquery.Client:
+    """Return the shared BigQuery client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = bigquery.Client(project=PROJECT_ID)
+    return _client
+
+
+def close_client() -> None:
+    """Close the shared BigQuery client, if it was ever created"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def build_row(
     record_id: str,
     feedback_text: str,
     sentiment: str,
@@ -25,65 +76,254 @@ def insert_feedback_analysis(
     summary: str,
     created_at: str
 ) -> Dict:
-    """Insert feedback analysis into BigQuery"""
-    try:
-        row = {
-            "id": record_id,
-            "feedback_text": feedback_text,
-            "sentiment": sentiment,
-            "category": category,
-            "priority_score": priority,  # Note: table uses priority_score
-            "keywords": keywords,
-            "root_cause": root_cause,
-            "recommendation": recommendation,
-            "summary": summary,
-            "created_at": created_at,
-        }
-        
-        print(f"🔵 Inserting feedback to BigQuery: {record_id}")
-        errors = bq_client.insert_rows_json(FULL_TABLE_ID, [row])
-        
-        if errors:
-            print(f"❌ BigQuery insert errors: {errors}")
-            return {"success": False, "error": str(errors)}
-        
-        print(f"✅ Successfully inserted record {record_id} to BigQuery")
-        return {"success": True, "message": f"Inserted record {record_id}"}
-    except Exception as e:
-        print(f"❌ Exception inserting to BigQuery: {e}")
-        return {"success": False, "error": str(e)}
+    """Build a feedback_analysis table row"""
+    return {
+        "id": record_id,
+        "feedback_text": feedback_text,
+        "sentiment": sentiment,
+        "category": category,
+        "priority_score": priority,  # Note: table uses priority_score
+        "keywords": keywords,
+        "root_cause": root_cause,
+        "recommendation": recommendation,
+        "summary": summary,
+        "created_at": created_at,
+    }
+
+
+def write_rows(rows: List[Dict]) -> Dict[int, str]:
+    """Streaming insert used by the background writer
+    
+    Rows carry their id as insertId so retried batches are deduplicated.
+    Returns the rejected rows as index -> BigQuery error reason ("invalid",
+    or "stopped" for valid rows held back by an invalid one); raises on
+    transport errors.
+    """
+    errors = get_client().insert_rows_json(FULL_TABLE_ID, rows, row_ids=[row["id"] for row in rows])
+    if errors:
+        print(f"❌ BigQuery insert errors: {errors}")
+    return {error["index"]: (error.get("errors") or [{}])[0].get("reason", "unknown") for error in errors}
+
+
+def encode_cursor(created_at: datetime, record_id: str) -> str:
+    """Opaque keyset cursor for the row after which the next page starts"""
+    payload = json.dumps({"t": _as_utc(created_at).isoformat(), "id": record_id})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
 
 
-def query_feedback(limit: int = 100, filters: Dict = None) -> Dict:
-    """Query feedback from BigQuery with optional filters"""
+def decode_cursor(cursor: str) -> tuple:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
     try:
-        # Build WHERE clause from filters
-        where_clauses = []
-        if filters:
-            if "sentiment" in filters:
-                where_clauses.append(f"sentiment = '{filters['sentiment']}'")
-            if "category" in filters:
-                where_clauses.append(f"category = '{filters['category']}'")
-        
-        where_sql = ""
-        if where_clauses:
-            where_sql = "WHERE " + " AND ".join(where_clauses)
-        
-        query = f"""
-            SELECT *
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(payload["t"]), str(payload["id"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def build_feedback_query(
+    limit: int,
+    filters: Dict = None,
+    columns=QUERY_COLUMNS,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[tuple] = None
+) -> tuple:
+    """Build a parameterized, keyset-paginated feedback query
+    
+    Returns (sql, query_parameters). Values never appear in the SQL text,
+    so identical dashboard queries share one statement and BigQuery can
+    serve them from its result cache. Rows are ordered by (created_at, id)
+    descending; ``cursor`` is the (created_at, id) of the last row of the
+    previous page. Bounds on created_at (from ``start``, ``end`` and the
+    cursor) let BigQuery scan only the matching DATE(created_at)
+    partitions. Without ``start``, QUERY_DEFAULT_WINDOW_DAYS (when set)
+    limits results to rows since that many days before today, on every
+    page alike.
+    """
+    unknown = [column for column in columns if column not in QUERY_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {unknown}")
+    # The cursor needs both sort keys, whatever the caller asked for
+    columns = tuple(columns) + tuple(c for c in ("created_at", "id") if c not in columns)
+    
+    where_clauses = []
+    params = []
+    for field in FILTER_FIELDS:
+        if filters and filters.get(field):
+            where_clauses.append(f"{field} = @{field}")
+            params.append(bigquery.ScalarQueryParameter(field, "STRING", filters[field]))
+    
+    upper = _as_utc(end) if end else None
+    if cursor:
+        cursor_ts, cursor_id = _as_utc(cursor[0]), cursor[1]
+        upper = min(upper, cursor_ts) if upper else cursor_ts
+        # The plain bound keeps partition pruning; the OR breaks created_at ties by id
+        where_clauses.append("created_at <= @cursor_ts")
+        where_clauses.append("(created_at < @cursor_ts OR (created_at = @cursor_ts AND id < @cursor_id))")
+        params.append(bigquery.ScalarQueryParameter("cursor_ts", "TIMESTAMP", cursor_ts))
+        params.append(bigquery.ScalarQueryParameter("cursor_id", "STRING", cursor_id))
+    if end:
+        where_clauses.append("created_at < @end_ts")
+        params.append(bigquery.ScalarQueryParameter("end_ts", "TIMESTAMP", _as_utc(end)))
+    
+    lower = _as_utc(start) if start else None
+    if lower is None and QUERY_DEFAULT_WINDOW_DAYS > 0:
+        # Midnight-aligned so the parameter, and BigQuery's result cache, hold for a day
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        lower = today - timedelta(days=QUERY_DEFAULT_WINDOW_DAYS)
+    if lower is not None:
+        where_clauses.append("created_at >= @start_ts")
+        params.append(bigquery.ScalarQueryParameter("start_ts", "TIMESTAMP", lower))
+    
+    params.append(bigquery.ScalarQueryParameter("limit", "INT64", limit))
+    
+    where_sql = ""
+    if where_clauses:
+        where_sql = "WHERE " + " AND ".join(where_clauses)
+    
+    query = f"""
+            SELECT {", ".join(columns)}
             FROM `{FULL_TABLE_ID}`
             {where_sql}
-            ORDER BY created_at DESC
-            LIMIT {limit}
+            ORDER BY created_at DESC, id DESC
+            LIMIT @limit
         """
+    return query, params
+
+
+def invalidate_query_cache() -> None:
+    """Drop cached query results (called after new rows are written)"""
+    with _query_cache_lock:
+        _query_cache.clear()
+
+
+def query_feedback(
+    limit: int = 100,
+    filters: Dict = None,
+    columns=QUERY_COLUMNS,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None
+) -> Dict:
+    """Query one page of feedback from BigQuery with optional filters
+    
+    ``next_cursor`` in the result fetches the following page, or is None on
+    the last page. Results are cached in-process for QUERY_CACHE_TTL
+    seconds per query and dropped whenever the backend writes rows.
+    """
+    try:
+        cache_key = (
+            tuple(sorted((filters or {}).items())), limit, tuple(columns), start, end, cursor
+        )
+        with _query_cache_lock:
+            cached = _query_cache.get(cache_key)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+        
+        query, params = build_feedback_query(
+            limit, filters, columns, start=start, end=end,
+            cursor=decode_cursor(cursor) if cursor else None
+        )
         
-        print(f"🔵 Querying BigQuery with: {query}")
-        query_job = bq_client.query(query)
+        print(f"🔵 Querying BigQuery with: {query.strip()} params={[(p.name, p.value) for p in params]}")
+        query_job = get_client().query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
         results = query_job.result()
         
         data = [dict(row) for row in results]
         
-        return {"success": True, "count": len(data), "data": data}
+        next_cursor = None
+        if data and len(data) == limit:
+            next_cursor = encode_cursor(data[-1]["created_at"], data[-1]["id"])
+        
+        result = {"success": True, "count": len(data), "data": data, "next_cursor": next_cursor}
+        if QUERY_CACHE_TTL > 0:
+            with _query_cache_lock:
+                _query_cache[cache_key] = (time.monotonic() + QUERY_CACHE_TTL, result)
+                while len(_query_cache) > QUERY_CACHE_SIZE:
+                    _query_cache.popitem(last=False)
+        return result
     except Exception as e:
         print(f"❌ Exception querying BigQuery: {e}")
         return {"success": False, "error": str(e)}
+
+
+def query_stats_rollup(since: datetime, until: datetime) -> List[Dict]:
+    """Hourly counts by sentiment, category and priority_score in [since, until)"""
+    query = f"""
+            SELECT TIMESTAMP_TRUNC(created_at, HOUR) AS bucket,
+                   sentiment, category, priority_score, COUNT(*) AS n
+            FROM `{FULL_TABLE_ID}`
+            WHERE created_at >= @since AND created_at < @until
+            GROUP BY bucket, sentiment, category, priority_score
+        """
+    params = [
+        bigquery.ScalarQueryParameter("since", "TIMESTAMP", since),
+        bigquery.ScalarQueryParameter("until", "TIMESTAMP", until),
+    ]
+    query_job = get_client().query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
+    return [dict(row) for row in query_job.result()]
+
+
+def query_keyword_rollup(since: datetime, until: datetime, per_bucket: int = 1000) -> List[Dict]:
+    """Hourly keyword counts in [since, until), top ``per_bucket`` per hour"""
+    query = f"""
+            SELECT bucket, keyword, n
+            FROM (
+                SELECT TIMESTAMP_TRUNC(created_at, HOUR) AS bucket,
+                       LOWER(TRIM(keyword)) AS keyword, COUNT(*) AS n
+                FROM `{FULL_TABLE_ID}`, UNNEST(keywords) AS keyword
+                WHERE created_at >= @since AND created_at < @until
+                GROUP BY bucket, keyword
+            )
+            WHERE keyword != ""
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY bucket ORDER BY n DESC) <= @per_bucket
+        """
+    params = [
+        bigquery.ScalarQueryParameter("since", "TIMESTAMP", since),
+        bigquery.ScalarQueryParameter("until", "TIMESTAMP", until),
+        bigquery.ScalarQueryParameter("per_bucket", "INT64", per_bucket),
+    ]
+    query_job = get_client().query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
+    return [dict(row) for row in query_job.result()]
+
+
+def query_min_created_at() -> Optional[datetime]:
+    """Timestamp of the oldest stored row, or None for an empty table"""
+    query_job = get_client().query(f"SELECT MIN(created_at) AS first FROM `{FULL_TABLE_ID}`")
+    rows = list(query_job.result())
+    return rows[0]["first"] if rows else None
+
+
+def query_rows_after(after: tuple, until: datetime, limit: int, columns=QUERY_COLUMNS) -> List[Dict]:
+    """Rows with (created_at, id) greater than ``after`` and created_at < ``until``, oldest first
+    
+    Keyset scan for incremental jobs; callers keep ``until`` close to the
+    watermark so each call only reads a few DATE(created_at) partitions.
+    """
+    unknown = [column for column in columns if column not in QUERY_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {unknown}")
+    columns = tuple(columns) + tuple(c for c in ("created_at", "id") if c not in columns)
+    query = f"""
+            SELECT {", ".join(columns)}
+            FROM `{FULL_TABLE_ID}`
+            WHERE created_at >= @after_ts AND created_at < @until
+              AND (created_at > @after_ts OR id > @after_id)
+            ORDER BY created_at, id
+            LIMIT @limit
+        """
+    params = [
+        bigquery.ScalarQueryParameter("after_ts", "TIMESTAMP", _as_utc(after[0])),
+        bigquery.ScalarQueryParameter("after_id", "STRING", after[1]),
+        bigquery.ScalarQueryParameter("until", "TIMESTAMP", _as_utc(until)),
+        bigquery.ScalarQueryParameter("limit", "INT64", limit),
+    ]
+    query_job = get_client().query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
+    return [dict(row) for row in query_job.result()]
@@ -0,0 +1,291 @@
+"""Background, batched BigQuery writer
+
+Request handlers hand rows to the writer and return immediately. A
+background task groups queued rows into batches (flushed when
+BQ_WRITER_BATCH_ROWS is reached or BQ_WRITER_FLUSH_SECONDS elapse), runs
+the blocking insert in a worker thread, retries rows rejected for a
+transient reason (and transport errors) with exponential backoff and
+drains the queue on shutdown. Rows BigQuery rejects as invalid would fail
+every retry while holding back the batches behind them, so they are
+logged, or appended to BQ_WRITER_DEAD_LETTER_PATH, at once.
+
+BQ_WRITE_API selects the sink: "insert_all" (legacy streaming inserts,
+default) or "storage" (Storage Write API default stream, requires
+google-cloud-bigquery-storage). The sink, and with it the BigQuery
+client, is opened by the startup warm-up or the first flush, off the
+event loop.
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from app.services import metrics
+
+BQ_WRITER_BATCH_ROWS = int(os.getenv("BQ_WRITER_BATCH_ROWS", "500"))
+BQ_WRITER_FLUSH_SECONDS = float(os.getenv("BQ_WRITER_FLUSH_SECONDS", "1.0"))
+BQ_WRITER_MAX_QUEUE = int(os.getenv("BQ_WRITER_MAX_QUEUE", "10000"))
+BQ_WRITER_MAX_RETRIES = int(os.getenv("BQ_WRITER_MAX_RETRIES", "5"))
+BQ_WRITER_BACKOFF_SECONDS = float(os.getenv("BQ_WRITER_BACKOFF_SECONDS", "0.5"))
+BQ_WRITE_API = os.getenv("BQ_WRITE_API", "insert_all")
+BQ_WRITER_DEAD_LETTER_PATH = os.getenv("BQ_WRITER_DEAD_LETTER_PATH", "")  # JSONL of invalid rows, empty = log only
+
+# A sink writes a batch and returns the rejected rows as index -> reason,
+# raising on transport-level failures.
+Sink = Callable[[List[Dict]], Dict[int, str]]
+
+# Rejections worth retrying; anything else ("invalid", ...) is permanent
+RETRYABLE_REASONS = {"stopped", "backendError", "internalError", "timeout", "rateLimitExceeded", "transport"}
+
+_STOP = object()
+
+
+def insert_all_sink(rows: List[Dict]) -> Dict[int, str]:
+    """Write rows with the legacy streaming insert API"""
+    from app.services.bq_client import write_rows
+
+    return write_rows(rows)
+
+
+class StorageWriteSink:
+    """Write rows through the Storage Write API default stream
+
+    Rows are serialized with a protobuf descriptor built from the table
+    schema at runtime, so no generated code is needed.
+    """
+
+    STRING_FIELDS = ("id", "feedback_text", "sentiment", "category", "root_cause", "recommendation", "summary")
+
+    def __init__(self):
+        from google.cloud import bigquery_storage_v1
+        from google.cloud.bigquery_storage_v1 import types
+        from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+
+        from app.services.bq_client import DATASET_ID, PROJECT_ID, TABLE_ID
+
+        self._types = types
+        self._client = bigquery_storage_v1.BigQueryWriteClient()
+        self._stream = f"{self._client.table_path(PROJECT_ID, DATASET_ID, TABLE_ID)}/_default"
+
+        field = descriptor_pb2.FieldDescriptorProto
+        message = descriptor_pb2.DescriptorProto(name="FeedbackRow")
+        columns = [(name, field.TYPE_STRING, field.LABEL_OPTIONAL) for name in self.STRING_FIELDS]
+        columns += [
+            ("priority_score", field.TYPE_INT64, field.LABEL_OPTIONAL),
+            ("keywords", field.TYPE_STRING, field.LABEL_REPEATED),
+            ("created_at", field.TYPE_INT64, field.LABEL_OPTIONAL),  # microseconds since epoch
+        ]
+        for number, (name, type_, label) in enumerate(columns, start=1):
+            message.field.add(name=name, number=number, type=type_, label=label)
+
+        file_proto = descriptor_pb2.FileDescriptorProto(name="tanggap_feedback_row.proto")
+        file_proto.message_type.add().CopyFrom(message)
+        pool = descriptor_pool.DescriptorPool()
+        pool.Add(file_proto)
+        self._row_class = message_factory.GetMessageClass(pool.FindMessageTypeByName("FeedbackRow"))
+        self._schema = types.ProtoSchema(proto_descriptor=message)
+
+    def _serialize(self, row: Dict) -> bytes:
+        message = self._row_class()
+        for name in self.STRING_FIELDS:
+            if row.get(name) is not None:
+                setattr(message, name, row[name])
+        message.priority_score = int(row["priority_score"])
+        message.keywords.extend(row.get("keywords") or [])
+        created_at = datetime.fromisoformat(row["created_at"].replace("Z", "+00:00"))
+        message.created_at = int(created_at.timestamp() * 1_000_000)
+        return message.SerializeToString()
+
+    def __call__(self, rows: List[Dict]) -> Dict[int, str]:
+        types = self._types
+        request = types.AppendRowsRequest(
+            write_stream=self._stream,
+            proto_rows=types.AppendRowsRequest.ProtoData(
+                writer_schema=self._schema,
+                rows=types.ProtoRows(serialized_rows=[self._serialize(row) for row in rows]),
+            ),
+        )
+        for response in self._client.append_rows(iter([request])):
+            if response.row_errors:
+                # Nothing in the request was written; only the listed rows are bad
+                invalid = {error.index: "invalid" for error in response.row_errors}
+                return {i: invalid.get(i, "stopped") for i in range(len(rows))}
+            if response.error.code:
+                raise RuntimeError(f"Storage Write API error: {response.error.message}")
+        return {}
+
+
+def _default_sink() -> Sink:
+    """The BQ_WRITE_API sink, with the BigQuery client it writes through created"""
+    if BQ_WRITE_API == "storage":
+        try:
+            return StorageWriteSink()
+        except ImportError:
+            print("⚠️ google-cloud-bigquery-storage not installed, falling back to streaming inserts")
+    from app.services.bq_client import get_client
+
+    get_client()
+    return insert_all_sink
+
+
+class BigQueryWriter:
+    """Queue rows and flush them to BigQuery in batches off the event loop"""
+
+    def __init__(
+        self,
+        sink: Optional[Sink] = None,
+        batch_rows: int = BQ_WRITER_BATCH_ROWS,
+        flush_seconds: float = BQ_WRITER_FLUSH_SECONDS,
+        max_queue: int = BQ_WRITER_MAX_QUEUE,
+        max_retries: int = BQ_WRITER_MAX_RETRIES,
+        backoff_seconds: float = BQ_WRITER_BACKOFF_SECONDS,
+    ):
+        self.sink = sink
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_seconds
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[List[Dict]], None]] = []
+        self._stats = {
+            "rows_queued": 0,
+            "rows_written": 0,
+            "rows_failed": 0,
+            "rows_invalid": 0,
+            "batches": 0,
+            "retries": 0,
+            "last_flush_ms": 0.0,
+        }
+
+    def add_listener(self, callback: Callable[[List[Dict]], None]) -> None:
+        """Call ``callback(rows)`` after each batch is written successfully"""
+        self._listeners.append(callback)
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def open_sink(self) -> Sink:
+        """Create the configured sink in a worker thread, if not given one"""
+        if self.sink is None:
+            self.sink = await asyncio.to_thread(_default_sink)
+        return self.sink
+
+    async def stop(self) -> None:
+        """Flush everything still queued, then stop the background task"""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def submit(self, rows: List[Dict]) -> None:
+        """Queue rows for writing; waits only when the queue is full"""
+        if self._task is None:
+            await self.start()
+        for row in rows:
+            await self._queue.put(row)
+        self._stats["rows_queued"] += len(rows)
+
+    def stats(self) -> Dict:
+        return {**self._stats, "queue_depth": self._queue.qsize() if self._queue else 0}
+
+    async def _run(self) -> None:
+        while True:
+            batch, stopping = await self._collect()
+            if batch:
+                await self._flush(batch)
+            if stopping:
+                return
+
+    async def _collect(self) -> tuple:
+        """Wait for a batch: full, timed out, or cut short by shutdown"""
+        item = await self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_rows:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _flush(self, batch: List[Dict]) -> None:
+        started = time.perf_counter()
+        pending = batch
+        for attempt in range(self.max_retries + 1):
+            try:
+                sink = await self.open_sink()
+                with metrics.stage("bq_insert"):
+                    failed = await asyncio.to_thread(sink, pending)
+            except Exception as e:
+                print(f"❌ BigQuery batch write failed: {e}")
+                metrics.BQ_INSERT_ERRORS.labels(BQ_WRITE_API).inc()
+                failed = {i: "transport" for i in range(len(pending))}
+
+            written = [row for i, row in enumerate(pending) if i not in failed]
+            if written:
+                self._stats["rows_written"] += len(written)
+                metrics.BQ_INSERT_ROWS.labels(BQ_WRITE_API, "written").inc(len(written))
+                self._notify(written)
+            invalid = [(pending[i], reason) for i, reason in sorted(failed.items()) if reason not in RETRYABLE_REASONS]
+            if invalid:
+                await self._dead_letter(invalid)
+            pending = [pending[i] for i, reason in sorted(failed.items()) if reason in RETRYABLE_REASONS]
+            if not pending:
+                break
+            if attempt < self.max_retries:
+                self._stats["retries"] += 1
+                metrics.BQ_INSERT_ROWS.labels(BQ_WRITE_API, "retried").inc(len(pending))
+                await asyncio.sleep(self.backoff_seconds * 2 ** attempt)
+
+        if pending:
+            self._stats["rows_failed"] += len(pending)
+            metrics.BQ_INSERT_ROWS.labels(BQ_WRITE_API, "failed").inc(len(pending))
+            print(f"❌ Dropping {len(pending)} rows after {self.max_retries} retries")
+        self._stats["batches"] += 1
+        self._stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    async def _dead_letter(self, rejected: List[tuple]) -> None:
+        """Set aside rows BigQuery will never accept, without retrying them"""
+        self._stats["rows_invalid"] += len(rejected)
+        metrics.BQ_INSERT_ROWS.labels(BQ_WRITE_API, "invalid").inc(len(rejected))
+        reasons = sorted({reason for _, reason in rejected})
+        if not BQ_WRITER_DEAD_LETTER_PATH:
+            print(f"❌ Dropping {len(rejected)} rows rejected as {', '.join(reasons)}: {[row['id'] for row, _ in rejected]}")
+            return
+        lines = "".join(json.dumps({"reason": reason, "row": row}, default=str) + "\n" for row, reason in rejected)
+
+        def append() -> None:
+            with open(BQ_WRITER_DEAD_LETTER_PATH, "a", encoding="utf-8") as f:
+                f.write(lines)
+
+        try:
+            await asyncio.to_thread(append)
+            print(f"❌ Wrote {len(rejected)} rows rejected as {', '.join(reasons)} to {BQ_WRITER_DEAD_LETTER_PATH}")
+        except OSError as e:
+            print(f"❌ Dropping {len(rejected)} rejected rows, dead-letter write failed: {e}")
+
+    def _notify(self, rows: List[Dict]) -> None:
+        for callback in self._listeners:
+            try:
+                callback(rows)
+            except Exception as e:
+                print(f"⚠️ BigQuery writer listener failed: {e}")
+
+
+bq_writer = BigQueryWriter()
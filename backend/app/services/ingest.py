@@ -0,0 +1,219 @@
+"""Streaming ingestion of large feedback exports (NDJSON or CSV)
+
+The request body is read incrementally and pushed through a bounded
+pipeline: parse -> analyze (INGEST_CONCURRENCY workers) -> background
+BigQuery writer. Every stage talks through a bounded queue, so a slow
+agent stops the body from being read instead of buffering it, and memory
+stays flat regardless of upload size.
+"""
+import asyncio
+import codecs
+import csv
+import json
+import os
+from typing import AsyncIterator, Callable, Dict, Optional
+
+from starlette.responses import StreamingResponse
+
+from app.services.analysis import run_analysis, to_bq_row
+from app.services.bq_writer import bq_writer
+
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "8"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "64"))
+INGEST_MAX_LINE_BYTES = 64 * 1024
+
+FEEDBACK_FIELDS = ("feedback", "feedback_text", "text")
+
+_DONE = object()
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse that reads the request body itself while streaming
+
+    ``handler`` gets the body as an async iterator of chunks and returns the
+    iterator to stream back. The stock response listens for client
+    disconnects on ``receive``, which would swallow body chunks the pipeline
+    is still reading. Here a single reader takes every message: body chunks
+    go to the handler one at a time, and an http.disconnect, during or after
+    the upload, cancels the stream so the pipeline stops.
+    """
+
+    def __init__(self, handler: Callable[[AsyncIterator[bytes]], AsyncIterator], **kwargs):
+        super().__init__((), **kwargs)
+        self.handler = handler
+
+    async def __call__(self, scope, receive, send) -> None:
+        chunks: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+        async def body() -> AsyncIterator[bytes]:
+            while (chunk := await chunks.get()) is not None:
+                yield chunk
+
+        async def read() -> None:
+            more_body = True
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                if more_body:
+                    await chunks.put(message.get("body", b""))
+                    more_body = message.get("more_body", False)
+                    if not more_body:
+                        await chunks.put(None)
+
+        self.body_iterator = self.handler(body())
+        stream = asyncio.create_task(self.stream_response(send))
+        reader = asyncio.create_task(read())
+        await asyncio.wait((stream, reader), return_when=asyncio.FIRST_COMPLETED)
+        if not stream.done():
+            # Client went away: stop analyzing rows nobody will read
+            stream.cancel()
+            await asyncio.gather(stream, return_exceptions=True)
+            return
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        stream.result()
+        if self.background is not None:
+            await self.background()
+
+
+def _check_length(text: str) -> None:
+    if len(text) * 4 > INGEST_MAX_LINE_BYTES and len(text.encode("utf-8")) > INGEST_MAX_LINE_BYTES:
+        raise ValueError(f"Line exceeds {INGEST_MAX_LINE_BYTES} bytes")
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a byte stream into decoded lines without buffering the whole body"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            _check_length(line)
+            yield line.rstrip("\r")
+        _check_length(pending)
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        _check_length(pending)
+        yield pending.rstrip("\r")
+
+
+def _pick_feedback(record: Dict) -> Optional[str]:
+    for field in FEEDBACK_FIELDS:
+        value = record.get(field)
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    return None
+
+
+async def iter_ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[tuple]:
+    """Yield (feedback, error) for each non-empty NDJSON line"""
+    async for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield None, f"Invalid JSON: {e}"
+            continue
+        if isinstance(record, str):
+            feedback = record.strip() or None
+        elif isinstance(record, dict):
+            feedback = _pick_feedback(record)
+        else:
+            feedback = None
+        yield (feedback, None) if feedback else (None, "No feedback text in record")
+
+
+async def iter_csv_records(lines: AsyncIterator[str]) -> AsyncIterator[tuple]:
+    """Yield (feedback, error) for each CSV record, using the header to find the column"""
+    header = None
+    column = 0
+    pending = ""
+    async for line in lines:
+        # Quoted fields may span lines; wait until the quotes balance
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2:
+            continue
+        record, pending = pending, ""
+        if not record.strip():
+            continue
+        fields = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip().lower() for name in fields]
+            column = next((header.index(f) for f in FEEDBACK_FIELDS if f in header), 0)
+            continue
+        value = fields[column].strip() if column < len(fields) else ""
+        yield (value, None) if value else (None, "No feedback text in record")
+    if pending:
+        yield None, "Unterminated quoted field"
+
+
+async def run_ingest(body: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Dict]:
+    """Run the ingest pipeline and yield one result per input record, then a summary
+
+    Results are yielded as soon as each record finishes, so they are in
+    completion order; each carries the record's input ``index``.
+    """
+    parser = iter_csv_records if fmt == "csv" else iter_ndjson_records
+    work_queue: asyncio.Queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+    result_queue: asyncio.Queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+
+    async def produce():
+        index = 0
+        try:
+            async for feedback, error in parser(iter_lines(body)):
+                if error:
+                    await result_queue.put({"index": index, "success": False, "error": error})
+                else:
+                    await work_queue.put((index, feedback[:5000]))
+                index += 1
+        except Exception as e:
+            await result_queue.put({"index": index, "success": False, "error": f"Upload aborted: {e}"})
+        for _ in range(INGEST_CONCURRENCY):
+            await work_queue.put(_DONE)
+
+    async def work():
+        while True:
+            item = await work_queue.get()
+            if item is _DONE:
+                await result_queue.put(_DONE)
+                return
+            index, feedback = item
+            try:
+                analysis = await run_analysis(feedback, lane="bulk")
+                await result_queue.put({"index": index, "success": True, "analysis": analysis})
+            except Exception as e:
+                await result_queue.put({"index": index, "success": False, "error": str(e)})
+
+    tasks = [asyncio.create_task(produce())]
+    tasks += [asyncio.create_task(work()) for _ in range(INGEST_CONCURRENCY)]
+
+    totals = {"total": 0, "succeeded": 0, "failed": 0, "queued": 0}
+
+    try:
+        workers_left = INGEST_CONCURRENCY
+        while workers_left:
+            result = await result_queue.get()
+            if result is _DONE:
+                workers_left -= 1
+                continue
+
+            totals["total"] += 1
+            if result["success"]:
+                totals["succeeded"] += 1
+                analysis = result.pop("analysis")
+                # Waits when the writer queue is full, pausing the pipeline
+                await bq_writer.submit([to_bq_row(analysis)])
+                totals["queued"] += 1
+                result["analysis"] = analysis.model_dump(mode="json")
+            else:
+                totals["failed"] += 1
+            yield result
+
+        yield {"done": True, **totals}
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,294 @@
+"""Asynchronous analysis jobs
+
+POST /api/jobs returns immediately with a job id; a pool of JOB_WORKERS
+background workers runs the agent call and queues the BigQuery row. Job
+state lives in memory by default or in SQLite (JOB_STORE_PATH) so it can
+be shared by worker processes on the same host and survives restarts. Each
+process renews a lease every JOB_HEARTBEAT_SECONDS; jobs left queued or
+running by an owner whose lease has lapsed are queued again by a live
+process.
+Jobs run in the limiter's interactive lane, since the web frontend waits
+on them; a client submitting background work marks it X-Priority: bulk. A
+job shed because the model is saturated waits Retry-After seconds and
+tries again instead of failing.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.services import metrics
+from app.services.analysis import run_analysis, to_bq_row
+from app.services.bq_writer import bq_writer
+from app.services.limiter import AgentOverloadedError
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "1000"))
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "3600"))
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "")  # SQLite file, empty = in memory
+
+JOB_POLL_SECONDS = 1.0  # how often to re-read a job finished by another process
+JOB_HEARTBEAT_SECONDS = 10.0  # how often to renew this process's lease, recover orphans and prune
+JOB_LEASE_SECONDS = 30.0  # an owner silent this long is gone; its unfinished jobs are re-queued
+
+# Owner of the jobs this process submits. PIDs repeat across container
+# restarts (uvicorn is PID 1 every time), so they cannot tell owners apart.
+PROCESS_ID = uuid.uuid4().hex
+
+FINISHED_STATUSES = ("done", "failed")
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue cannot accept more work"""
+
+
+class MemoryJobStore:
+    """Job records in a dict, expired JOB_TTL_SECONDS after their last update"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._jobs: Dict[str, Dict] = {}
+
+    def save(self, job: Dict) -> None:
+        self._jobs[job["id"]] = job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self._jobs.get(job_id)
+
+    def heartbeat(self, owner: str) -> None:
+        pass
+
+    def orphans(self, lease: float) -> List[Dict]:
+        return []  # nothing outlives the process
+
+    def prune(self) -> None:
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job["_updated"] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class SQLiteJobStore:
+    """Job records in a SQLite table, plus a heartbeat per process that owns jobs"""
+
+    def __init__(self, path: str, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, job TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS job_owners (owner TEXT PRIMARY KEY, seen REAL NOT NULL)")
+        self._db.commit()
+
+    def save(self, job: Dict) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, job, updated) VALUES (?, ?, ?)",
+                (job["id"], json.dumps(job), job["_updated"]),
+            )
+            self._db.commit()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT job FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def heartbeat(self, owner: str) -> None:
+        """Renew ``owner``'s lease on the jobs it runs"""
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO job_owners (owner, seen) VALUES (?, ?)", (owner, time.time()))
+            self._db.commit()
+
+    def orphans(self, lease: float) -> List[Dict]:
+        """Unfinished jobs whose owner has not renewed its lease for ``lease`` seconds"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job FROM jobs WHERE json_extract(job, '$.status') IN ('queued', 'running') "
+                "AND COALESCE(json_extract(job, '$._owner'), '') NOT IN "
+                "(SELECT owner FROM job_owners WHERE seen >= ?)",
+                (time.time() - lease,),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def claim(self, job: Dict, owner: str) -> bool:
+        """Take over an orphaned job unless another process got there first"""
+        previous = job.get("_owner")
+        job["_owner"] = owner
+        job["_updated"] = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET job = ?, updated = ? WHERE id = ? AND json_extract(job, '$._owner') IS ?",
+                (json.dumps(job), job["_updated"], job["id"], previous),
+            )
+            self._db.commit()
+        return cursor.rowcount == 1
+
+    def prune(self) -> None:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE updated < ?", (cutoff,))
+            self._db.execute("DELETE FROM job_owners WHERE seen < ?", (cutoff,))
+            self._db.commit()
+
+
+class JobQueue:
+    """Bounded queue of analysis jobs served by a pool of workers"""
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.store = SQLiteJobStore(JOB_STORE_PATH, JOB_TTL_SECONDS) if JOB_STORE_PATH else MemoryJobStore(JOB_TTL_SECONDS)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list = []
+        self._maintainer: Optional[asyncio.Task] = None
+        self._finished: Dict[str, asyncio.Event] = {}
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self.store.heartbeat(PROCESS_ID)
+        self._recover()
+        self._maintainer = asyncio.create_task(self._maintain())
+
+    async def _maintain(self) -> None:
+        """Renew the lease, pick up orphans and prune expired jobs on a timer"""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                self.store.heartbeat(PROCESS_ID)
+                self._recover()
+                self.store.prune()
+            except sqlite3.Error as e:
+                print(f"⚠️ Job store maintenance failed: {e}")
+
+    def _recover(self) -> None:
+        """Queue again the jobs a dead process left unfinished"""
+        requeued = 0
+        for job in self.store.orphans(JOB_LEASE_SECONDS):
+            if self._queue.full():
+                break  # the next heartbeat tries again
+            if not self.store.claim(job, PROCESS_ID):
+                continue
+            job["status"] = "queued"
+            if job.get("_feedback") is None:
+                job["status"] = "failed"
+                job["error"] = "Interrupted by a restart"
+            else:
+                self._queue.put_nowait((job["id"], job["_feedback"], None, job.get("_lane", "interactive")))
+                self._finished[job["id"]] = asyncio.Event()
+                requeued += 1
+            self._save(job)
+        if requeued:
+            print(f"🔵 Re-queued {requeued} unfinished jobs from a stopped process")
+
+    async def stop(self) -> None:
+        tasks = self._tasks + ([self._maintainer] if self._maintainer else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._maintainer = None
+
+    def submit(self, feedback: str, lane: str = "interactive") -> Dict:
+        """Create a queued job; raises QueueFullError when the queue is full"""
+        if self._queue is None:
+            raise QueueFullError("Job queue is not running")
+        job = {
+            "id": str(uuid.uuid4()),
+            "status": "queued",
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "result": None,
+            "error": None,
+            "_owner": PROCESS_ID,
+            "_feedback": feedback,
+            "_lane": lane,
+        }
+        try:
+            self._queue.put_nowait((job["id"], feedback, metrics.trace_id(), lane))
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Job queue is full ({self.queue_size} jobs)")
+        self._save(job)
+        self._finished[job["id"]] = asyncio.Event()
+        return public_job(job)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        job = self.store.get(job_id)
+        return public_job(job) if job else None
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict]:
+        """Wait up to ``timeout`` seconds for a job to finish and return its state
+
+        Jobs run by another process sharing JOB_STORE_PATH (or finished
+        before a restart) have no local event; their record is polled.
+        """
+        event = self._finished.get(job_id)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return self.get(job_id)
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in FINISHED_STATUSES or remaining <= 0:
+                return job
+            await asyncio.sleep(min(JOB_POLL_SECONDS, remaining))
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "workers": len(self._tasks),
+        }
+
+    async def _work(self) -> None:
+        while True:
+            job_id, feedback, trace_id, lane = await self._queue.get()
+            job = self.store.get(job_id)
+            if job is None:
+                continue
+            job["status"] = "running"
+            self._save(job)
+            try:
+                with metrics.traced(trace_id):
+                    analysis = await self._analyze(feedback, lane)
+                await bq_writer.submit([to_bq_row(analysis)])
+                job["status"] = "done"
+                job["result"] = analysis.model_dump(mode="json")
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = str(e)
+            job.pop("_feedback", None)
+            self._save(job)
+            event = self._finished.pop(job_id, None)
+            if event is not None:
+                event.set()
+
+    async def _analyze(self, feedback: str, lane: str):
+        while True:
+            try:
+                return await run_analysis(feedback, lane=lane)
+            except AgentOverloadedError as e:
+                await asyncio.sleep(e.retry_after)
+
+    def _save(self, job: Dict) -> None:
+        job["_updated"] = time.time()
+        self.store.save(job)
+
+
+def public_job(job: Dict) -> Dict:
+    return {key: value for key, value in job.items() if not key.startswith("_")}
+
+
+job_queue = JobQueue()
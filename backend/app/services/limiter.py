@@ -0,0 +1,234 @@
+"""Adaptive concurrency limit in front of the model
+
+Ollama serves one GPU: past a few concurrent generations, extra requests
+do not add throughput, they only make every request slower until all of
+them hit AGENT_TIMEOUT together. The limiter keeps the number of agent
+calls in flight near what the backend can serve, using AIMD on observed
+latency. A call that finishes within AGENT_LIMIT_TOLERANCE x the baseline
+(the lowest latency seen in the last AGENT_LIMIT_BASELINE_SECONDS) raises the limit by about one per round trip.
+A slower call, a timeout, or a 429/503 from upstream cuts it by
+AGENT_LIMIT_BACKOFF, at most once per round trip.
+
+Calls over the limit wait in a bounded queue with two lanes. Interactive
+requests are served before bulk work (batch, ingest, jobs). When the queue
+is full, or a call has waited AGENT_QUEUE_TIMEOUT seconds, the caller gets
+AgentOverloadedError with a Retry-After estimate, not a late timeout. A
+full queue makes room for an interactive call by shedding the newest bulk
+waiter.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import httpx
+
+from app.services import metrics
+
+AGENT_LIMITER_ENABLED = os.getenv("AGENT_LIMITER_ENABLED", "true").lower() == "true"
+AGENT_LIMIT_INITIAL = float(os.getenv("AGENT_LIMIT_INITIAL", "4"))
+AGENT_LIMIT_MIN = float(os.getenv("AGENT_LIMIT_MIN", "1"))
+AGENT_LIMIT_MAX = float(os.getenv("AGENT_LIMIT_MAX", "64"))
+AGENT_LIMIT_TOLERANCE = float(os.getenv("AGENT_LIMIT_TOLERANCE", "2.0"))
+AGENT_LIMIT_BACKOFF = float(os.getenv("AGENT_LIMIT_BACKOFF", "0.9"))
+AGENT_LIMIT_BASELINE_SECONDS = float(os.getenv("AGENT_LIMIT_BASELINE_SECONDS", "300"))
+AGENT_QUEUE_SIZE = int(os.getenv("AGENT_QUEUE_SIZE", "100"))
+AGENT_QUEUE_TIMEOUT = float(os.getenv("AGENT_QUEUE_TIMEOUT", "20"))  # seconds
+
+LANES = ("interactive", "bulk")  # served in this order
+BASELINE_BUCKETS = 10  # the baseline window is kept as per-bucket minimums
+
+
+class AgentOverloadedError(Exception):
+    """Raised when an agent call is shed instead of queued"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit with a bounded, two-lane wait queue"""
+
+    def __init__(
+        self,
+        initial: float = AGENT_LIMIT_INITIAL,
+        min_limit: float = AGENT_LIMIT_MIN,
+        max_limit: float = AGENT_LIMIT_MAX,
+        tolerance: float = AGENT_LIMIT_TOLERANCE,
+        backoff: float = AGENT_LIMIT_BACKOFF,
+        queue_size: int = AGENT_QUEUE_SIZE,
+        queue_timeout: float = AGENT_QUEUE_TIMEOUT,
+        baseline_seconds: float = AGENT_LIMIT_BASELINE_SECONDS,
+    ):
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.baseline_seconds = baseline_seconds
+        self.in_flight = 0
+        self._lanes: Dict[str, deque] = {lane: deque() for lane in LANES}  # waiting futures
+        self._minimums: deque = deque()  # [(bucket, lowest latency in it)], seconds
+        self._latency: Optional[float] = None  # EWMA, seconds
+        self._last_decrease = 0.0
+        self._stats = {
+            "requests": 0, "queued": 0, "shed_queue_full": 0, "shed_queue_timeout": 0,
+            "shed_for_interactive": 0, "increases": 0, "decreases": 0,
+        }
+
+    @asynccontextmanager
+    async def slot(self, lane: str = "interactive"):
+        """Hold one unit of concurrency for the duration of an agent call"""
+        await self.acquire(lane)
+        started = time.monotonic()
+        sample = False
+        dropped = False
+        try:
+            yield
+            sample = True
+        except Exception as e:
+            dropped = sample = _is_overload(e)
+            raise
+        finally:
+            self.release(started, sample, dropped)
+
+    async def acquire(self, lane: str = "interactive") -> None:
+        if lane not in self._lanes:
+            raise ValueError(f"Unknown lane: {lane}")
+        self._stats["requests"] += 1
+        if self.in_flight < self._capacity() and not self._waiting():
+            self.in_flight += 1
+            return
+
+        if self._waiting() >= self.queue_size:
+            if lane == "interactive" and self._lanes["bulk"]:
+                self._shed_bulk()
+            else:
+                self._stats["shed_queue_full"] += 1
+                raise AgentOverloadedError(
+                    f"Agent is overloaded ({self.in_flight} in flight, {self._waiting()} queued)",
+                    self.retry_after(),
+                )
+
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[lane].append(future)
+        self._stats["queued"] += 1
+        queued_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                return  # granted as the timeout fired
+            self._discard(lane, future)
+            self._stats["shed_queue_timeout"] += 1
+            raise AgentOverloadedError(
+                f"Agent is overloaded (waited {self.queue_timeout:.0f}s for a slot)",
+                self.retry_after(),
+            )
+        except asyncio.CancelledError:
+            self._discard(lane, future)
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release(None, False, False)  # granted, but the caller went away
+            raise
+        finally:
+            metrics.observe("limiter_wait", time.perf_counter() - queued_at)
+
+    def release(self, started: Optional[float], sample: bool, dropped: bool) -> None:
+        self.in_flight -= 1
+        if sample and started is not None:
+            self._update(started, time.monotonic() - started, dropped)
+        self._pump()
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue is likely drained"""
+        latency = self._latency or 1.0
+        return max(1, math.ceil((self._waiting() + 1) * latency / max(self._capacity(), 1)))
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": AGENT_LIMITER_ENABLED,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": {lane: len(futures) for lane, futures in self._lanes.items()},
+            "queue_size": self.queue_size,
+            "baseline_ms": round(self._baseline() * 1000, 1) if self._minimums else None,
+            "latency_ms": round(self._latency * 1000, 1) if self._latency else None,
+            **self._stats,
+        }
+
+    def _capacity(self) -> int:
+        return max(1, int(self.limit))
+
+    def _waiting(self) -> int:
+        return sum(len(futures) for futures in self._lanes.values())
+
+    def _baseline(self) -> float:
+        return min(latency for _, latency in self._minimums)
+
+    def _observe(self, latency: float) -> None:
+        """Track the windowed minimum; old buckets expire so the baseline follows a slower model"""
+        bucket = int(time.monotonic() / (self.baseline_seconds / BASELINE_BUCKETS))
+        if self._minimums and self._minimums[-1][0] == bucket:
+            self._minimums[-1] = (bucket, min(self._minimums[-1][1], latency))
+        else:
+            self._minimums.append((bucket, latency))
+        while self._minimums[0][0] <= bucket - BASELINE_BUCKETS:
+            self._minimums.popleft()
+
+    def _update(self, started: float, latency: float, dropped: bool) -> None:
+        self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+        if not dropped:
+            self._observe(latency)
+        slow = bool(self._minimums) and latency > self.tolerance * self._baseline()
+        if dropped or slow:
+            # Only calls started under the current limit may lower it again
+            if started >= self._last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = time.monotonic()
+                self._stats["decreases"] += 1
+        elif self.in_flight + 1 >= self.limit / 2:
+            # Grow only while the limit is actually in use
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._stats["increases"] += 1
+
+    def _pump(self) -> None:
+        for lane in LANES:
+            futures = self._lanes[lane]
+            while futures and self.in_flight < self._capacity():
+                future = futures.popleft()
+                if future.done():
+                    continue
+                self.in_flight += 1
+                future.set_result(None)
+
+    def _shed_bulk(self) -> None:
+        future = self._lanes["bulk"].pop()
+        self._stats["shed_for_interactive"] += 1
+        future.set_exception(AgentOverloadedError(
+            "Shed to make room for interactive requests", self.retry_after(),
+        ))
+
+    def _discard(self, lane: str, future: asyncio.Future) -> None:
+        try:
+            self._lanes[lane].remove(future)
+        except ValueError:
+            pass
+
+
+def _is_overload(error: BaseException) -> bool:
+    """Whether an error (or one it was raised from) means the model is saturated"""
+    seen = 0
+    while error is not None and seen < 5:
+        if isinstance(error, (httpx.TimeoutException, asyncio.TimeoutError)):
+            return True
+        if isinstance(error, httpx.HTTPStatusError) and error.response.status_code in (429, 503):
+            return True
+        error = error.__cause__ or error.__context__
+        seen += 1
+    return False
@@ -0,0 +1,210 @@
+"""Prometheus metrics and request tracing
+
+Per-stage timings go to one histogram, tanggap_stage_seconds{stage}:
+
+- session_create: creating an agent session
+- limiter_wait: time queued behind the adaptive concurrency limit
+- agent_first_token: from sending the prompt to the first model text
+- agent_generate: from the first model text to a complete analysis
+- agent_call: the whole agent (or direct Ollama) call
+- json_extract: the extract_json_from_text fallback
+- bq_insert: one BigQuery batch write (also tagged by BQ_WRITE_API)
+
+HTTP requests are counted and timed per route template. The counters
+behind the JSON stats endpoints (caches, coalescing, limiter, parser,
+writer, jobs) are exported as gauges when /metrics is scraped.
+
+Every request gets a trace id: from an incoming W3C ``traceparent``,
+Cloud Run's ``X-Cloud-Trace-Context`` or ``X-Trace-Id``, else a new one.
+It is returned in ``X-Trace-Id`` and sent to the agent and Ollama as
+``traceparent``, so the agent logs and records the same id. Requests
+slower than SLOW_REQUEST_MS are logged with their trace id and stage
+breakdown, which is also returned in a ``Server-Timing`` header.
+"""
+import contextvars
+import os
+import re
+import secrets
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "5000"))
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    "tanggap_stage_seconds", "Time spent per analysis stage", ["stage"], buckets=BUCKETS,
+)
+HTTP_REQUESTS = Counter(
+    "tanggap_http_requests_total", "HTTP requests by route and status", ["method", "route", "status"],
+)
+HTTP_SECONDS = Histogram(
+    "tanggap_http_request_seconds", "HTTP request latency by route, until the last body byte",
+    ["method", "route"], buckets=BUCKETS,
+)
+ANALYSES = Counter(
+    "tanggap_analyses_total", "Analyses by where the answer came from", ["source"],
+)
+AGENT_CALLS = Counter(
+    "tanggap_agent_calls_total", "Agent (or direct Ollama) calls by outcome", ["engine", "outcome"],
+)
+BQ_INSERT_ERRORS = Counter(
+    "tanggap_bq_insert_errors_total", "BigQuery batch writes that raised", ["api"],
+)
+BQ_INSERT_ROWS = Counter(
+    "tanggap_bq_insert_rows_total", "Rows sent to BigQuery by outcome", ["api", "outcome"],
+)
+
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-[0-9a-f]{16}-[0-9a-f]{2}$")
+_TRACE_ID = re.compile(r"^[0-9a-fA-F]{32}$")
+
+_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_id", default=None)
+_stages: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("stages", default=None)
+
+
+def observe(stage: str, seconds: float) -> None:
+    """Record a stage duration, also against the current request's breakdown"""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    stages = _stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as one stage, whether or not it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+
+def trace_id() -> Optional[str]:
+    """Trace id of the request being served, if any"""
+    return _trace_id.get()
+
+
+@contextmanager
+def traced(current: Optional[str]):
+    """Run the enclosed block under ``current`` (e.g. the trace of the request that queued the work)"""
+    token = _trace_id.set(current)
+    try:
+        yield
+    finally:
+        _trace_id.reset(token)
+
+
+def trace_headers() -> Dict[str, str]:
+    """Headers that carry the current trace to the agent or Ollama"""
+    current = _trace_id.get()
+    if current is None:
+        return {}
+    return {"traceparent": f"00-{current}-{secrets.token_hex(8)}-01"}
+
+
+def incoming_trace_id(headers: Dict[str, str]) -> str:
+    """Trace id from the request headers, or a new one"""
+    match = _TRACEPARENT.match(headers.get("traceparent", "").strip())
+    if match:
+        return match.group(1)
+    cloud = headers.get("x-cloud-trace-context", "").split("/", 1)[0]
+    for candidate in (cloud, headers.get("x-trace-id", "")):
+        if _TRACE_ID.match(candidate):
+            return candidate.lower()
+    return secrets.token_hex(16)
+
+
+_stats_sources: Dict[str, Callable[[], Dict]] = {}
+
+
+def register_stats(section: str, source: Callable[[], Dict]) -> None:
+    """Export the numbers in ``source()`` as tanggap_<section>_<key> gauges on scrape"""
+    _stats_sources[section] = source
+
+
+class _StatsCollector:
+    def collect(self):
+        for section, source in list(_stats_sources.items()):
+            try:
+                values = source()
+            except Exception as e:
+                print(f"⚠️ Metrics source {section} failed: {e}")
+                continue
+            for key, value in _flatten(values):
+                name = re.sub(r"[^a-zA-Z0-9_]", "_", f"tanggap_{section}_{key}")
+                yield GaugeMetricFamily(name, f"{key} from the {section} stats", value=value)
+
+
+def _flatten(values: Dict, prefix: str = ""):
+    for key, value in values.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}_")
+        elif isinstance(value, (bool, int, float)):
+            yield f"{prefix}{key}", float(value)
+
+
+REGISTRY.register(_StatsCollector())
+
+
+def render() -> tuple:
+    """Current metrics in the Prometheus text format, and its content type"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """Time every HTTP request and bind its trace id (plain ASGI, so streaming responses pass through)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        current = incoming_trace_id(headers)
+        trace_token = _trace_id.set(current)
+        stages: Dict[str, float] = {}
+        stages_token = _stages.set(stages)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                extra = [(b"x-trace-id", current.encode())]
+                if stages:
+                    extra.append((b"server-timing", _server_timing(stages).encode()))
+                message = {**message, "headers": [*message.get("headers", []), *extra]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = _route(scope)
+            HTTP_REQUESTS.labels(scope["method"], route, str(status)).inc()
+            HTTP_SECONDS.labels(scope["method"], route).observe(elapsed)
+            if elapsed * 1000 >= SLOW_REQUEST_MS:
+                print(
+                    f"⚠️ Slow request trace={current} {scope['method']} {route} {status} "
+                    f"{elapsed * 1000:.0f}ms {_server_timing(stages)}"
+                )
+            _stages.reset(stages_token)
+            _trace_id.reset(trace_token)
+
+
+def _route(scope) -> str:
+    """Route template (e.g. /api/jobs/{job_id}) so label values stay bounded"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def _server_timing(stages: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages.items())
@@ -0,0 +1,114 @@
+"""Micro-batching of agent calls
+
+Concurrent analyses are gathered for up to AGENT_BATCH_WINDOW_MS, or until
+AGENT_BATCH_SIZE items are waiting, and sent to the batch agent as one
+prompt, so the instruction and few-shot examples are processed once per
+batch instead of once per item. Items missing from the batch response
+(or every item, if the batch call fails) are retried one by one.
+
+The runners take the lane to run in: a batch runs in the interactive lane
+if any of its items does. With the limiter on, a batch holds one slot for
+all its items; if the limiter sheds it, every item fails with the
+AgentOverloadedError instead of being retried alone.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.services.limiter import AgentOverloadedError
+
+# run_batch(texts, lane) -> {index: analysis}; run_single(text, record_id, lane) -> analysis
+BatchRunner = Callable[[List[str], str], Awaitable[Dict[int, Dict]]]
+SingleRunner = Callable[[str, str, str], Awaitable[Dict]]
+
+
+class MicroBatcher:
+    """Group concurrent submissions into batches of at most ``max_size`` items"""
+
+    def __init__(self, run_batch: BatchRunner, run_single: SingleRunner, max_size: int, window_ms: float):
+        self.run_batch = run_batch
+        self.run_single = run_single
+        self.max_size = max_size
+        self.window_ms = window_ms
+        self._pending: List[tuple] = []  # [(text, record_id, lane, future)]
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self._stats = {"batches": 0, "batched_items": 0, "retried_items": 0, "batch_failures": 0}
+
+    async def submit(self, text: str, record_id: str, lane: str = "interactive") -> Dict:
+        """Queue one item and wait for its analysis"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, record_id, lane, future))
+        if len(self._pending) >= self.max_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_ms / 1000, self._dispatch)
+        return await future
+
+    async def drain(self) -> None:
+        """Send whatever is pending and wait for in-flight batches"""
+        if self._pending:
+            self._dispatch()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            **self._stats,
+            "max_size": self.max_size,
+            "window_ms": self.window_ms,
+            "pending": len(self._pending),
+            "in_flight_batches": len(self._tasks),
+        }
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[tuple]) -> None:
+        if len(batch) == 1:
+            # Nothing to amortize; the single-item agent is the cheaper prompt
+            await self._run_one(*batch[0])
+            return
+
+        self._stats["batches"] += 1
+        lane = "interactive" if any(item[2] == "interactive" for item in batch) else "bulk"
+        try:
+            results = await self.run_batch([text for text, _, _, _ in batch], lane)
+        except AgentOverloadedError as e:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except Exception as e:
+            print(f"⚠️ Batch of {len(batch)} failed, retrying items individually: {e}")
+            self._stats["batch_failures"] += 1
+            results = {}
+
+        retry = []
+        for index, (text, record_id, item_lane, future) in enumerate(batch):
+            analysis = results.get(index)
+            if analysis is None:
+                retry.append((text, record_id, item_lane, future))
+            elif not future.done():
+                future.set_result(analysis)
+        self._stats["batched_items"] += len(batch) - len(retry)
+        self._stats["retried_items"] += len(retry)
+        await asyncio.gather(*(self._run_one(*item) for item in retry))
+
+    async def _run_one(self, text: str, record_id: str, lane: str, future: asyncio.Future) -> None:
+        if future.done():
+            return
+        try:
+            analysis = await self.run_single(text, record_id, lane)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(analysis)
@@ -0,0 +1,220 @@
+"""Direct Ollama engine for agent_client
+
+The analysis is single-turn and uses no tools, so the ADK hop (session
+creation, /run_sse, LiteLLM) only adds latency and session state. With
+AGENT_ENGINE=ollama the backend calls Ollama's /api/chat itself. It sends
+the same TANGGAP_INSTRUCTION as the system prompt and asks for output
+that matches the analysis schema (ModelAnalysis).
+
+The instructions come from files (OLLAMA_INSTRUCTION_PATH,
+OLLAMA_BATCH_INSTRUCTION_PATH) or from the agent's /agent-info at startup.
+
+The system prompt is the same string on every call, so Ollama can reuse
+the KV cache of that prefix and only prefill the short feedback. At startup
+the prefix is primed, and num_keep pins the instruction tokens if the
+context ever shifts. keep_alive is left to the Ollama server unless
+OLLAMA_KEEP_ALIVE is set.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from app.models import ModelAnalysis
+from app.services import metrics
+from app.services.sse_parser import REQUIRED_FIELDS, JSONObjectScanner, parse_stats
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", os.getenv("GEMMA_MODEL_NAME", "gemma3:4b"))
+# Empty = the server's own OLLAMA_KEEP_ALIVE (-1, never unload, in ollama-backend)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "")
+OLLAMA_FORMAT = os.getenv("OLLAMA_FORMAT", "schema")  # "schema" (structured outputs) or "json"
+OLLAMA_INSTRUCTION_PATH = os.getenv("OLLAMA_INSTRUCTION_PATH", "")
+OLLAMA_BATCH_INSTRUCTION_PATH = os.getenv("OLLAMA_BATCH_INSTRUCTION_PATH", "")
+OLLAMA_NUM_KEEP = int(os.getenv("OLLAMA_NUM_KEEP", "0"))  # 0 = estimate from the instruction
+OLLAMA_PRIME = os.getenv("OLLAMA_PRIME", "true").lower() == "true"
+
+# Derived from the model so the enums and priority bounds stay in one place;
+# with OLLAMA_FORMAT=schema, Ollama turns it into a grammar and the model
+# cannot write anything else (nor anything after the closing brace)
+ANALYSIS_SCHEMA = ModelAnalysis.model_json_schema()
+
+
+def batch_schema(size: int) -> Dict:
+    """Schema of a batch answer: exactly ``size`` analyses, each with its input index"""
+    return {
+        "type": "array",
+        "items": {
+            **ANALYSIS_SCHEMA,
+            "properties": {"index": {"type": "integer", "minimum": 0, "maximum": size - 1}, **ANALYSIS_SCHEMA["properties"]},
+            "required": ["index", *ANALYSIS_SCHEMA["required"]],
+        },
+        "minItems": size,
+        "maxItems": size,
+    }
+
+
+_instructions: Dict[str, Optional[str]] = {"single": None, "batch": None}
+
+
+def configure(agent_info: Optional[Dict]) -> Optional[Dict]:
+    """Load the instructions and return the cache fingerprint for this engine
+
+    Files take precedence over the texts served by the agent.
+    """
+    for kind, path, field in (
+        ("single", OLLAMA_INSTRUCTION_PATH, "instruction"),
+        ("batch", OLLAMA_BATCH_INSTRUCTION_PATH, "batch_instruction"),
+    ):
+        if path:
+            with open(path, encoding="utf-8") as f:
+                _instructions[kind] = f.read()
+        elif agent_info and agent_info.get(field):
+            _instructions[kind] = agent_info[field]
+
+    instruction = _instructions["single"]
+    if instruction is None:
+        print("❌ Ollama engine has no instruction: set OLLAMA_INSTRUCTION_PATH or make /agent-info reachable")
+        return None
+    print(f"✅ Ollama engine ready: {OLLAMA_URL} model={OLLAMA_MODEL}")
+    return {
+        "model": OLLAMA_MODEL,
+        "instruction_sha256": hashlib.sha256(instruction.encode("utf-8")).hexdigest(),
+    }
+
+
+def _instruction(kind: str) -> str:
+    if _instructions[kind] is None:
+        raise RuntimeError(f"Ollama engine has no {kind} instruction configured")
+    return _instructions[kind]
+
+
+def _options(system: str) -> Dict:
+    # Roughly 3 characters per Gemma token
+    return {"num_keep": OLLAMA_NUM_KEEP or len(system) // 3}
+
+
+def _keep_alive() -> Dict:
+    # Only when configured: a per-request value overrides the server's default
+    return {"keep_alive": OLLAMA_KEEP_ALIVE} if OLLAMA_KEEP_ALIVE else {}
+
+
+async def prime(client: httpx.AsyncClient) -> None:
+    """Prefill the instruction prefixes once so the first real request reuses them"""
+    if not OLLAMA_PRIME:
+        return
+    for kind, instruction in _instructions.items():
+        if instruction is None:
+            continue
+        started = time.perf_counter()
+        try:
+            response = await client.post(
+                f"{OLLAMA_URL}/api/chat",
+                json={
+                    "model": OLLAMA_MODEL,
+                    "messages": [{"role": "system", "content": instruction}, {"role": "user", "content": ""}],
+                    "stream": False,
+                    **_keep_alive(),
+                    "options": {**_options(instruction), "num_predict": 1},
+                },
+                headers=metrics.trace_headers(),
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"⚠️ Could not prime Ollama {kind} prefix: {e}")
+            continue
+        print(f"✅ Primed Ollama {kind} prefix in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+
+async def chat(client: httpx.AsyncClient, system: str, prompt: str, schema: Dict) -> Tuple[str, Dict]:
+    """Run one streamed /api/chat completion and return its text and run stats
+    
+    Run stats hold token counts, time to first token and Ollama's own
+    prompt-eval time, which drops when the prefix cache is hit.
+    """
+    started = time.perf_counter()
+    ttft_ms = None
+    parts = []
+    final: Dict = {}
+    async with client.stream(
+        "POST",
+        f"{OLLAMA_URL}/api/chat",
+        json={
+            "model": OLLAMA_MODEL,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt},
+            ],
+            "stream": True,
+            "format": schema if OLLAMA_FORMAT == "schema" else "json",
+            **_keep_alive(),
+            "options": _options(system),
+        },
+        headers=metrics.trace_headers(),
+    ) as response:
+        if response.is_error:
+            await response.aread()
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            content = (chunk.get("message") or {}).get("content")
+            if content:
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+                parts.append(content)
+            if chunk.get("done"):
+                final = chunk
+
+    run = {
+        "prompt_tokens": final.get("prompt_eval_count") or 0,
+        "output_tokens": final.get("eval_count") or 0,
+        "ttft_ms": ttft_ms,
+        "total_ms": (time.perf_counter() - started) * 1000,
+        "prefill_ms": (final.get("prompt_eval_duration") or 0) / 1e6,
+    }
+    return "".join(parts), run
+
+
+async def analyze(client: httpx.AsyncClient, prompt: str) -> Tuple[Dict, Dict]:
+    """Analyze one feedback prompt; returns the analysis dict and run stats"""
+    from app.services.agent_client import extract_json_from_text
+
+    content, run = await chat(client, _instruction("single"), prompt, ANALYSIS_SCHEMA)
+    try:
+        analysis = json.loads(content)
+    except json.JSONDecodeError:
+        try:
+            analysis = extract_json_from_text(content)
+        except ValueError:
+            parse_stats["failures"] += 1
+            raise
+        parse_stats["fallback_extract"] += 1
+    if not isinstance(analysis, dict):
+        parse_stats["failures"] += 1
+        raise ValueError(f"Expected a JSON object from Ollama, got: {content[:200]}")
+    missing = [f for f in REQUIRED_FIELDS if f not in analysis]
+    if missing:
+        parse_stats["failures"] += 1
+        raise ValueError(f"Missing required fields: {missing}. Got fields: {list(analysis.keys())}")
+    return analysis, run
+
+
+async def analyze_batch(client: httpx.AsyncClient, prompt: str, size: int) -> Tuple[Dict[int, Dict], Dict]:
+    """Analyze a batch prompt; returns the complete analyses keyed by index and run stats"""
+    content, run = await chat(client, _instruction("batch"), prompt, batch_schema(size))
+    results: Dict[int, Dict] = {}
+    for source in JSONObjectScanner().feed(content):
+        try:
+            analysis = json.loads(source)
+        except json.JSONDecodeError:
+            continue
+        index = analysis.pop("index", None)
+        if isinstance(index, int) and 0 <= index < size and all(f in analysis for f in REQUIRED_FIELDS):
+            results.setdefault(index, analysis)
+    return results, run
+
@@ -0,0 +1,206 @@
+"""Lexicon pre-classifier in front of the model
+
+Much of the traffic is short and unambiguous ("mantap", "great product",
+"telat banget"). Such text is scored against small English and Indonesian
+lexicons. When sentiment and category are clear, every word is known and
+nothing negates or questions it, the analysis is answered locally. It gets
+a rule-based priority and templated root_cause and recommendation.
+Complaints that name no topic ("lama", "kurang") need the model to tell
+what went wrong; only praise without a topic ("mantap") is answered
+locally, with a general root cause. Everything else goes to the model.
+"""
+import os
+import re
+from collections import Counter
+from typing import Dict, Optional
+
+from app.services.analysis_cache import normalize_text
+
+PRECLASSIFIER_ENABLED = os.getenv("PRECLASSIFIER_ENABLED", "true").lower() == "true"
+PRECLASSIFIER_THRESHOLD = float(os.getenv("PRECLASSIFIER_THRESHOLD", "0.9"))
+PRECLASSIFIER_MAX_WORDS = int(os.getenv("PRECLASSIFIER_MAX_WORDS", "6"))
+# Category for clearly positive text that names no topic ("mantap")
+PRECLASSIFIER_DEFAULT_CATEGORY = os.getenv("PRECLASSIFIER_DEFAULT_CATEGORY", "product")
+
+POSITIVE = {
+    "good", "great", "excellent", "amazing", "awesome", "love", "nice", "perfect", "best", "fast",
+    "satisfied", "happy", "recommended", "recommend", "thanks", "helpful", "friendly", "smooth",
+    "mantap", "mantul", "bagus", "keren", "puas", "cepat", "makasih", "terimakasih", "suka",
+    "rekomen", "rekomended", "top", "ramah", "sip", "memuaskan", "lancar", "sesuai",
+}
+NEGATIVE = {
+    "bad", "terrible", "awful", "worst", "late", "slow", "broken", "damaged", "wrong", "error",
+    "crash", "crashes", "rude", "disappointed", "disappointing", "missing", "lost", "poor", "failed",
+    "useless", "scam", "delayed", "overcharged",
+    "telat", "lambat", "lama", "rusak", "jelek", "buruk", "kecewa", "mengecewakan", "parah", "salah",
+    "gagal", "kasar", "hilang", "lemot", "penipuan", "cacat", "kurang", "nyesel",
+}
+CATEGORIES = {
+    "delivery": {
+        "delivery", "shipping", "courier", "package", "arrived", "late", "delayed", "kirim", "pengiriman",
+        "kurir", "paket", "sampai", "ongkir", "telat", "dikirim", "ekspedisi",
+    },
+    "product": {
+        "product", "quality", "item", "size", "material", "damaged", "broken", "produk", "barang",
+        "kualitas", "ukuran", "bahan", "rusak", "cacat", "original", "ori",
+    },
+    "service": {
+        "service", "support", "staff", "admin", "seller", "response", "rude", "friendly", "helpful",
+        "pelayanan", "layanan", "cs", "penjual", "respon", "ramah", "kasar",
+    },
+    "payment": {
+        "payment", "pay", "refund", "charged", "overcharged", "price", "bill", "bayar", "pembayaran",
+        "transfer", "tagihan", "saldo", "cod", "harga", "dana", "ovo", "gopay",
+    },
+    "technical": {
+        "app", "website", "web", "login", "error", "bug", "crash", "crashes", "loading", "server",
+        "aplikasi", "apk", "lemot", "update", "checkout",
+    },
+}
+INTENSIFIERS = {"very", "so", "really", "extremely", "banget", "bgt", "sangat", "sekali", "amat", "parah", "pisan"}
+NEGATIONS = {"not", "no", "never", "dont", "didnt", "isnt", "wasnt", "tidak", "tak", "nggak", "ngga", "gak", "ga", "enggak", "bukan", "belum", "jangan"}
+# Words that carry no signal but should not count as unknown
+FILLER = {
+    "the", "a", "an", "is", "was", "it", "this", "my", "and", "nya",
+    "yang", "dan", "sih", "deh", "kak", "gan", "min", "saya", "aku", "ini", "itu", "sudah", "udah",
+    "day", "days", "week", "weeks", "hari", "minggu", "jam",
+}
+
+KNOWN = POSITIVE | NEGATIVE | INTENSIFIERS | FILLER | set().union(*CATEGORIES.values())
+
+# Priority of negative feedback by category (+1 when intensified); positive is always 1
+NEGATIVE_PRIORITY = {"delivery": 4, "payment": 4, "technical": 3, "product": 3, "service": 3}
+
+ROOT_CAUSES = {
+    ("negative", "delivery"): "Shipping delay or delivery handling issue",
+    ("negative", "product"): "Product quality does not meet expectations",
+    ("negative", "service"): "Poor customer service experience",
+    ("negative", "payment"): "Payment or billing problem",
+    ("negative", "technical"): "Application or website malfunction",
+    ("positive", "delivery"): "Fast and reliable delivery",
+    ("positive", "product"): "Product meets or exceeds expectations",
+    ("positive", "service"): "Helpful and friendly customer service",
+    ("positive", "payment"): "Smooth payment experience",
+    ("positive", "technical"): "Application works well",
+}
+GENERAL_ROOT_CAUSE = "General satisfaction; no specific aspect mentioned"
+GENERAL_RECOMMENDATION = "Keep current standards"
+RECOMMENDATIONS = {
+    ("negative", "delivery"): "Review courier performance and improve delivery tracking",
+    ("negative", "product"): "Check quality control for this product",
+    ("negative", "service"): "Follow up with the customer and review support handling",
+    ("negative", "payment"): "Investigate the transaction and resolve billing issues",
+    ("negative", "technical"): "Investigate and fix the reported technical issue",
+    ("positive", "delivery"): "Maintain current delivery standards",
+    ("positive", "product"): "Maintain current product quality",
+    ("positive", "service"): "Recognize the support team and keep service standards",
+    ("positive", "payment"): "Keep the payment flow as is",
+    ("positive", "technical"): "Keep the application stable",
+}
+
+_QUESTION = re.compile(r"\?")
+
+
+class PreClassifier:
+    """Answer short, unambiguous feedback locally and count what is offloaded"""
+
+    def __init__(self, threshold: float = PRECLASSIFIER_THRESHOLD, max_words: int = PRECLASSIFIER_MAX_WORDS):
+        self.threshold = threshold
+        self.max_words = max_words
+        self._stats = {"checked": 0, "offloaded": 0, "routed_to_model": 0}
+        self._offloaded_by: Counter = Counter()  # "sentiment/category" -> n
+
+    def classify(self, feedback_text: str) -> Optional[Dict]:
+        """Return an analysis dict when confident, otherwise None"""
+        self._stats["checked"] += 1
+        analysis = self._classify(feedback_text)
+        if analysis is None:
+            self._stats["routed_to_model"] += 1
+            return None
+        self._stats["offloaded"] += 1
+        self._offloaded_by[f"{analysis['sentiment']}/{analysis['category']}"] += 1
+        return analysis
+
+    def score(self, feedback_text: str) -> Dict:
+        """Sentiment, category and confidence, without applying the threshold"""
+        words = normalize_text(feedback_text).split()
+        positive = [w for w in words if w in POSITIVE]
+        negative = [w for w in words if w in NEGATIVE]
+        polar = len(positive) + len(negative)
+
+        sentiment = None
+        sentiment_conf = 0.0
+        if polar:
+            sentiment = "positive" if len(positive) > len(negative) else "negative"
+            sentiment_conf = max(len(positive), len(negative)) / polar
+
+        hits = Counter(category for w in words for category, lexicon in CATEGORIES.items() if w in lexicon)
+        ranked = hits.most_common(2)
+        if not ranked:
+            # A topicless complaint needs the model; topicless praise does not
+            category, category_conf = PRECLASSIFIER_DEFAULT_CATEGORY, 1.0 if sentiment == "positive" else 0.0
+        elif len(ranked) == 1 or ranked[0][1] > ranked[1][1]:
+            category, category_conf = ranked[0][0], 1.0
+        else:
+            category, category_conf = ranked[0][0], 0.5
+
+        coverage = sum(w in KNOWN or w.isdigit() for w in words) / len(words) if words else 0.0
+        confidence = sentiment_conf * category_conf * coverage
+        if (
+            not words
+            or len(words) > self.max_words
+            or any(w in NEGATIONS for w in words)
+            or _QUESTION.search(feedback_text)
+        ):
+            confidence = 0.0
+
+        return {
+            "sentiment": sentiment,
+            "category": category,
+            "confidence": round(confidence, 3),
+            "keywords": list(dict.fromkeys(
+                w for w in words if w in KNOWN and w not in FILLER and w not in INTENSIFIERS
+            ))[:5],
+            "intensified": any(w in INTENSIFIERS for w in words),
+            "topic": bool(ranked),
+        }
+
+    def stats(self) -> Dict:
+        checked = self._stats["checked"]
+        return {
+            "enabled": PRECLASSIFIER_ENABLED,
+            "threshold": self.threshold,
+            "max_words": self.max_words,
+            **self._stats,
+            "offload_ratio": round(self._stats["offloaded"] / checked, 4) if checked else 0.0,
+            "offloaded_by": dict(self._offloaded_by),
+        }
+
+    def _classify(self, feedback_text: str) -> Optional[Dict]:
+        result = self.score(feedback_text)
+        if result["sentiment"] is None or result["confidence"] < self.threshold:
+            return None
+        sentiment, category = result["sentiment"], result["category"]
+        if sentiment == "negative":
+            priority = min(5, NEGATIVE_PRIORITY[category] + result["intensified"])
+        else:
+            priority = 1
+        return {
+            "sentiment": sentiment,
+            "category": category,
+            "priority": priority,
+            "keywords": result["keywords"] or [category],
+            "root_cause": ROOT_CAUSES[(sentiment, category)] if result["topic"] else GENERAL_ROOT_CAUSE,
+            "recommendation": RECOMMENDATIONS[(sentiment, category)] if result["topic"] else GENERAL_RECOMMENDATION,
+            "summary": _summary(sentiment, category, feedback_text),
+        }
+
+
+def _summary(sentiment: str, category: str, feedback_text: str) -> str:
+    text = feedback_text.strip()
+    if len(text) > 80:
+        text = text[:77] + "..."
+    return f"Short {sentiment} feedback about {category}: \"{text}\"."
+
+
+preclassifier = PreClassifier()
@@ -0,0 +1,310 @@
+"""Recurring root-cause groups
+
+Stored root_cause strings and keywords are embedded with the semantic
+cache's hashing vectorizer and grouped by incremental leader clustering.
+A row joins the most similar cluster centroid when the cosine similarity
+reaches ROOT_CAUSE_SIMILARITY, otherwise it starts a new cluster.
+Centroids are running means, so a row is processed once and never
+re-clustered.
+
+A background job reads new rows from BigQuery after a (created_at, id)
+watermark, one ROOT_CAUSE_WINDOW_HOURS window at a time, so each query
+reads only a few partitions. The first run backfills the table (only the
+last window when no state is saved) and later runs only pick up new rows,
+including rows written by other instances.
+ROOT_CAUSE_LAG_SECONDS leaves room for rows still in the writer queue.
+With ROOT_CAUSE_STATE_PATH set, centroids, cluster stats and the
+watermark are saved after every page and survive restarts.
+
+Root causes repeat a lot, so each page embeds its distinct texts once and
+assigns them with one matrix product against all centroids; only texts
+that match no existing cluster are handled one by one.
+"""
+import asyncio
+import json
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from app.services.semantic_cache import embed
+
+ROOT_CAUSE_SIMILARITY = float(os.getenv("ROOT_CAUSE_SIMILARITY", "0.5"))
+ROOT_CAUSE_MAX_CLUSTERS = int(os.getenv("ROOT_CAUSE_MAX_CLUSTERS", "5000"))
+ROOT_CAUSE_DIM = int(os.getenv("ROOT_CAUSE_DIM", "512"))
+ROOT_CAUSE_REFRESH_SECONDS = float(os.getenv("ROOT_CAUSE_REFRESH_SECONDS", "60"))
+ROOT_CAUSE_PAGE_ROWS = int(os.getenv("ROOT_CAUSE_PAGE_ROWS", "50000"))
+ROOT_CAUSE_WINDOW_HOURS = float(os.getenv("ROOT_CAUSE_WINDOW_HOURS", "24"))
+ROOT_CAUSE_LAG_SECONDS = float(os.getenv("ROOT_CAUSE_LAG_SECONDS", "120"))
+ROOT_CAUSE_STATE_PATH = os.getenv("ROOT_CAUSE_STATE_PATH", "")  # file prefix, empty = memory only
+# Without saved state every instance start would rescan the table, so default off
+ROOT_CAUSE_ENABLED = os.getenv("ROOT_CAUSE_ENABLED", "true" if ROOT_CAUSE_STATE_PATH else "false").lower() == "true"
+
+CLUSTER_COLUMNS = ("id", "root_cause", "keywords", "sentiment", "category", "priority_score", "created_at")
+MAX_TRACKED = 50  # distinct root_cause strings / keywords kept per cluster
+
+
+def row_text(row: Dict) -> str:
+    return " ".join([row.get("root_cause") or "", *(row.get("keywords") or [])])
+
+
+class RootCauseClusters:
+    """Incremental leader clustering over root_cause + keywords vectors"""
+
+    def __init__(
+        self,
+        similarity: float = ROOT_CAUSE_SIMILARITY,
+        max_clusters: int = ROOT_CAUSE_MAX_CLUSTERS,
+        dim: int = ROOT_CAUSE_DIM,
+        path: str = ROOT_CAUSE_STATE_PATH,
+    ):
+        import numpy as np
+
+        self._np = np
+        self.similarity = similarity
+        self.max_clusters = max_clusters
+        self.dim = dim
+        self.path = path
+        self._lock = threading.Lock()
+        self._sums = np.zeros((0, dim), dtype=np.float32)  # unnormalized centroid sums
+        self._centroids = np.zeros((0, dim), dtype=np.float32)
+        self._clusters: List[Dict] = []
+        self.watermark: Optional[tuple] = None  # (created_at, id) of the last clustered row
+        self.rows_clustered = 0
+        self.refreshed_at: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        if path:
+            self._load()
+
+    def add(self, rows: List[Dict]) -> None:
+        """Assign rows to clusters, creating clusters for unmatched rows"""
+        if not rows:
+            return
+        np = self._np
+        # Root causes repeat a lot; embed and assign each distinct text once
+        unique: Dict[str, int] = {}
+        row_to_text = np.array([unique.setdefault(row_text(row), len(unique)) for row in rows])
+        matrix = np.stack([embed(text, self.dim) for text in unique])
+        weights = np.bincount(row_to_text, minlength=len(unique)).astype(np.float32)
+
+        with self._lock:
+            assigned = np.full(len(unique), -1)
+            if len(self._centroids):
+                similarities = matrix @ self._centroids.T
+                best = similarities.argmax(axis=1)
+                score = similarities[np.arange(len(unique)), best]
+                full = len(self._clusters) >= self.max_clusters
+                matched = score >= self.similarity if not full else np.ones(len(unique), dtype=bool)
+                assigned[matched] = best[matched]
+
+            for i in np.flatnonzero(assigned < 0):
+                assigned[i] = self._assign_one(matrix[i])
+
+            np.add.at(self._sums, assigned, matrix * weights[:, None])
+            norms = np.linalg.norm(self._sums, axis=1, keepdims=True)
+            self._centroids = self._sums / np.maximum(norms, 1e-9)
+
+            seen: Dict[int, list] = {}
+            for row, cluster_id in zip(rows, assigned[row_to_text].tolist()):
+                self._update_stats(self._clusters[cluster_id], row)
+                if row.get("created_at"):
+                    span = seen.setdefault(cluster_id, [row["created_at"], row["created_at"]])
+                    span[0], span[1] = min(span[0], row["created_at"]), max(span[1], row["created_at"])
+            for cluster_id, (first, last) in seen.items():
+                cluster = self._clusters[cluster_id]
+                cluster["first_seen"] = min(cluster["first_seen"] or _iso(first), _iso(first))
+                cluster["last_seen"] = max(cluster["last_seen"] or _iso(last), _iso(last))
+            self.rows_clustered += len(rows)
+
+    def groups(self, limit: int = 20, sentiment: str = None, category: str = None, min_count: int = 1) -> Dict:
+        """Largest clusters first, optionally restricted to a sentiment or category"""
+        with self._lock:
+            clusters = [
+                c for c in self._clusters
+                if c["count"] >= min_count
+                and (not sentiment or c["sentiment"].get(sentiment))
+                and (not category or c["category"].get(category))
+            ]
+            clusters.sort(key=lambda c: c["count"], reverse=True)
+            total = self.rows_clustered
+            return {
+                "clusters": len(self._clusters),
+                "rows_clustered": total,
+                "watermark": _iso(self.watermark[0]) if self.watermark else None,
+                "refreshed_at": self.refreshed_at,
+                "groups": [_public(c, total) for c in clusters[:limit]],
+            }
+
+    def refresh(self) -> int:
+        """Cluster rows written since the watermark (blocking); returns rows added"""
+        from app.services.bq_client import query_min_created_at, query_rows_after
+
+        caught_up = datetime.now(timezone.utc) - timedelta(seconds=ROOT_CAUSE_LAG_SECONDS)
+        if self.watermark is None and not self.path:
+            # Memory-only state is lost on restart; cluster the last window instead of the whole table
+            self.watermark = (caught_up - timedelta(hours=ROOT_CAUSE_WINDOW_HOURS), "")
+        if self.watermark is None:
+            first = query_min_created_at()
+            if first is None:
+                return 0
+            self.watermark = (_as_utc(first) - timedelta(microseconds=1), "")
+
+        added = 0
+        while True:
+            until = min(self.watermark[0] + timedelta(hours=ROOT_CAUSE_WINDOW_HOURS), caught_up)
+            rows = query_rows_after(self.watermark, until, ROOT_CAUSE_PAGE_ROWS, CLUSTER_COLUMNS)
+            self.add(rows)
+            added += len(rows)
+            if len(rows) == ROOT_CAUSE_PAGE_ROWS:
+                self.watermark = (_as_utc(rows[-1]["created_at"]), rows[-1]["id"])
+            elif until > self.watermark[0]:
+                # Window exhausted; rows at exactly ``until`` belong to the next one
+                self.watermark = (until - timedelta(microseconds=1), "￿")
+            self._save()
+            if len(rows) < ROOT_CAUSE_PAGE_ROWS and until >= caught_up:
+                break
+        self.refreshed_at = _iso(datetime.now(timezone.utc))
+        return added
+
+    async def start(self) -> None:
+        if self._task is None and ROOT_CAUSE_REFRESH_SECONDS > 0:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                added = await asyncio.to_thread(self.refresh)
+                if added:
+                    print(f"✅ Clustered {added} new root causes ({len(self._clusters)} groups)")
+            except Exception as e:
+                print(f"⚠️ Root-cause refresh failed: {e}")
+            await asyncio.sleep(ROOT_CAUSE_REFRESH_SECONDS)
+
+    def _assign_one(self, vector) -> int:
+        """Leader step for a row no existing centroid matched (lock held)"""
+        np = self._np
+        if len(self._clusters) and len(self._clusters) >= self.max_clusters:
+            return int((self._centroids @ vector).argmax())
+        if len(self._centroids):
+            # Clusters created earlier in this page are not in the batch product
+            similarities = self._centroids @ vector
+            best = int(similarities.argmax())
+            if similarities[best] >= self.similarity:
+                return best
+        self._sums = np.vstack([self._sums, np.zeros((1, self.dim), dtype=np.float32)])
+        self._centroids = np.vstack([self._centroids, vector[None, :]])
+        self._clusters.append({
+            "id": len(self._clusters),
+            "count": 0,
+            "priority_sum": 0,
+            "root_causes": Counter(),
+            "keywords": Counter(),
+            "sentiment": Counter(),
+            "category": Counter(),
+            "first_seen": None,
+            "last_seen": None,
+        })
+        return len(self._clusters) - 1
+
+    def _update_stats(self, cluster: Dict, row: Dict) -> None:
+        cluster["count"] += 1
+        cluster["priority_sum"] += int(row.get("priority_score") or 0)
+        cluster["sentiment"][row.get("sentiment")] += 1
+        cluster["category"][row.get("category")] += 1
+        if row.get("root_cause"):
+            cluster["root_causes"][row["root_cause"].strip()] += 1
+        cluster["keywords"].update(k.strip().lower() for k in row.get("keywords") or [] if k.strip())
+        for field in ("root_causes", "keywords"):
+            if len(cluster[field]) > MAX_TRACKED * 2:
+                cluster[field] = Counter(dict(cluster[field].most_common(MAX_TRACKED)))
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        np = self._np
+        with self._lock:
+            state = {
+                "dim": self.dim,
+                "watermark": [_iso(self.watermark[0]), self.watermark[1]] if self.watermark else None,
+                "rows_clustered": self.rows_clustered,
+                "clusters": self._clusters,
+            }
+            with open(f"{self.path}.npy.tmp", "wb") as f:
+                np.save(f, self._sums)
+            with open(f"{self.path}.json.tmp", "w", encoding="utf-8") as f:
+                json.dump(state, f)
+        # Vectors first: a crash between the two renames re-clusters at most one page
+        os.replace(f"{self.path}.npy.tmp", f"{self.path}.npy")
+        os.replace(f"{self.path}.json.tmp", f"{self.path}.json")
+
+    def _load(self) -> None:
+        np = self._np
+        if not (os.path.exists(f"{self.path}.json") and os.path.exists(f"{self.path}.npy")):
+            return
+        with open(f"{self.path}.json", encoding="utf-8") as f:
+            state = json.load(f)
+        sums = np.load(f"{self.path}.npy")
+        if state["dim"] != self.dim or len(sums) != len(state["clusters"]):
+            print(f"⚠️ Root-cause state at {self.path} does not match, starting over")
+            return
+        self._sums = sums
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        self._centroids = sums / np.maximum(norms, 1e-9)
+        self._clusters = state["clusters"]
+        for cluster in self._clusters:
+            for field in ("root_causes", "keywords", "sentiment", "category"):
+                cluster[field] = Counter(cluster[field])
+        if state["watermark"]:
+            self.watermark = (datetime.fromisoformat(state["watermark"][0].replace("Z", "+00:00")), state["watermark"][1])
+        self.rows_clustered = state["rows_clustered"]
+        print(f"✅ Loaded {len(self._clusters)} root-cause groups from {self.path}")
+
+
+def _public(cluster: Dict, total: int) -> Dict:
+    count = cluster["count"]
+    return {
+        "id": cluster["id"],
+        "label": cluster["root_causes"].most_common(1)[0][0] if cluster["root_causes"] else None,
+        "count": count,
+        "share": round(count / total, 4) if total else 0.0,
+        "avg_priority": round(cluster["priority_sum"] / count, 2) if count else None,
+        "sentiment": dict(cluster["sentiment"]),
+        "category": dict(cluster["category"]),
+        "top_keywords": [k for k, _ in cluster["keywords"].most_common(10)],
+        "examples": [r for r, _ in cluster["root_causes"].most_common(5)],
+        "first_seen": cluster["first_seen"],
+        "last_seen": cluster["last_seen"],
+    }
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _iso(value) -> str:
+    if isinstance(value, str):
+        return value
+    # Fixed width, so the strings sort like the timestamps
+    return _as_utc(value).isoformat(timespec="microseconds").replace("+00:00", "Z")
+
+
+def _create() -> Optional[RootCauseClusters]:
+    if not ROOT_CAUSE_ENABLED:
+        return None
+    try:
+        return RootCauseClusters()
+    except ImportError:
+        print("⚠️ numpy not installed, root-cause clustering disabled")
+        return None
+
+
+root_cause_clusters = _create()
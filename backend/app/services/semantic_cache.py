@@ -0,0 +1,276 @@
+"""Similarity cache of agent analyses
+
+The exact-match cache misses paraphrases such as "pengiriman telat" and
+"delivery was late". Here, analyzed feedback is embedded on the CPU with a
+hashing vectorizer: common Indonesian words are mapped to English, then
+word unigrams and bigrams are hashed into SEMANTIC_CACHE_DIM buckets.
+Intensifiers fold onto a "very" token that is kept, since "telat banget"
+may deserve a higher priority than "telat". A new item whose cosine
+similarity to a stored one reaches SEMANTIC_CACHE_THRESHOLD reuses that
+analysis's sentiment, category and priority, but only when both texts
+carry the same sentiment, negation and intensity words: a bag of words
+scores "very friendly" and "very rude" as near neighbours. The neighbour's
+root_cause and summary describe another text, so they are never reused;
+the hit gets templated ones instead. Off by default.
+
+Search is a brute-force NumPy dot product, a few milliseconds for tens of
+thousands of entries, run off the event loop like the writes. With
+SEMANTIC_CACHE_PATH set, vectors live in a memory-mapped .npy file and the
+analyses in a JSONL sidecar, so the index is available immediately after
+a restart. When full, the oldest slots are overwritten.
+"""
+import json
+import os
+import threading
+import zlib
+from typing import Dict, List, Optional
+
+from app.services.analysis_cache import CACHED_FIELDS, analysis_cache, normalize_text
+from app.services.preclassifier import NEGATIVE, POSITIVE, RECOMMENDATIONS, ROOT_CAUSES
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "512"))
+SEMANTIC_CACHE_MAX_ITEMS = int(os.getenv("SEMANTIC_CACHE_MAX_ITEMS", "50000"))
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "")  # file prefix, empty = memory only
+
+# Indonesian (and informal) words folded onto one English form, so both
+# languages land on the same features
+SYNONYMS = {
+    "pengiriman": "delivery", "kirim": "delivery", "dikirim": "delivery", "shipping": "delivery",
+    "kurir": "courier", "paket": "package", "ekspedisi": "courier",
+    "telat": "late", "terlambat": "late", "delayed": "late", "lama": "late",
+    "lambat": "slow", "lemot": "slow",
+    "sampai": "arrived", "datang": "arrived", "nyampe": "arrived",
+    "barang": "product", "produk": "product", "item": "product",
+    "kualitas": "quality", "rusak": "broken", "damaged": "broken", "cacat": "broken",
+    "jelek": "bad", "buruk": "bad", "poor": "bad",
+    "bagus": "good", "baik": "good", "mantap": "great", "mantul": "great", "keren": "great", "excellent": "great",
+    "puas": "satisfied", "kecewa": "disappointed",
+    "pelayanan": "service", "layanan": "service", "cs": "support", "admin": "support",
+    "penjual": "seller", "ramah": "friendly", "kasar": "rude",
+    "bayar": "payment", "pembayaran": "payment", "pay": "payment", "tagihan": "bill",
+    "harga": "price", "mahal": "expensive", "murah": "cheap", "uang": "money", "dana": "money",
+    "aplikasi": "app", "apk": "app", "situs": "website", "web": "website",
+    "cepat": "fast", "gagal": "failed", "hilang": "missing", "salah": "wrong",
+    "tidak": "not", "tak": "not", "gak": "not", "nggak": "not", "ngga": "not", "ga": "not",
+    "enggak": "not", "bukan": "not", "belum": "not", "never": "not", "no": "not",
+    "banget": "very", "bgt": "very", "sangat": "very", "sekali": "very", "really": "very",
+    "hari": "day", "days": "day", "minggu": "week", "weeks": "week", "jam": "hour", "hours": "hour",
+}
+STOPWORDS = {
+    "the", "a", "an", "is", "was", "are", "were", "be", "been", "my", "i", "it", "this", "that", "to", "of",
+    "and", "for", "with", "yang", "dan", "saya", "aku", "ini", "itu", "nya", "sih", "deh", "kak",
+    "sudah", "udah", "di", "ke", "dari", "untuk", "ya", "yg",
+}
+
+# Words a hit must share exactly: sentiment (after folding), negation, intensity
+SIGNAL_WORDS = {SYNONYMS.get(w, w) for w in POSITIVE | NEGATIVE} | {"not", "very"}
+
+
+def tokens(text: str) -> List[str]:
+    """Normalized, language-folded content words"""
+    words = []
+    for word in normalize_text(text).split():
+        if len(word) > 5 and word.endswith("nya"):
+            word = word[:-3]
+        word = SYNONYMS.get(word, word)
+        if word not in STOPWORDS:
+            words.append(word)
+    return words
+
+
+def signature(text: str) -> List[str]:
+    """Sentiment, negation and intensity words a reused analysis must agree on"""
+    return sorted(set(tokens(text)) & SIGNAL_WORDS)
+
+
+def reuse(analysis: Dict, feedback_text: str) -> Dict:
+    """Labels of a neighbour's analysis, with text fields written for this feedback"""
+    sentiment, category = analysis["sentiment"], analysis["category"]
+    words = f" {normalize_text(feedback_text)} "
+    text = feedback_text.strip()
+    if len(text) > 80:
+        text = text[:77] + "..."
+    return {
+        "sentiment": sentiment,
+        "category": category,
+        "priority": analysis["priority"],
+        "keywords": [k for k in analysis["keywords"] if f" {normalize_text(k)} " in words] or [category],
+        "root_cause": ROOT_CAUSES.get((sentiment, category), f"Mixed feedback about {category}"),
+        "recommendation": RECOMMENDATIONS.get((sentiment, category), "Review the feedback for a specific issue"),
+        "summary": f"{sentiment.capitalize()} feedback about {category}: \"{text}\".",
+    }
+
+
+def embed(text: str, dim: int = SEMANTIC_CACHE_DIM):
+    """L2-normalized hashed unigram + bigram vector (float32)"""
+    import numpy as np
+
+    words = tokens(text)
+    vector = np.zeros(dim, dtype=np.float32)
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for feature in features:
+        # crc32 is stable across processes, unlike hash()
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Nearest-neighbor reuse of analyses over hashed text vectors"""
+
+    def __init__(self, dim: int, max_items: int, threshold: float, path: str = ""):
+        import numpy as np
+
+        self._np = np
+        self.dim = dim
+        self.max_items = max_items
+        self.threshold = threshold
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: List[Optional[Dict]] = [None] * max_items  # slot -> {"fingerprint", "signature", "analysis"}
+        self._count = 0  # slots ever written; next slot is _count % max_items
+        self._stats = {"hits": 0, "misses": 0, "rejected": 0, "stores": 0}
+
+        if path:
+            self._vectors = self._open_vectors(f"{path}.npy")
+            self._sidecar_path = f"{path}.jsonl"
+            self._load_sidecar()
+            self._sidecar = open(self._sidecar_path, "a", encoding="utf-8")
+        else:
+            self._vectors = np.zeros((max_items, dim), dtype=np.float32)
+            self._sidecar = None
+
+    def _open_vectors(self, path: str):
+        np = self._np
+        shape = (self.max_items, self.dim)
+        if os.path.exists(path):
+            vectors = np.load(path, mmap_mode="r+")
+            if vectors.shape == shape and vectors.dtype == np.float32:
+                return vectors
+            print(f"⚠️ Semantic cache {path} has shape {vectors.shape}, rebuilding")
+            del vectors
+            os.remove(path)
+            if os.path.exists(f"{self.path}.jsonl"):
+                os.remove(f"{self.path}.jsonl")
+        return np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=shape)
+
+    def _load_sidecar(self) -> None:
+        if not os.path.exists(self._sidecar_path):
+            return
+        with open(self._sidecar_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line after a crash
+                slot = record["slot"]
+                if 0 <= slot < self.max_items:
+                    self._entries[slot] = {
+                        "fingerprint": record["fingerprint"],
+                        "signature": record.get("signature"),
+                        "analysis": record["analysis"],
+                    }
+                self._count = max(self._count, record["seq"] + 1)
+        print(f"✅ Semantic cache loaded {sum(e is not None for e in self._entries)} entries from {self._sidecar_path}")
+
+    def get(self, feedback_text: str) -> Optional[Dict]:
+        """Analysis of the most similar stored feedback, if similar enough"""
+        np = self._np
+        query = embed(feedback_text, self.dim)
+        if not query.any():
+            return None
+        fingerprint = _fingerprint()
+        words = signature(feedback_text)
+        with self._lock:
+            filled = min(self._count, self.max_items)
+            if filled:
+                similarities = self._vectors[:filled] @ query
+                top = np.argpartition(-similarities, min(5, filled) - 1)[:5]
+                for slot in top[np.argsort(-similarities[top])]:
+                    if similarities[slot] < self.threshold:
+                        break
+                    entry = self._entries[slot]
+                    if entry is None or entry["fingerprint"] != fingerprint:
+                        continue
+                    if entry["signature"] != words:
+                        self._stats["rejected"] += 1
+                        continue
+                    self._stats["hits"] += 1
+                    return reuse(entry["analysis"], feedback_text)
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, feedback_text: str, analysis: Dict) -> None:
+        vector = embed(feedback_text, self.dim)
+        if not vector.any():
+            return
+        value = {field: analysis[field] for field in CACHED_FIELDS}
+        fingerprint = _fingerprint()
+        words = signature(feedback_text)
+        with self._lock:
+            seq = self._count
+            slot = seq % self.max_items
+            self._vectors[slot] = vector
+            self._entries[slot] = {"fingerprint": fingerprint, "signature": words, "analysis": value}
+            self._count += 1
+            self._stats["stores"] += 1
+            if self._sidecar is not None:
+                record = {"seq": seq, "slot": slot, "fingerprint": fingerprint, "signature": words, "analysis": value}
+                self._sidecar.write(json.dumps(record) + "\n")
+                self._sidecar.flush()
+                if self._count % self.max_items == 0:
+                    self._compact()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": min(self._count, self.max_items),
+                "threshold": self.threshold,
+                "dim": self.dim,
+                "persistent": self._sidecar is not None,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._sidecar is not None:
+                self._vectors.flush()
+                self._sidecar.close()
+                self._sidecar = None
+
+    def _compact(self) -> None:
+        """Rewrite the sidecar with one line per live slot once it has wrapped"""
+        self._vectors.flush()
+        tmp_path = f"{self._sidecar_path}.tmp"
+        base = self._count - self.max_items
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for offset in range(self.max_items):
+                seq = base + offset
+                entry = self._entries[seq % self.max_items]
+                if entry is not None:
+                    f.write(json.dumps({"seq": seq, "slot": seq % self.max_items, **entry}) + "\n")
+        self._sidecar.close()
+        os.replace(tmp_path, self._sidecar_path)
+        self._sidecar = open(self._sidecar_path, "a", encoding="utf-8")
+
+
+def _fingerprint() -> str:
+    return f"{analysis_cache.model}:{analysis_cache.instruction_sha}"
+
+
+def _create() -> Optional[SemanticCache]:
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    try:
+        return SemanticCache(SEMANTIC_CACHE_DIM, SEMANTIC_CACHE_MAX_ITEMS, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_PATH)
+    except ImportError:
+        print("⚠️ numpy not installed, semantic cache disabled")
+        return None
+
+
+semantic_cache = _create()
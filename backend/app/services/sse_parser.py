@@ -0,0 +1,213 @@
+"""Incremental parser for the agent's /run_sse stream
+
+Text is pulled out of each SSE event as it arrives and scanned for a
+complete top-level JSON object. As soon as an object with every required
+analysis field closes, the parser returns it, so the caller can stop
+reading the stream without waiting for it to end.
+
+BatchStreamParser does the same for the batch agent, collecting one
+analysis per input index until every item has arrived.
+"""
+import json
+import re
+import time
+from typing import Dict, List, Optional
+
+REQUIRED_FIELDS = ("sentiment", "category", "priority", "keywords", "root_cause", "recommendation", "summary")
+
+# Only these characters change the scanner state; everything else is skipped
+_SIGNIFICANT = re.compile(r'[{}"\\]')
+
+# invalid: complete analyses rejected by ModelAnalysis (an unknown
+# sentiment or category, or a priority outside 1-5)
+parse_stats = {"early_complete": 0, "fallback_extract": 0, "failures": 0, "invalid": 0, "batch_missing_items": 0}
+
+
+class JSONObjectScanner:
+    """Find complete top-level JSON objects in text that arrives in chunks"""
+
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._captured: List[str] = []
+
+    def reset(self) -> None:
+        self.__init__()
+
+    def feed(self, text: str) -> List[str]:
+        """Consume a chunk and return the source of every object it completed"""
+        objects = []
+        start = 0 if self._depth else None
+        skip = 0 if self._escape else -1  # index of a backslash-escaped character
+        self._escape = False
+        for match in _SIGNIFICANT.finditer(text):
+            i = match.start()
+            if i == skip:
+                continue
+            char = match.group()
+            if self._in_string:
+                if char == "\\":
+                    if i + 1 < len(text):
+                        skip = i + 1
+                    else:
+                        self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                if self._depth:
+                    self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    start = i
+                self._depth += 1
+            elif char == "}" and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._captured.append(text[start:i + 1])
+                    objects.append("".join(self._captured))
+                    self._captured = []
+                    start = None
+        if self._depth and start is not None:
+            self._captured.append(text[start:])
+        return objects
+
+
+class AgentStreamParser:
+    """Turn /run_sse events into a validated analysis dict as early as possible"""
+
+    def __init__(self, required_fields=REQUIRED_FIELDS):
+        self.required_fields = required_fields
+        self._scanner = JSONObjectScanner()
+        self._texts: List[str] = []
+        self._saw_partial = False
+        self._last_object: Optional[Dict] = None
+        self.usage: Dict = {}  # usageMetadata of the latest event that carried it
+        self.first_text_at: Optional[float] = None  # perf_counter() when the first text arrived
+
+    def feed_line(self, line: str) -> Optional[Dict]:
+        """Feed one SSE line; returns the analysis once it is complete"""
+        if not line.startswith("data: "):
+            return None
+        data_str = line[6:]
+        if not data_str or data_str == "[DONE]":
+            return None
+        try:
+            event = json.loads(data_str)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(event, dict):
+            return None
+        if isinstance(event.get("usageMetadata"), dict):
+            self.usage = event["usageMetadata"]
+
+        partial = bool(event.get("partial"))
+        if not partial and self._saw_partial:
+            # Final aggregated event repeats the streamed deltas; rescan it
+            # from scratch as the authoritative text
+            self._scanner.reset()
+            self._texts = []
+        self._saw_partial = self._saw_partial or partial
+
+        for text in _event_texts(event):
+            if self.first_text_at is None and text:
+                self.first_text_at = time.perf_counter()
+            self._texts.append(text)
+            for source in self._scanner.feed(text):
+                result = self._accept(source)
+                if result is not None:
+                    parse_stats["early_complete"] += 1
+                    return result
+        return None
+
+    def _accept(self, source: str) -> Optional[Dict]:
+        return self._validate(source)
+
+    def finish(self) -> Dict:
+        """Called when the stream ended without a complete analysis"""
+        from app.services.agent_client import extract_json_from_text
+
+        text = "".join(self._texts)
+        if not text:
+            parse_stats["failures"] += 1
+            raise ValueError("No content received from agent")
+        if self._last_object is not None:
+            parse_stats["failures"] += 1
+            missing = [f for f in self.required_fields if f not in self._last_object]
+            raise ValueError(f"Missing required fields: {missing}. Got fields: {list(self._last_object.keys())}")
+
+        try:
+            analysis = extract_json_from_text(text)
+        except ValueError:
+            parse_stats["failures"] += 1
+            raise
+        parse_stats["fallback_extract"] += 1
+        missing = [f for f in self.required_fields if f not in analysis]
+        if missing:
+            parse_stats["failures"] += 1
+            raise ValueError(f"Missing required fields: {missing}. Got fields: {list(analysis.keys())}")
+        return analysis
+
+    def _validate(self, source: str) -> Optional[Dict]:
+        try:
+            candidate = json.loads(source)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(candidate, dict):
+            return None
+        if all(field in candidate for field in self.required_fields):
+            return candidate
+        self._last_object = candidate
+        return None
+
+
+class BatchStreamParser(AgentStreamParser):
+    """Collect the batch agent's per-item analyses, keyed by input index
+
+    The scanner ignores the enclosing array and yields each element object
+    as soon as it closes. ``feed_line`` returns once all ``size`` items are
+    in; ``finish`` returns whatever arrived so missing items can be retried.
+    """
+
+    def __init__(self, size: int, required_fields=REQUIRED_FIELDS):
+        super().__init__(required_fields)
+        self.size = size
+        self.results: Dict[int, Dict] = {}
+
+    def _accept(self, source: str) -> Optional[Dict]:
+        analysis = self._validate(source)
+        if analysis is None:
+            return None
+        index = analysis.pop("index", None)
+        if isinstance(index, int) and 0 <= index < self.size:
+            self.results.setdefault(index, analysis)
+        return self.results if len(self.results) == self.size else None
+
+    def finish(self) -> Dict[int, Dict]:
+        missing = self.size - len(self.results)
+        if missing:
+            parse_stats["batch_missing_items"] += missing
+        if not self.results:
+            parse_stats["failures"] += 1
+        return self.results
+
+
+def _event_texts(event: Dict) -> List[str]:
+    """Text parts carried by an ADK event"""
+    content = event.get("content")
+    if isinstance(content, str):
+        return [content]
+    if isinstance(content, dict):
+        parts = content.get("parts") or []
+    elif isinstance(event.get("message"), dict):
+        parts = event["message"].get("parts") or []
+    else:
+        return []
+    texts = []
+    for part in parts:
+        text = part.get("text") if isinstance(part, dict) else None
+        if isinstance(text, str):
+            texts.append(text)
+        elif isinstance(text, dict):
+            texts.append(json.dumps(text))
+    return texts
@@ -0,0 +1,159 @@
+"""Pre-aggregated analytics for /api/stats
+
+Counts by hour x sentiment x category x priority_score and keyword counts
+per hour are kept in memory and bumped whenever the background writer
+lands rows, so dashboards are answered without a BigQuery job. A periodic
+reconcile replaces settled hours with GROUP BY results from BigQuery, which
+also picks up rows written by other instances and fills memory after a
+restart. An hour has settled once it closed more than
+STATS_RECONCILE_LAG_SECONDS ago, so rows the writer still lands for it are
+not dropped by a snapshot taken before they arrived. The first reconcile
+scans the whole retention; later ones only the last
+STATS_RECONCILE_WINDOW_HOURS settled hours.
+"""
+import asyncio
+import os
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+BUCKET_SECONDS = 3600
+STATS_RETENTION_HOURS = int(os.getenv("STATS_RETENTION_HOURS", str(30 * 24)))
+STATS_RECONCILE_SECONDS = float(os.getenv("STATS_RECONCILE_SECONDS", "900"))
+STATS_RECONCILE_LAG_SECONDS = float(os.getenv("STATS_RECONCILE_LAG_SECONDS", "600"))
+STATS_RECONCILE_WINDOW_HOURS = int(os.getenv("STATS_RECONCILE_WINDOW_HOURS", "24"))
+STATS_MAX_KEYWORDS_PER_BUCKET = 1000
+
+
+def _bucket_of(created_at) -> int:
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return int(created_at.timestamp()) // BUCKET_SECONDS * BUCKET_SECONDS
+
+
+def _iso(bucket: int) -> str:
+    return datetime.fromtimestamp(bucket, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class StatsAggregator:
+    """Hourly rollups maintained incrementally and reconciled with BigQuery"""
+
+    def __init__(self, retention_hours: int = STATS_RETENTION_HOURS):
+        self.retention_hours = retention_hours
+        self._counts: Dict[int, Counter] = defaultdict(Counter)  # bucket -> (sentiment, category, priority) -> n
+        self._keywords: Dict[int, Counter] = defaultdict(Counter)  # bucket -> keyword -> n
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.reconciled_at: Optional[str] = None
+        self._backfilled = False
+
+    def record(self, rows: List[Dict]) -> None:
+        """Add freshly written rows to the rollups"""
+        with self._lock:
+            for row in rows:
+                bucket = _bucket_of(row["created_at"])
+                self._counts[bucket][(row["sentiment"], row["category"], int(row["priority_score"]))] += 1
+                keywords = self._keywords[bucket]
+                keywords.update(k.strip().lower() for k in row.get("keywords") or [] if k.strip())
+                if len(keywords) > STATS_MAX_KEYWORDS_PER_BUCKET * 2:
+                    self._keywords[bucket] = Counter(dict(keywords.most_common(STATS_MAX_KEYWORDS_PER_BUCKET)))
+            self._expire()
+
+    def summary(self, window_hours: int = 24, bucket_hours: int = 1, top_keywords: int = 10) -> Dict:
+        """Counts over the last ``window_hours``, grouped into ``bucket_hours`` buckets"""
+        now = datetime.now(timezone.utc)
+        current = int(now.timestamp()) // BUCKET_SECONDS * BUCKET_SECONDS
+        since = current - (window_hours - 1) * BUCKET_SECONDS
+        step = bucket_hours * BUCKET_SECONDS
+
+        grouped: Dict[int, Counter] = defaultdict(Counter)
+        keywords = Counter()
+        totals = {"sentiment": Counter(), "category": Counter(), "priority_score": Counter()}
+        with self._lock:
+            for bucket, counts in self._counts.items():
+                if bucket < since:
+                    continue
+                grouped[since + (bucket - since) // step * step].update(counts)
+                for (sentiment, category, priority), n in counts.items():
+                    totals["sentiment"][sentiment] += n
+                    totals["category"][category] += n
+                    totals["priority_score"][str(priority)] += n
+            for bucket, counts in self._keywords.items():
+                if bucket >= since:
+                    keywords.update(counts)
+
+        return {
+            "window_hours": window_hours,
+            "bucket_hours": bucket_hours,
+            "total": sum(totals["sentiment"].values()),
+            "totals": {name: dict(counter) for name, counter in totals.items()},
+            "buckets": [
+                {
+                    "start": _iso(bucket),
+                    "counts": [
+                        {"sentiment": s, "category": c, "priority_score": p, "count": n}
+                        for (s, c, p), n in sorted(grouped[bucket].items())
+                    ],
+                }
+                for bucket in sorted(grouped)
+            ],
+            "top_keywords": [{"keyword": k, "count": n} for k, n in keywords.most_common(top_keywords)],
+            "reconciled_at": self.reconciled_at,
+        }
+
+    def reconcile(self) -> None:
+        """Replace settled hours with authoritative counts from BigQuery (blocking)"""
+        from app.services.bq_client import query_keyword_rollup, query_stats_rollup
+
+        settled = _bucket_of(datetime.now(timezone.utc) - timedelta(seconds=STATS_RECONCILE_LAG_SECONDS))
+        hours = self.retention_hours if not self._backfilled else min(STATS_RECONCILE_WINDOW_HOURS, self.retention_hours)
+        first = settled - hours * BUCKET_SECONDS
+        since = datetime.fromtimestamp(first, tz=timezone.utc)
+        until = datetime.fromtimestamp(settled, tz=timezone.utc)
+
+        counts: Dict[int, Counter] = defaultdict(Counter)
+        for row in query_stats_rollup(since, until):
+            counts[_bucket_of(row["bucket"])][(row["sentiment"], row["category"], int(row["priority_score"]))] = row["n"]
+        keywords: Dict[int, Counter] = defaultdict(Counter)
+        for row in query_keyword_rollup(since, until, STATS_MAX_KEYWORDS_PER_BUCKET):
+            keywords[_bucket_of(row["bucket"])][row["keyword"]] = row["n"]
+
+        # Hours still settling stay incremental; the scanned ones come from BigQuery
+        with self._lock:
+            for store, fresh in ((self._counts, counts), (self._keywords, keywords)):
+                for bucket in [b for b in store if first <= b < settled]:
+                    del store[bucket]
+                store.update(fresh)
+            self._expire()
+        self._backfilled = True
+        self.reconciled_at = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+    async def start(self) -> None:
+        if self._task is None and STATS_RECONCILE_SECONDS > 0:
+            self._task = asyncio.create_task(self._reconcile_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _reconcile_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.reconcile)
+            except Exception as e:
+                print(f"⚠️ Stats reconcile failed: {e}")
+            await asyncio.sleep(STATS_RECONCILE_SECONDS)
+
+    def _expire(self) -> None:
+        cutoff = int(datetime.now(timezone.utc).timestamp()) - self.retention_hours * BUCKET_SECONDS
+        for store in (self._counts, self._keywords):
+            for bucket in [b for b in store if b < cutoff]:
+                del store[bucket]
+
+
+stats_aggregator = StatsAggregator()
@@ -0,0 +1,125 @@
+"""Startup warm-up and readiness
+
+Nothing slow happens at import: the BigQuery client, the write sink and
+the agent connections are all created on first use. The warm-up runs
+those first uses at startup instead, concurrently:
+
+- agent: fetch the engine's model and instruction fingerprint, then open
+  the agent connection and fill the session pool (ADK engine) or load the
+  model and prime the prompt prefixes (Ollama engine)
+- bigquery: import the BigQuery library, create the client and write
+  sink, and run the default /api/query page so its result is cached
+
+WARMUP_MODE picks when: "background" (default) serves /health/live at
+once and reports /health/ready only once the warm-up has finished;
+"blocking" finishes it before the server accepts connections; "off" only
+fetches the engine fingerprint and leaves the rest to the first requests.
+A failed step is logged and reported but does not hold readiness back,
+since the same work is retried on first use.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.services import agent_client
+from app.services.bq_writer import bq_writer
+
+WARMUP_MODE = os.getenv("WARMUP_MODE", "background")  # "background", "blocking" or "off"
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "60"))
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "true").lower() == "true"
+WARMUP_QUERY_LIMIT = int(os.getenv("WARMUP_QUERY_LIMIT", "10"))  # the dashboard's first page
+
+Step = Callable[[], Awaitable[None]]
+
+
+async def warm_agent() -> None:
+    """Configure the engine and, unless WARMUP_MODE is off, open its connections
+
+    Fails the step when the engine info is unavailable; requests then retry
+    the fetch (see agent_client.ensure_engine_info).
+    """
+    missing = agent_client.engine_info_needed() and await agent_client.ensure_engine_info(force=True) is None
+    if WARMUP_MODE != "off":
+        await agent_client.warm_up()
+    if missing:
+        raise RuntimeError("Engine info unavailable; retried on use")
+
+
+async def warm_bigquery() -> None:
+    """Create the BigQuery client and write sink and cache the first dashboard page"""
+    await bq_writer.open_sink()
+    if WARMUP_QUERY:
+        from app.services.bq_client import QUERY_COLUMNS, query_feedback
+
+        result = await asyncio.to_thread(query_feedback, WARMUP_QUERY_LIMIT, {}, QUERY_COLUMNS)
+        if not result["success"]:
+            raise RuntimeError(result["error"])
+
+
+def startup_steps() -> Dict[str, Step]:
+    steps = {"agent": warm_agent}
+    if WARMUP_MODE != "off":
+        steps["bigquery"] = warm_bigquery
+    return steps
+
+
+class StartupWarmup:
+    """Run the startup steps concurrently and track readiness"""
+
+    def __init__(self, mode: str = WARMUP_MODE, timeout: float = WARMUP_TIMEOUT_SECONDS):
+        self.mode = mode
+        self.timeout = timeout
+        self._steps: Dict[str, Dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._ready_ms: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready_ms is not None
+
+    async def start(self, steps: Dict[str, Step]) -> None:
+        """Run ``steps`` in the background, or to completion in blocking mode"""
+        self._steps = {name: {"status": "pending"} for name in steps}
+        self._ready_ms = None
+        run = self._run(steps, time.perf_counter())
+        if self.mode == "blocking":
+            await run
+        else:
+            self._task = asyncio.create_task(run)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, steps: Dict[str, Step], started: float) -> None:
+        await asyncio.gather(*(self._run_step(name, step) for name, step in steps.items()))
+        self._ready_ms = round((time.perf_counter() - started) * 1000, 2)
+        failed = [name for name, step in self._steps.items() if step["status"] == "failed"]
+        if failed:
+            print(f"⚠️ Ready in {self._ready_ms:.0f}ms, warm-up failed for: {', '.join(failed)}")
+        else:
+            print(f"✅ Ready in {self._ready_ms:.0f}ms ({self.mode} warm-up)")
+
+    async def _run_step(self, name: str, step: Step) -> None:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(step(), self.timeout)
+            self._steps[name]["status"] = "ok"
+        except Exception as e:
+            print(f"⚠️ Warm-up step {name} failed: {e!r}")
+            self._steps[name].update(status="failed", error=repr(e))
+        self._steps[name]["ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def status(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "mode": self.mode,
+            "ready_ms": self._ready_ms,
+            "steps": {name: dict(step) for name, step in self._steps.items()},
+        }
+
+
+startup_warmup = StartupWarmup()
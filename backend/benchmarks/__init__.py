@@ -0,0 +1,4 @@
+"""Offline benchmarks for the TanggapAI backend
+
+Run from the backend directory, e.g. ``python -m benchmarks.bench_agent_client``.
+"""
@@ -0,0 +1,53 @@
+"""Latency of agent_client.analyze_feedback: per-request client vs pooled client
+
+Usage: python -m benchmarks.bench_agent_client [--requests 200] [--rtt-ms 5]
+"""
+import argparse
+import asyncio
+import time
+
+from app.services import agent_client
+from benchmarks.server import percentile, serve
+from benchmarks.stub_agent import create_stub_agent
+
+
+async def _run(mode: str, requests: int) -> list:
+    latencies = []
+    agent_client.AGENT_SESSION_MODE = "per_request" if mode == "baseline" else "pool"
+    await agent_client.start_client()
+    for i in range(requests):
+        if mode == "baseline":
+            # Old behaviour: a fresh client (and TCP connection) per request
+            await agent_client.close_client()
+            await agent_client.start_client()
+        start = time.perf_counter()
+        await agent_client.analyze_feedback("Delivery was 3 days late", f"bench-{i}", "")
+        latencies.append((time.perf_counter() - start) * 1000)
+    await agent_client.close_client()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=5.0, help="Emulated network round trip per HTTP request")
+    args = parser.parse_args()
+
+    # Every request repeats the same text: keep the pre-classifier, caches and
+    # request coalescing out of the way so each one calls the agent
+    agent_client.ANALYSIS_CACHE_ENABLED = False
+    agent_client.PRECLASSIFIER_ENABLED = False
+    agent_client.AGENT_SINGLEFLIGHT = False
+    agent_client.semantic_cache = None
+    with serve(create_stub_agent(rtt_ms=args.rtt_ms)) as url:
+        agent_client.AGENT_URL = url
+        for mode in ("baseline", "pooled"):
+            latencies = asyncio.run(_run(mode, args.requests))
+            print(
+                f"{mode:>9}: p50={percentile(latencies, 50):.2f}ms "
+                f"p99={percentile(latencies, 99):.2f}ms n={len(latencies)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Throughput of per-request inserts vs the background BigQuery writer
+
+Usage: python -m benchmarks.bench_bq_writer [--rows 2000] [--insert-latency-ms 40]
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from benchmarks import fake_bigquery
+
+
+def _row(i: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "feedback_text": f"feedback {i}",
+        "sentiment": "negative",
+        "category": "delivery",
+        "priority_score": 3,
+        "keywords": ["delivery"],
+        "root_cause": "Shipping delay",
+        "recommendation": "Improve logistics tracking",
+        "summary": "Delivery delayed.",
+        "created_at": "2025-11-30T10:00:00Z",
+    }
+
+
+async def _per_request(rows: int, concurrency: int) -> None:
+    from app.services.bq_client import write_rows
+
+    # Old behaviour: one blocking insert per row, on the event loop
+    async def one(i):
+        write_rows([_row(i)])
+
+    for start in range(0, rows, concurrency):
+        await asyncio.gather(*(one(i) for i in range(start, min(rows, start + concurrency))))
+
+
+async def _writer(rows: int, concurrency: int) -> dict:
+    from app.services.bq_writer import BigQueryWriter, insert_all_sink
+
+    writer = BigQueryWriter(sink=insert_all_sink)
+    await writer.start()
+    for start in range(0, rows, concurrency):
+        await asyncio.gather(*(writer.submit([_row(i)]) for i in range(start, min(rows, start + concurrency))))
+    await writer.stop()
+    return writer.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--insert-latency-ms", type=float, default=40.0)
+    args = parser.parse_args()
+
+    fake = fake_bigquery.install(insert_latency_ms=args.insert_latency_ms)
+
+    # Quiet the per-insert log lines while timing
+    import builtins
+    real_print, builtins.print = builtins.print, lambda *a, **k: None
+
+    start = time.perf_counter()
+    asyncio.run(_per_request(args.rows, args.concurrency))
+    per_request = time.perf_counter() - start
+    calls = fake.insert_calls
+
+    start = time.perf_counter()
+    stats = asyncio.run(_writer(args.rows, args.concurrency))
+    writer = time.perf_counter() - start
+
+    builtins.print = real_print
+    print(f"per-request: {args.rows / per_request:,.0f} rows/s, {calls} insert calls")
+    print(f"     writer: {args.rows / writer:,.0f} rows/s, {stats['batches']} insert calls, stats={stats}")
+
+
+if __name__ == "__main__":
+    main()
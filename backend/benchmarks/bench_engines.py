@@ -0,0 +1,67 @@
+"""Latency and throughput of the ADK engine vs the direct Ollama engine
+
+Both engines talk to the same fake Ollama. The ADK path goes through the
+stub agent, which forwards to it the way ADK -> LiteLLM does, so the
+difference is the extra hop and session handling.
+
+Usage: python -m benchmarks.bench_engines [--requests 200] [--concurrency 8] [--rtt-ms 5]
+"""
+import argparse
+import asyncio
+import time
+
+from app.services import agent_client, ollama_engine
+from benchmarks.fake_ollama import STUB_INSTRUCTION, create_fake_ollama
+from benchmarks.server import percentile, serve
+from benchmarks.stub_agent import create_stub_agent
+
+
+async def _run(engine: str, requests: int, concurrency: int) -> tuple:
+    agent_client.AGENT_ENGINE = engine
+    await agent_client.start_client()
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with slots:
+            start = time.perf_counter()
+            await agent_client.analyze_feedback(f"Pesanan #{i} terlambat 3 hari", f"bench-{i}", "")
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    await agent_client.close_client()
+    return latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rtt-ms", type=float, default=5.0, help="Emulated network round trip per hop")
+    parser.add_argument("--prefill-tps", type=float, default=0.0, help="Fake Ollama prompt tokens per second")
+    parser.add_argument("--decode-tps", type=float, default=0.0, help="Fake Ollama output tokens per second")
+    args = parser.parse_args()
+
+    agent_client.ANALYSIS_CACHE_ENABLED = False
+    agent_client.PRECLASSIFIER_ENABLED = False
+    agent_client.AGENT_SINGLEFLIGHT = False
+    agent_client.semantic_cache = None
+    fake = create_fake_ollama(rtt_ms=args.rtt_ms, prefill_tps=args.prefill_tps, decode_tps=args.decode_tps, parallel=0)
+    with serve(fake) as ollama_url:
+        stub = create_stub_agent(rtt_ms=args.rtt_ms, ollama_url=ollama_url, instruction=STUB_INSTRUCTION)
+        with serve(stub) as agent_url:
+            agent_client.AGENT_URL = agent_url
+            ollama_engine.OLLAMA_URL = ollama_url
+            ollama_engine.configure({"instruction": STUB_INSTRUCTION, "batch_instruction": STUB_INSTRUCTION})
+            for engine in ("adk", "ollama"):
+                latencies, elapsed = asyncio.run(_run(engine, args.requests, args.concurrency))
+                print(
+                    f"{engine:>6}: p50={percentile(latencies, 50):.2f}ms p99={percentile(latencies, 99):.2f}ms "
+                    f"{args.requests / elapsed:.1f} req/s n={len(latencies)}"
+                )
+
+
+if __name__ == "__main__":
+    main()
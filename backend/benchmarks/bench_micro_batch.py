@@ -0,0 +1,81 @@
+"""Throughput of micro-batched agent calls for different batch sizes K
+
+Fires concurrent analyses with distinct texts (cache and coalescing off)
+and reports items/sec and tokens/sec per K. Runs against a stub agent
+that charges prefill/decode time per token and serves one generation at
+a time, or against a real agent with --agent-url.
+
+Usage: python -m benchmarks.bench_micro_batch [--items 64] [--sizes 1,2,4,8] [--agent-url URL]
+"""
+import argparse
+import asyncio
+import contextlib
+import time
+
+from app.services import agent_client
+from benchmarks.server import serve
+from benchmarks.stub_agent import create_stub_agent
+
+
+async def _run(size: int, items: int, window_ms: float) -> dict:
+    agent_client.AGENT_BATCH_SIZE = size
+    agent_client._micro_batcher.max_size = size
+    agent_client._micro_batcher.window_ms = window_ms
+    await agent_client.start_client()
+    before = agent_client.token_stats()
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(agent_client.analyze_feedback(f"Pesanan #{i} terlambat 3 hari", f"bench-{i}", "") for i in range(items)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+
+    after = agent_client.token_stats()
+    await agent_client.close_client()
+    tokens = sum(after[k] - before[k] for k in ("prompt_tokens", "output_tokens"))
+    return {
+        "elapsed": elapsed,
+        "failed": sum(isinstance(r, Exception) for r in results),
+        "items_per_sec": items / elapsed,
+        "tokens_per_sec": tokens / elapsed,
+        "prompt_tokens_per_item": (after["prompt_tokens"] - before["prompt_tokens"]) / items,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=64)
+    parser.add_argument("--sizes", default="1,2,4,8", help="Comma-separated batch sizes to compare")
+    parser.add_argument("--window-ms", type=float, default=20.0)
+    parser.add_argument("--agent-url", help="Benchmark a running agent instead of the stub")
+    parser.add_argument("--prefill-tps", type=float, default=2000.0, help="Stub prompt tokens per second")
+    parser.add_argument("--decode-tps", type=float, default=400.0, help="Stub output tokens per second")
+    args = parser.parse_args()
+
+    # Measure the agent, not the cache or request coalescing
+    agent_client.ANALYSIS_CACHE_ENABLED = False
+    agent_client.PRECLASSIFIER_ENABLED = False
+    agent_client.AGENT_SINGLEFLIGHT = False
+    agent_client.semantic_cache = None
+    # usageMetadata arrives on the final event, so read the stream to the end
+    agent_client.AGENT_STREAMING = False
+
+    if args.agent_url:
+        server = contextlib.nullcontext(args.agent_url)
+    else:
+        server = serve(create_stub_agent(prefill_tps=args.prefill_tps, decode_tps=args.decode_tps, parallel=1))
+
+    with server as url:
+        agent_client.AGENT_URL = url
+        for size in (int(k) for k in args.sizes.split(",")):
+            r = asyncio.run(_run(size, args.items, args.window_ms))
+            print(
+                f"K={size:>2}: {r['items_per_sec']:.2f} items/s {r['tokens_per_sec']:.0f} tokens/s "
+                f"prompt_tokens/item={r['prompt_tokens_per_item']:.0f} "
+                f"elapsed={r['elapsed']:.2f}s failed={r['failed']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
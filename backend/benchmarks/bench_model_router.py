@@ -0,0 +1,125 @@
+"""Agent model routing across several fake Ollama replicas
+
+Starts one fake Ollama per --replica-tps entry (output tokens per second,
+so replicas of different speed), optionally one answering 503 to
+--flaky-rate of its chats and --dead URLs with nothing listening. The real
+agents (adk-agent, through ADK's Runner and LiteLLM) then run --requests
+analyses, --concurrency at a time, once per policy:
+
+- single: only the first replica, as with one OLLAMA_API_BASE
+- round_robin, p2c, least_outstanding: the model_router policies
+
+With --bulk-share, that fraction of runs is marked bulk and prefers the
+last healthy replica (OLLAMA_BULK_API_BASES). Reports throughput,
+p50/p95 latency, failed runs, router retries and the share of calls each
+replica served.
+
+Usage: python -m benchmarks.bench_model_router [--replica-tps 200,100] [--dead 1] [--flaky-rate 0.5]
+       [--requests 120] [--concurrency 12] [--policies single,round_robin,p2c,least_outstanding]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from contextlib import ExitStack
+
+from benchmarks.fake_ollama import create_fake_ollama
+from benchmarks.server import free_port, percentile, serve
+
+AGENT_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "adk-agent")
+
+
+async def _drive(args, runner, bulk_runs: set) -> tuple:
+    from google.genai import types
+
+    import model_router
+
+    latencies, failures = [], 0
+    queue = list(range(args.requests))
+
+    async def one(i: int) -> None:
+        nonlocal failures
+        token = model_router._priority.set("bulk" if i in bulk_runs else "interactive")
+        message = types.Content(role="user", parts=[types.Part(text=f"Analyze this feedback: order #{i} arrived late")])
+        started = time.perf_counter()
+        try:
+            async for _ in runner.run("tanggap_agent", "bench", message, streaming=True):
+                pass
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            failures += 1
+        finally:
+            model_router._priority.reset(token)
+
+    async def worker() -> None:
+        while queue:
+            await one(queue.pop(0))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return latencies, failures, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replica-tps", default="200,100", help="Decode tokens/s per healthy replica")
+    parser.add_argument("--parallel", type=int, default=2, help="Generations served at once per replica")
+    parser.add_argument("--dead", type=int, default=1, help="Replicas with nothing listening")
+    parser.add_argument("--flaky-rate", type=float, default=0.0, help="Add a replica that answers 503 to this share")
+    parser.add_argument("--bulk-share", type=float, default=0.0, help="Share of runs marked bulk")
+    parser.add_argument("--requests", type=int, default=120)
+    parser.add_argument("--concurrency", type=int, default=12)
+    parser.add_argument("--policies", default="single,round_robin,p2c,least_outstanding")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+    sys.path.insert(0, os.path.abspath(AGENT_DIR))
+    import litellm
+
+    import model_router
+    import session_store
+    from tanggap_agent import agent
+
+    litellm.suppress_debug_info = True
+
+    rng = random.Random(args.seed)
+    bulk_runs = {i for i in range(args.requests) if rng.random() < args.bulk_share}
+    with ExitStack() as stack:
+        urls = [
+            stack.enter_context(serve(create_fake_ollama(prefill_tps=2000, decode_tps=float(tps), parallel=args.parallel)))
+            for tps in args.replica_tps.split(",")
+        ]
+        if args.flaky_rate:
+            flaky = create_fake_ollama(prefill_tps=2000, decode_tps=200, parallel=args.parallel, fail_rate=args.flaky_rate, seed=args.seed)
+            urls.append(stack.enter_context(serve(flaky)))
+        urls += [f"http://127.0.0.1:{free_port()}" for _ in range(args.dead)]
+        bulk = urls[-1:] if args.bulk_share and len(urls) > 1 else []
+        primary = [url for url in urls if url not in bulk]
+        print(f"replicas: {', '.join(urls)}" + (f" (bulk: {bulk[0]})" if bulk else ""))
+
+        for policy in args.policies.split(","):
+            if policy == "single":
+                router = model_router.ModelRouter(urls[:1], policy="p2c", seed=args.seed)
+            else:
+                router = model_router.ModelRouter(primary, bulk, policy=policy, seed=args.seed)
+            for routed in (agent.tanggap_agent, agent.tanggap_batch_agent):
+                routed.model.llm_client.router = router
+            runner = session_store.StatelessRunner(["tanggap_agent"])
+            latencies, failures, elapsed = asyncio.run(_drive(args, runner, bulk_runs))
+            stats = router.stats()
+            share = " ".join(
+                f"{int(i) + 1}:{r['requests'] / max(stats['calls'], 1):.0%}({r['state']})"
+                for i, r in stats["replicas"].items()
+            )
+            print(
+                f"{policy:<18} {len(latencies) / elapsed:6.2f} runs/s  p50={percentile(latencies, 50) * 1000:7.0f}ms "
+                f"p95={percentile(latencies, 95) * 1000:7.0f}ms  failed={failures:<3} retries={stats['retries']:<3} "
+                f"calls per replica {share}"
+            )
+
+
+if __name__ == "__main__":
+    main()
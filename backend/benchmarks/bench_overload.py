@@ -0,0 +1,105 @@
+"""Goodput under overload, with and without the adaptive concurrency limiter
+
+Offers an open-loop arrival rate above what the stub agent can serve.
+The stub shares one "GPU" between all active generations, so overload
+slows every request down together. Each request is interactive or bulk.
+The run is repeated with the limiter off and on, and reports:
+
+- goodput: successful analyses per second
+- p50/p95 latency of successes per lane
+- requests shed with 503 and how fast that happened
+- requests that failed after hitting the client timeout
+
+Usage: python -m benchmarks.bench_overload [--rate 20] [--duration 20] [--service-ms 250]
+       [--parallel 2] [--timeout 10] [--interactive-share 0.3]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from app.services import agent_client
+from app.services.limiter import AdaptiveLimiter, AgentOverloadedError
+from benchmarks.server import percentile, serve
+from benchmarks.stub_agent import create_stub_agent
+
+
+async def _one(i: int, lane: str, outcomes: list) -> None:
+    start = time.perf_counter()
+    try:
+        await agent_client.analyze_feedback(f"Pesanan #{i} terlambat 3 hari", f"bench-{i}", "", lane=lane)
+        kind = "ok"
+    except AgentOverloadedError:
+        kind = "shed"
+    except Exception:
+        kind = "error"
+    outcomes.append((lane, kind, time.perf_counter() - start))
+
+
+async def _run(args, limited: bool) -> dict:
+    agent_client.AGENT_LIMITER_ENABLED = limited
+    agent_client._limiter = AdaptiveLimiter(queue_timeout=args.queue_timeout, queue_size=args.queue_size)
+    await agent_client.start_client()
+    rng = random.Random(0)
+    outcomes: list = []
+    tasks = []
+    start = time.perf_counter()
+    for i in range(int(args.rate * args.duration)):
+        await asyncio.sleep(max(0.0, start + i / args.rate - time.perf_counter()))
+        lane = "interactive" if rng.random() < args.interactive_share else "bulk"
+        tasks.append(asyncio.create_task(_one(i, lane, outcomes)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    limiter = agent_client._limiter.stats()
+    await agent_client.close_client()
+    return {"elapsed": elapsed, "outcomes": outcomes, "limit": limiter["limit"]}
+
+
+def _report(name: str, r: dict) -> None:
+    outcomes = r["outcomes"]
+    ok = [o for o in outcomes if o[1] == "ok"]
+    shed = [o[2] for o in outcomes if o[1] == "shed"]
+    errors = sum(o[1] == "error" for o in outcomes)
+    print(
+        f"{name}: goodput={len(ok) / r['elapsed']:.2f}/s ok={len(ok)} shed={len(shed)} "
+        f"(p95 {percentile(shed, 95) * 1000:.0f}ms) timeouts/errors={errors} final_limit={r['limit']}"
+    )
+    for lane in ("interactive", "bulk"):
+        latencies = [o[2] for o in ok if o[0] == lane]
+        total = sum(o[0] == lane for o in outcomes)
+        print(
+            f"  {lane:<11} ok={len(latencies)}/{total} p50={percentile(latencies, 50) * 1000:.0f}ms "
+            f"p95={percentile(latencies, 95) * 1000:.0f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=float, default=20.0, help="Offered requests per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of arrivals")
+    parser.add_argument("--service-ms", type=float, default=250.0, help="Stub generation time when not overloaded")
+    parser.add_argument("--parallel", type=int, default=2, help="Generations the stub serves at full speed")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Agent client timeout (AGENT_TIMEOUT)")
+    parser.add_argument("--queue-timeout", type=float, default=3.0, help="AGENT_QUEUE_TIMEOUT")
+    parser.add_argument("--queue-size", type=int, default=50, help="AGENT_QUEUE_SIZE")
+    parser.add_argument("--interactive-share", type=float, default=0.3)
+    args = parser.parse_args()
+
+    # Every request must reach the agent
+    agent_client.ANALYSIS_CACHE_ENABLED = False
+    agent_client.PRECLASSIFIER_ENABLED = False
+    agent_client.AGENT_SINGLEFLIGHT = False
+    agent_client.semantic_cache = None
+    agent_client.AGENT_TIMEOUT = args.timeout
+
+    capacity = args.parallel / (args.service_ms / 1000)
+    print(f"offered {args.rate:.1f}/s against a capacity of about {capacity:.1f}/s")
+    for name, limited in (("limiter off", False), ("limiter on ", True)):
+        stub = create_stub_agent(generate_ms=args.service_ms, parallel=args.parallel, shared=True)
+        with serve(stub) as url:
+            agent_client.AGENT_URL = url
+            _report(name, asyncio.run(_run(args, limited)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Offload ratio, agreement with model labels and cost of the pre-classifier
+
+Reads analyzed rows exported from BigQuery as NDJSON (feedback_text,
+sentiment, category, priority_score) and reports, per threshold, how much
+traffic would be answered locally and how often it agrees with the model.
+
+Usage: python -m benchmarks.bench_preclassifier rows.ndjson [--thresholds 0.7,0.8,0.9,1.0]
+"""
+import argparse
+import json
+import time
+
+from app.services.preclassifier import PreClassifier
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("rows", help="NDJSON export of feedback_analysis rows")
+    parser.add_argument("--thresholds", default="0.7,0.8,0.9,1.0")
+    args = parser.parse_args()
+
+    with open(args.rows, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+
+    for threshold in (float(t) for t in args.thresholds.split(",")):
+        classifier = PreClassifier(threshold=threshold)
+        agree = {"sentiment": 0, "category": 0, "priority": 0}
+        start = time.perf_counter()
+        answers = [(row, classifier.classify(row["feedback_text"])) for row in rows]
+        elapsed = time.perf_counter() - start
+        offloaded = [(row, answer) for row, answer in answers if answer is not None]
+        for row, answer in offloaded:
+            agree["sentiment"] += answer["sentiment"] == row["sentiment"]
+            agree["category"] += answer["category"] == row["category"]
+            agree["priority"] += abs(answer["priority"] - int(row["priority_score"])) <= 1
+        n = len(offloaded) or 1
+        print(
+            f"threshold={threshold:.2f}: offload={len(offloaded) / len(rows):.1%} "
+            f"sentiment_agree={agree['sentiment'] / n:.1%} category_agree={agree['category'] / n:.1%} "
+            f"priority_within_1={agree['priority'] / n:.1%} cost={elapsed / len(rows) * 1e6:.1f}us/item"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Time to first token with and without prompt-prefix reuse
+
+Runs the direct Ollama engine against a fake Ollama with a CPU-like
+prefill rate, once with the KV prefix cache disabled (every request
+prefills the whole instruction) and once enabled with the prefix primed.
+Prints TTFT per request with --verbose.
+
+Usage: python -m benchmarks.bench_prefix_cache [--requests 20] [--prefill-tps 150] [--verbose]
+"""
+import argparse
+import asyncio
+
+from app.services import agent_client, ollama_engine
+from benchmarks.fake_ollama import STUB_INSTRUCTION, create_fake_ollama
+from benchmarks.server import percentile, serve
+
+
+async def _run(requests: int, prime: bool) -> list:
+    await agent_client.start_client()
+    ollama_engine.OLLAMA_PRIME = prime
+    await agent_client.warm_up()
+    runs = []
+    for i in range(requests):
+        await agent_client.analyze_feedback(f"Pesanan #{i} terlambat 3 hari", f"bench-{i}", "")
+        runs.append(agent_client.agent_stats(recent=1)["recent"][0])
+    await agent_client.close_client()
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--prefill-tps", type=float, default=150.0, help="Prompt tokens per second (CPU-class)")
+    parser.add_argument("--decode-tps", type=float, default=400.0)
+    parser.add_argument("--verbose", action="store_true", help="Print every request's TTFT")
+    args = parser.parse_args()
+
+    agent_client.AGENT_ENGINE = "ollama"
+    agent_client.ANALYSIS_CACHE_ENABLED = False
+    agent_client.PRECLASSIFIER_ENABLED = False
+    agent_client.AGENT_SINGLEFLIGHT = False
+    agent_client.semantic_cache = None
+    ollama_engine.configure({"instruction": STUB_INSTRUCTION, "batch_instruction": None})
+
+    for label, cache in (("no prefix reuse", False), ("prefix reuse", True)):
+        fake = create_fake_ollama(prefill_tps=args.prefill_tps, decode_tps=args.decode_tps, prefix_cache=cache)
+        with serve(fake) as url:
+            ollama_engine.OLLAMA_URL = url
+            runs = asyncio.run(_run(args.requests, prime=cache))
+        if args.verbose:
+            for i, run in enumerate(runs):
+                print(f"  {label} #{i}: ttft={run['ttft_ms']:.1f}ms prompt_tokens={run['prompt_tokens']}")
+        ttft = [run["ttft_ms"] for run in runs]
+        prompt_tokens = sum(run["prompt_tokens"] for run in runs) / len(runs)
+        print(
+            f"{label:>16}: ttft p50={percentile(ttft, 50):.1f}ms p95={percentile(ttft, 95):.1f}ms "
+            f"prefilled tokens/request={prompt_tokens:.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
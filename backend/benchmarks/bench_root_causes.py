@@ -0,0 +1,104 @@
+"""Throughput and group quality of incremental root-cause clustering
+
+Generates synthetic rows from a set of root-cause themes, each phrased in
+several English and Indonesian ways, then feeds them in pages as the
+refresh job would. Reports rows/s, the number of groups and how many
+groups mix phrasings of different themes.
+
+Usage: python -m benchmarks.bench_root_causes [--rows 1000000] [--page 50000] [--similarity 0.5]
+"""
+import argparse
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+from app.services.root_causes import RootCauseClusters
+
+THEMES = [
+    ("delivery", ["Courier delayed the package", "Pengiriman terlambat karena kurir", "Package arrived late from courier"],
+     ["late", "courier", "delivery"]),
+    ("delivery", ["Package arrived damaged in shipping", "Paket rusak saat pengiriman", "Shipping damaged the package"],
+     ["damaged", "package", "shipping"]),
+    ("product", ["Product quality below expectations", "Kualitas barang jelek", "Poor product quality"],
+     ["quality", "product", "bad"]),
+    ("product", ["Wrong size sent to customer", "Ukuran barang salah", "Item size does not match order"],
+     ["size", "wrong", "item"]),
+    ("service", ["Support agent was rude", "Admin kasar dan tidak ramah", "Rude customer service staff"],
+     ["rude", "support", "service"]),
+    ("service", ["Seller slow to respond to chat", "Penjual lama membalas chat", "Slow seller response"],
+     ["seller", "response", "slow"]),
+    ("payment", ["Refund not processed", "Dana refund belum kembali", "Refund still pending"],
+     ["refund", "money", "pending"]),
+    ("payment", ["Customer charged twice for one order", "Tagihan ganda untuk satu pesanan", "Double charge on payment"],
+     ["charged", "double", "payment"]),
+    ("technical", ["App crashes at checkout", "Aplikasi error saat checkout", "Checkout crash in the app"],
+     ["app", "crash", "checkout"]),
+    ("technical", ["Login fails with OTP error", "Gagal login karena OTP", "OTP login error"],
+     ["login", "otp", "error"]),
+]
+
+
+def synthetic_rows(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for i in range(n):
+        theme = rng.randrange(len(THEMES))
+        category, phrasings, keywords = THEMES[theme]
+        yield theme, {
+            "id": f"{i:012d}",
+            "root_cause": rng.choice(phrasings),
+            "keywords": rng.sample(keywords, 2),
+            "sentiment": "negative",
+            "category": category,
+            "priority_score": rng.randint(2, 5),
+            "created_at": start + timedelta(seconds=i),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--page", type=int, default=50_000)
+    parser.add_argument("--similarity", type=float, default=0.5)
+    args = parser.parse_args()
+
+    clusters = RootCauseClusters(similarity=args.similarity, path="")
+    members = defaultdict(Counter)  # group id -> theme -> rows
+    page = []
+    elapsed = 0.0
+
+    def flush():
+        nonlocal elapsed
+        start = time.perf_counter()
+        before = clusters.rows_clustered
+        clusters.add(page)
+        elapsed += time.perf_counter() - start
+        assert clusters.rows_clustered == before + len(page)
+
+    for _, row in synthetic_rows(args.rows):
+        page.append(row)
+        if len(page) == args.page:
+            flush()
+            page.clear()
+    if page:
+        flush()
+
+    groups = clusters.groups(limit=10_000)["groups"]
+    by_phrase = {p: t for t, (_, phrasings, _) in enumerate(THEMES) for p in phrasings}
+    for group in groups:
+        for phrase in group["examples"]:
+            members[group["id"]][by_phrase[phrase]] += 1
+    pure = sum(1 for counts in members.values() if len(counts) == 1)
+
+    print(
+        f"rows={args.rows} page={args.page} similarity={args.similarity}: "
+        f"{args.rows / elapsed:,.0f} rows/s, {len(groups)} groups, "
+        f"{pure}/{len(groups)} groups hold a single theme"
+    )
+    for group in groups[:len(THEMES)]:
+        print(f"  {group['count']:>9} {group['share']:.1%} {group['label']!r} {group['top_keywords'][:3]}")
+
+
+if __name__ == "__main__":
+    main()
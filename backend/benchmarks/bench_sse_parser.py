@@ -0,0 +1,85 @@
+"""Micro-benchmark: legacy accumulate-then-parse vs the incremental SSE parser
+
+Replays the /run_sse transcripts in benchmarks/transcripts and reports
+parse time per response and how many events each approach had to read
+before it had the analysis.
+
+Usage: python -m benchmarks.bench_sse_parser [--iterations 2000]
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from app.services.agent_client import extract_json_from_text
+from app.services.sse_parser import AgentStreamParser
+
+TRANSCRIPTS = Path(__file__).parent / "transcripts"
+
+
+def legacy_parse(lines):
+    """The previous agent_client logic: += every event, then parse twice"""
+    full_response = ""
+    for line in lines:
+        if line.startswith("data: "):
+            data_str = line[6:]
+            if data_str and data_str != "[DONE]":
+                try:
+                    event_data = json.loads(data_str)
+                    if "content" in event_data:
+                        content_val = event_data["content"]
+                        if isinstance(content_val, str):
+                            full_response += content_val
+                        elif isinstance(content_val, dict):
+                            full_response += json.dumps(content_val)
+                except json.JSONDecodeError:
+                    continue
+    parsed = json.loads(full_response)
+    analysis_text = parsed["parts"][0]["text"]
+    try:
+        return json.loads(analysis_text)
+    except json.JSONDecodeError:
+        return extract_json_from_text(analysis_text)
+
+
+def incremental_parse(lines):
+    parser = AgentStreamParser()
+    for consumed, line in enumerate(lines, start=1):
+        analysis = parser.feed_line(line)
+        if analysis is not None:
+            return analysis, consumed
+    return parser.finish(), len(lines)
+
+
+def _time(fn, lines, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(lines)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    for path in sorted(TRANSCRIPTS.glob("*.sse")):
+        lines = path.read_text().splitlines()
+        events = sum(1 for line in lines if line.startswith("data: "))
+        _, consumed_lines = incremental_parse(lines)
+        consumed = sum(1 for line in lines[:consumed_lines] if line.startswith("data: "))
+
+        try:
+            legacy_parse(lines)
+            legacy = f"{_time(legacy_parse, lines, args.iterations):8.1f}us"
+        except (ValueError, KeyError, IndexError):
+            legacy = "  failed  "
+        incremental = _time(incremental_parse, lines, args.iterations)
+        print(
+            f"{path.stem:>28}: legacy={legacy} incremental={incremental:8.1f}us "
+            f"events read={consumed}/{events}"
+        )
+
+
+if __name__ == "__main__":
+    main()
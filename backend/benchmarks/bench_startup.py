@@ -0,0 +1,127 @@
+"""Cold start: process spawn to first byte, readiness and first requests
+
+Each run spawns a fresh backend process (python -m benchmarks.bench_startup
+--serve) against the stub agent, with BigQuery swapped for the in-memory
+fake only once the app imports bq_client itself, so the library import is
+timed too. --bq-init-ms stands in for resolving credentials when the
+client is created. Per WARMUP_MODE it reports medians over --runs of:
+
+- live: spawn until /health/live answers (import-to-first-byte)
+- ready: spawn until /health/ready answers 200
+- first_analyze / first_query: the first /api/analyze and /api/query,
+  sent as soon as the process is live, as a TCP startup probe would allow
+- second_analyze: the next /api/analyze, for the steady-state cost
+
+"blocking" only serves once warm, "background" is live at once and warms
+concurrently, "off" leaves everything to the first requests.
+
+Usage: python -m benchmarks.bench_startup [--runs 3] [--modes blocking,background,off]
+       [--rtt-ms 20] [--bq-init-ms 300] [--bq-query-ms 300]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.server import free_port, serve
+from benchmarks.stub_agent import create_stub_agent
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+METRICS = ("live", "ready", "first_analyze", "first_query", "second_analyze")
+
+
+def _serve_backend(args) -> None:
+    """Child process: install the fake BigQuery lazily and serve the real app"""
+    import uvicorn
+
+    from benchmarks import fake_bigquery
+
+    fake_bigquery.install_on_import(init_latency_ms=args.bq_init_ms, query_latency_ms=args.bq_query_ms)
+    uvicorn.run("app.main:app", host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def _wait_for(client: httpx.Client, url: str, started: float, deadline: float) -> float:
+    """Poll ``url`` until it answers 200; returns ms since ``started``"""
+    while time.perf_counter() < deadline:
+        try:
+            if client.get(url).status_code == 200:
+                return (time.perf_counter() - started) * 1000
+        except httpx.TransportError:
+            pass
+        time.sleep(0.005)
+    raise TimeoutError(f"{url} not ready")
+
+
+def _timed(send) -> float:
+    started = time.perf_counter()
+    send().raise_for_status()
+    return (time.perf_counter() - started) * 1000
+
+
+def _run_once(args, mode: str, agent_url: str, run: int) -> dict:
+    port = free_port()
+    env = {
+        **os.environ,
+        "WARMUP_MODE": mode,
+        "AGENT_URL": agent_url,
+        "PRECLASSIFIER_ENABLED": "false",  # every analysis reaches the agent
+        "SEMANTIC_CACHE_ENABLED": "false",
+        "ROOT_CAUSE_ENABLED": "false",
+        "STATS_RECONCILE_SECONDS": "0",
+    }
+    command = [
+        sys.executable, "-m", "benchmarks.bench_startup", "--serve", "--port", str(port),
+        "--bq-init-ms", str(args.bq_init_ms), "--bq-query-ms", str(args.bq_query_ms),
+    ]
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+    try:
+        with httpx.Client(timeout=args.timeout) as client:
+            deadline = started + args.timeout
+            result = {"live": _wait_for(client, f"{base}/health/live", started, deadline)}
+            analyze = lambda i: client.post(
+                f"{base}/api/analyze", json={"feedback": f"Pesanan {mode} #{run}-{i} terlambat 3 hari"}
+            )
+            result["first_analyze"] = _timed(lambda: analyze(0))
+            result["first_query"] = _timed(lambda: client.get(f"{base}/api/query", params={"limit": 10}))
+            result["ready"] = _wait_for(client, f"{base}/health/ready", started, deadline)
+            result["second_analyze"] = _timed(lambda: analyze(1))
+            return result
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="Cold starts per mode")
+    parser.add_argument("--modes", default="blocking,background,off", help="WARMUP_MODE values to compare")
+    parser.add_argument("--rtt-ms", type=float, default=20.0, help="Stub agent round trip")
+    parser.add_argument("--generate-ms", type=float, default=50.0, help="Stub agent generation time")
+    parser.add_argument("--bq-init-ms", type=float, default=300.0, help="Fake BigQuery client creation time")
+    parser.add_argument("--bq-query-ms", type=float, default=300.0, help="Fake BigQuery query time")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        _serve_backend(args)
+        return
+
+    stub = create_stub_agent(rtt_ms=args.rtt_ms, generate_ms=args.generate_ms)
+    with serve(stub) as agent_url:
+        print(f"{'mode':<12}" + "".join(f"{name + '_ms':>18}" for name in METRICS))
+        for mode in args.modes.split(","):
+            runs = [_run_once(args, mode, agent_url, run) for run in range(args.runs)]
+            medians = {name: statistics.median(r[name] for r in runs) for name in METRICS}
+            print(f"{mode:<12}" + "".join(f"{medians[name]:>18.0f}" for name in METRICS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Constrained decoding: parse failures and output tokens per AGENT_OUTPUT_FORMAT
+
+Runs the real agents (adk-agent, through ADK's Runner and LiteLLM) against
+a fake Ollama whose unconstrained answers drift from the instruction at
+--format-errors (fenced, chatty or malformed JSON, a value outside the
+schema, a missing field; see fake_ollama). Each run's events go through
+the backend's stream parser, with extract_json_from_text as its
+fallback, and the analyses are checked by the backend's validate_analysis.
+
+Per mode it reports, over --requests single analyses and --batches
+batches of --batch-size, the share of items without a usable analysis
+(a 500, or a batch item retried on its own), the output tokens per item
+and the median latency per call.
+
+Usage: python -m benchmarks.bench_structured_output [--modes none,json,schema]
+       [--format-errors 0.2] [--requests 200] [--batches 50] [--batch-size 4]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+from pydantic import ValidationError
+
+from app.services.agent_client import validate_analysis
+from app.services.sse_parser import AgentStreamParser, BatchStreamParser
+from benchmarks.fake_ollama import create_fake_ollama
+from benchmarks.server import serve
+
+AGENT_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "adk-agent")
+
+
+async def _run(runner, app_name: str, prompt: str, parser) -> tuple:
+    """Feed one agent run to ``parser`` as /run_sse lines until it completes
+
+    Returns what the parser completed (None if it never did) and the
+    latency of the whole run.
+    """
+    from google.genai import types
+
+    message = types.Content(role="user", parts=[types.Part(text=prompt)])
+    result = None
+    started = time.perf_counter()
+    async for event in runner.run(app_name, "bench", message, streaming=True):
+        if result is None:
+            result = parser.feed_line("data: " + event.model_dump_json(by_alias=True, exclude_none=True))
+    return result, time.perf_counter() - started
+
+
+def _valid(analysis) -> bool:
+    try:
+        validate_analysis(analysis)
+    except ValidationError:
+        return False
+    return True
+
+
+async def _drive(args, runner) -> tuple:
+    from app.services.agent_client import build_batch_prompt
+
+    outcomes, latencies = Counter(), []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def single(i: int) -> None:
+        async with semaphore:
+            parser = AgentStreamParser()
+            analysis, latency = await _run(runner, "tanggap_agent", f"Analyze this feedback: order #{i} arrived late", parser)
+            latencies.append(latency)
+            try:
+                analysis = analysis or parser.finish()
+            except ValueError:
+                outcomes["failed"] += 1
+                return
+            outcomes["ok" if _valid(analysis) else "failed"] += 1
+
+    async def batch(b: int) -> None:
+        async with semaphore:
+            parser = BatchStreamParser(args.batch_size)
+            texts = [f"Batch {b} item {i}: the parcel arrived damaged" for i in range(args.batch_size)]
+            results, latency = await _run(runner, "tanggap_batch_agent", build_batch_prompt(texts), parser)
+            latencies.append(latency)
+            results = results or parser.finish()
+            outcomes["failed"] += args.batch_size - len(results)
+            for analysis in results.values():
+                outcomes["ok" if _valid(analysis) else "failed"] += 1
+
+    await asyncio.gather(*(single(i) for i in range(args.requests)), *(batch(b) for b in range(args.batches)))
+    return outcomes, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="none,json,schema", help="AGENT_OUTPUT_FORMAT values to compare")
+    parser.add_argument("--format-errors", type=float, default=0.2, help="Share of answers that drift where the format allows")
+    parser.add_argument("--requests", type=int, default=200, help="Single analyses per mode")
+    parser.add_argument("--batches", type=int, default=50, help="Batch calls per mode")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--decode-tps", type=float, default=200.0, help="Fake Ollama output tokens per second")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+    sys.path.insert(0, os.path.abspath(AGENT_DIR))
+    import litellm
+
+    import model_router
+    import session_store
+    from tanggap_agent import agent
+
+    litellm.suppress_debug_info = True
+
+    print(f"{'mode':<8} {'items':>6} {'drifted':>8} {'failed':>7} {'out_tok/item':>13} {'p50_ms':>8}")
+    for mode in args.modes.split(","):
+        fake = create_fake_ollama(prefill_tps=2000, decode_tps=args.decode_tps, parallel=args.concurrency,
+                                  format_errors=args.format_errors, seed=args.seed)
+        with serve(fake) as url:
+            agent.router = model_router.ModelRouter([url], seed=args.seed)
+            agent.tanggap_agent.model = agent._ollama_model(
+                agent.TANGGAP_INSTRUCTION, output=agent.response_format("analysis", agent.ANALYSIS_SCHEMA, mode)
+            )
+            agent.tanggap_batch_agent.model = agent._ollama_model(
+                agent.TANGGAP_BATCH_INSTRUCTION, lane="bulk",
+                output=agent.response_format("analyses", agent.BATCH_SCHEMA, mode),
+            )
+            runner = session_store.StatelessRunner(["tanggap_agent", "tanggap_batch_agent"])
+            outcomes, latencies = asyncio.run(_drive(args, runner))
+
+        items = sum(outcomes.values())
+        stats = fake.state.stats
+        print(
+            f"{mode:<8} {items:>6} {stats['drifted'] / stats['chats']:>8.1%} {outcomes['failed'] / items:>7.1%} "
+            f"{stats['output_tokens'] / items:>13.1f} {statistics.median(latencies) * 1000:>8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""In-memory stand-in for google.cloud.bigquery.Client
+
+Call ``install()`` before the app first asks for its BigQuery client so
+``bq_client.get_client()`` returns a fake and no credentials are needed.
+``install_on_import()`` defers that (and the google.cloud.bigquery import)
+until the app imports bq_client itself, for measuring startup.
+
+Queries are not parsed. Equality filters on sentiment and category and
+the ``limit`` parameter are applied to the inserted rows, newest first,
+which is enough for /api/query pages.
+"""
+import importlib.abc
+import importlib.util
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+FILTER_PARAMS = ("sentiment", "category")
+
+
+class FakeBigQueryClient:
+    """Records inserted rows; optionally injects latency and row rejections"""
+
+    def __init__(
+        self,
+        project: Optional[str] = None,
+        insert_latency_ms: float = 0.0,
+        reject_rate: float = 0.0,
+        query_latency_ms: float = 0.0,
+    ):
+        self.project = project
+        self.insert_latency_ms = insert_latency_ms
+        self.reject_rate = reject_rate
+        self.query_latency_ms = query_latency_ms
+        self.rows: List[Dict] = []
+        self.insert_calls = 0
+        self.queries: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        pass
+
+    def insert_rows_json(self, table: str, json_rows: List[Dict], row_ids=None, **kwargs) -> List[Dict]:
+        if self.insert_latency_ms:
+            time.sleep(self.insert_latency_ms / 1000)
+        errors = []
+        with self._lock:
+            self.insert_calls += 1
+            for index, row in enumerate(json_rows):
+                if self.reject_rate and random.random() < self.reject_rate:
+                    errors.append({"index": index, "errors": [{"reason": "backendError"}]})
+                else:
+                    self.rows.append(row)
+        return errors
+
+    def query(self, query: str, job_config=None, **kwargs):
+        if self.query_latency_ms:
+            time.sleep(self.query_latency_ms / 1000)
+        params = {p.name: p.value for p in getattr(job_config, "query_parameters", None) or []}
+        with self._lock:
+            self.queries.append((query, job_config))
+            rows = list(self.rows)
+        if "limit" not in params:
+            return _FakeQueryJob(rows)
+        rows = [row for row in rows if all(row.get(f) == params[f] for f in FILTER_PARAMS if f in params)]
+        rows.sort(key=lambda row: (row["created_at"], row["id"]), reverse=True)
+        return _FakeQueryJob([
+            {**row, "created_at": datetime.fromisoformat(row["created_at"].replace("Z", "+00:00"))}
+            for row in rows[:params["limit"]]
+        ])
+
+
+class _FakeQueryJob:
+    def __init__(self, rows: List[Dict]):
+        self._rows = rows
+
+    def result(self, **kwargs):
+        return iter(self._rows)
+
+
+def install(init_latency_ms: float = 0.0, **kwargs) -> FakeBigQueryClient:
+    """Swap the BigQuery client used by app.services.bq_client for a fake
+    
+    ``init_latency_ms`` stands in for resolving credentials when the app
+    creates its client.
+    """
+    from google.cloud import bigquery
+
+    fake = FakeBigQueryClient(**kwargs)
+
+    def create(*args, **client_kwargs) -> FakeBigQueryClient:
+        if init_latency_ms:
+            time.sleep(init_latency_ms / 1000)
+        return fake
+
+    bigquery.Client = create
+
+    import app.services.bq_client as bq_client
+    bq_client.close_client()
+    return fake
+
+
+class _InstallOnImport(importlib.abc.MetaPathFinder):
+    def __init__(self, kwargs: Dict):
+        self.kwargs = kwargs
+
+    def find_spec(self, name, path, target=None):
+        if name != "app.services.bq_client":
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(name)
+        exec_module = spec.loader.exec_module
+
+        def exec_and_install(module):
+            exec_module(module)
+            install(**self.kwargs)
+
+        spec.loader.exec_module = exec_and_install
+        return spec
+
+
+def install_on_import(**kwargs) -> None:
+    """Call ``install(**kwargs)`` right after the app first imports bq_client"""
+    sys.meta_path.insert(0, _InstallOnImport(kwargs))
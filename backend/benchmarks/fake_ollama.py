@@ -0,0 +1,160 @@
+"""Local stand-in for Ollama's /api/chat
+
+Charges per-token prefill and decode time and serves a limited number of
+generations at once, so engines and batch sizes can be compared without a
+GPU. Like Ollama, each slot remembers its last prompt and only the part
+after the longest shared prefix is prefilled (and counted in
+prompt_eval_count).
+
+With format_errors, answers drift from the instruction the way a small
+model does, unless the request's ``format`` rules the drift out: the JSON
+may come fenced, wrapped in prose or with a trailing comma (not with any
+format), or carry a value outside the schema or miss a field (not with a
+schema format).
+"""
+import asyncio
+import contextlib
+import json
+import os
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.stub_agent import _BATCH_ITEM, SAMPLE_ANALYSIS, _tokens
+
+# Drifts ruled out by any format ("json" or a schema), and by a schema only
+_SYNTAX_DRIFTS = ("fenced", "chatty", "trailing_comma")
+_VALUE_DRIFTS = ("bad_value", "missing_field")
+_CHATTY_TAIL = (
+    "\n\nThis feedback points to a problem the customer experienced directly. "
+    "Addressing it quickly should improve their satisfaction, and the recommendation "
+    "above is a good first step. Let me know if you need a deeper analysis."
+)
+
+# About the length of TANGGAP_INSTRUCTION, for runs that have no real instruction
+STUB_INSTRUCTION = "Analyze the customer feedback and answer with the analysis JSON object. " * 24
+
+
+def create_fake_ollama(
+    rtt_ms: float = 0.0,
+    prefill_tps: float = 0.0,
+    decode_tps: float = 0.0,
+    parallel: int = 1,
+    prefix_cache: bool = True,
+    jitter: float = 0.0,
+    seed: int = None,
+    fail_rate: float = 0.0,
+    format_errors: float = 0.0,
+) -> FastAPI:
+    """Build a fake Ollama app
+
+    Args:
+        rtt_ms: Delay added to every request to emulate network round trips
+        prefill_tps: Prompt tokens processed per second (0 = free)
+        decode_tps: Output tokens generated per second (0 = free)
+        parallel: Generations served at once, like OLLAMA_NUM_PARALLEL (0 = unlimited)
+        prefix_cache: Reuse the KV cache of a matching prompt prefix
+        jitter: Scale each generation's time by a random factor in [1 - jitter, 1 + jitter]
+        seed: Seed for the jitter and failures
+        fail_rate: Fraction of chats answered with 503, like an overloaded or unhealthy server
+        format_errors: Fraction of answers that drift from the instruction where ``format`` allows it
+    """
+    app = FastAPI()
+    app.state.stats = {"chats": 0, "failed": 0, "drifted": 0, "prompt_tokens": 0, "output_tokens": 0}
+    app.state.requests = []
+    app.state.kv = []  # last prompt per slot, least recently used first
+    slots = asyncio.Semaphore(parallel) if parallel else None
+    rng = random.Random(seed)
+
+    @app.get("/api/version")
+    async def version():
+        return {"version": "fake"}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        # Parsed by hand: LiteLLM posts JSON without a JSON content type
+        body = json.loads(await request.body())
+        if rtt_ms:
+            await asyncio.sleep(rtt_ms / 1000)
+        if fail_rate and rng.random() < fail_rate:
+            app.state.stats["failed"] += 1
+            return JSONResponse(status_code=503, content={"error": "server busy"})
+        app.state.requests.append(body)
+        prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+        user = body["messages"][-1]["content"]
+        indices = [int(i) for i in _BATCH_ITEM.findall(user)]
+        items = [{"index": i, **SAMPLE_ANALYSIS} for i in indices] or [dict(SAMPLE_ANALYSIS)]
+        text = _answer(items, bool(indices), body.get("format"))
+        prompt_tokens, output_tokens = _tokens(prompt) - _reuse(prompt), _tokens(text)
+        app.state.stats["chats"] += 1
+        app.state.stats["prompt_tokens"] += prompt_tokens
+        app.state.stats["output_tokens"] += output_tokens
+
+        final = {
+            "model": body.get("model"),
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": output_tokens,
+        }
+        scale = rng.uniform(1 - jitter, 1 + jitter) if jitter else 1.0
+        prefill = (prompt_tokens / prefill_tps if prefill_tps else 0.0) * scale
+        final["prompt_eval_duration"] = int(prefill * 1e9)
+        decode = (output_tokens / decode_tps if decode_tps else 0.0) * scale
+
+        if not body.get("stream", True):
+            async with slots or contextlib.nullcontext():
+                await asyncio.sleep(prefill + decode)
+            return {**final, "message": {"role": "assistant", "content": text}}
+
+        async def lines():
+            chunks = [text[i:i + 4] for i in range(0, len(text), 4)]
+            async with slots or contextlib.nullcontext():
+                await asyncio.sleep(prefill)
+                for chunk in chunks:
+                    yield json.dumps({"model": body.get("model"), "message": {"role": "assistant", "content": chunk}, "done": False}) + "\n"
+                    if decode:
+                        await asyncio.sleep(decode / len(chunks))
+            yield json.dumps({**final, "message": {"role": "assistant", "content": ""}}) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    def _answer(items: list, batch: bool, fmt) -> str:
+        drift = None
+        if format_errors and rng.random() < format_errors:
+            drift = rng.choice(_SYNTAX_DRIFTS + _VALUE_DRIFTS)
+            if isinstance(fmt, dict) or (fmt and drift in _SYNTAX_DRIFTS):
+                drift = None
+            else:
+                app.state.stats["drifted"] += 1
+        if drift == "bad_value":
+            field, value = rng.choice([("sentiment", "mixed"), ("category", "shipping"), ("priority", 7)])
+            rng.choice(items)[field] = value
+        elif drift == "missing_field":
+            del rng.choice(items)["recommendation"]
+        text = json.dumps(items if batch else items[0])
+        if drift == "trailing_comma":
+            return text[:-1] + ", " + text[-1]
+        if drift == "fenced":
+            return f"```json\n{text}\n```"
+        if drift == "chatty":
+            return f"Here is the analysis of the feedback:\n{text}{_CHATTY_TAIL}"
+        return text
+
+    def _reuse(prompt: str) -> int:
+        """Tokens served from the best-matching slot; the prompt then takes over that slot"""
+        best, shared = None, 0
+        if prefix_cache:
+            for cached in app.state.kv:
+                n = len(os.path.commonprefix([cached, prompt]))
+                if n > shared:
+                    best, shared = cached, n
+        if best is not None:
+            app.state.kv.remove(best)
+        elif len(app.state.kv) >= max(parallel, 1):
+            app.state.kv.pop(0)
+        app.state.kv.append(prompt)
+        # At least one token is always evaluated, as in llama.cpp
+        return min(shared // 4, _tokens(prompt) - 1)
+
+    return app
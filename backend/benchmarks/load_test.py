@@ -0,0 +1,333 @@
+"""End-to-end load test of the backend against local stand-ins
+
+Starts the stub ADK agent (/run_sse with per-token pacing and jitter) and
+the fake Ollama, swaps BigQuery for the in-memory fake, and serves the
+real backend app with uvicorn. --concurrency closed-loop clients then
+drive /api/analyze and /api/query (--query-share of requests) for
+--duration seconds after a --warmup. With --backend-url, a running
+backend is driven instead and nothing is started.
+
+Reported, and written as JSON with --output:
+
+- per endpoint: requests, errors, 503s, RPS and p50/p95/p99/max latency
+- event-loop lag of the backend: a timer in its loop is due every
+  --lag-interval-ms; how late it fires is time the loop was blocked
+- mean time per stage over the run, from the backend's /metrics
+
+--baseline compares with an earlier --output file and exits with status 1
+when RPS or a latency percentile is worse by more than --max-regression.
+The clients share the process (and the GIL) with the backend, so compare
+runs made on the same machine with the same arguments.
+
+Usage: python -m benchmarks.load_test [--concurrency 32] [--duration 20] [--query-share 0.2]
+       [--engine adk|ollama] [--prefill-tps 2000] [--decode-tps 50] [--jitter 0.2]
+       [--output results.json] [--baseline previous.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from benchmarks.server import percentile, serve
+
+FEEDBACK = [
+    "Pesanan saya terlambat tiga hari dan kurirnya tidak bisa dihubungi sama sekali",
+    "The app keeps crashing when I try to pay with my credit card at checkout",
+    "Customer service took two days to answer a simple question about my refund",
+    "Produk yang datang tidak sesuai dengan foto di website, warnanya beda jauh",
+    "I was charged twice for the same order and nobody has fixed it yet",
+    "Pengiriman cepat sekali dan barangnya dikemas dengan sangat rapi, terima kasih",
+    "The website is very slow during peak hours and search results never load",
+    "Kualitas bahan bajunya bagus tapi ukurannya lebih kecil dari yang tertera",
+]
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms")
+
+
+class LoopLagProbe:
+    """ASGI wrapper that runs a periodic timer in the serving event loop
+
+    Each sample is (when, lag in seconds): how late the timer fired.
+    """
+
+    def __init__(self, app, interval: float = 0.01):
+        self.app = app
+        self.interval = interval
+        self.samples: List[tuple] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def __call__(self, scope, receive, send):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        await self.app(scope, receive, send)
+
+    async def _run(self) -> None:
+        while True:
+            due = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self.samples.append((now, max(0.0, now - due)))
+
+
+def _feedback(rng: random.Random, i: int, distinct: int) -> str:
+    n = rng.randrange(distinct) if distinct else i
+    return f"{FEEDBACK[n % len(FEEDBACK)]} (order {n})"
+
+
+async def _drive(args, base_url: str, window: Dict) -> List[tuple]:
+    """Closed-loop clients; returns (endpoint, status, started, seconds) for the measured window"""
+    import httpx
+
+    results: List[tuple] = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        counter = iter(range(10 ** 9))
+
+        async def worker(seed: int) -> None:
+            rng = random.Random(seed)
+            while time.perf_counter() < window["end"]:
+                i = next(counter)
+                started = time.perf_counter()
+                if rng.random() < args.query_share:
+                    endpoint = "query"
+                    params = {"limit": 20}
+                    if rng.random() < 0.5:
+                        params["sentiment"] = rng.choice(("positive", "neutral", "negative"))
+                    request = client.get("/api/query", params=params)
+                else:
+                    endpoint = "analyze"
+                    request = client.post("/api/analyze", json={"feedback": _feedback(rng, i, args.distinct)})
+                try:
+                    status = (await request).status_code
+                except httpx.HTTPError:
+                    status = 0
+                if started >= window["start"]:
+                    results.append((endpoint, status, started, time.perf_counter() - started))
+
+        await asyncio.gather(*(worker(args.seed + n) for n in range(args.concurrency)))
+    return results
+
+
+def _stage_totals(base_url: str) -> Dict[str, tuple]:
+    """(sum, count) per stage from the backend's /metrics"""
+    import httpx
+    from prometheus_client.parser import text_string_to_metric_families
+
+    totals: Dict[str, list] = {}
+    try:
+        text = httpx.get(f"{base_url}/metrics", timeout=10).text
+    except httpx.HTTPError:
+        return {}
+    for family in text_string_to_metric_families(text):
+        if family.name != "tanggap_stage_seconds":
+            continue
+        for sample in family.samples:
+            stage = totals.setdefault(sample.labels["stage"], [0.0, 0.0])
+            if sample.name.endswith("_sum"):
+                stage[0] = sample.value
+            elif sample.name.endswith("_count"):
+                stage[1] = sample.value
+    return {name: tuple(values) for name, values in totals.items()}
+
+
+def _summarize(results: List[tuple], elapsed: float) -> Dict:
+    endpoints = {}
+    for endpoint in sorted({r[0] for r in results}):
+        rows = [r for r in results if r[0] == endpoint]
+        ok = [r[3] * 1000 for r in rows if r[1] == 200]
+        endpoints[endpoint] = {
+            "requests": len(rows),
+            "ok": len(ok),
+            "shed_503": sum(r[1] == 503 for r in rows),
+            "errors": sum(r[1] not in (200, 503) for r in rows),
+            "rps": round(len(ok) / elapsed, 2),
+            "p50_ms": round(percentile(ok, 50), 2),
+            "p95_ms": round(percentile(ok, 95), 2),
+            "p99_ms": round(percentile(ok, 99), 2),
+            "max_ms": round(max(ok, default=0.0), 2),
+        }
+    return endpoints
+
+
+def _loop_summary(probe: Optional[LoopLagProbe], window: Dict, stall_ms: float) -> Optional[Dict]:
+    if probe is None:
+        return None
+    lags = [lag * 1000 for when, lag in probe.samples if window["start"] <= when <= window["end"]]
+    return {
+        "samples": len(lags),
+        "lag_p50_ms": round(percentile(lags, 50), 2),
+        "lag_p99_ms": round(percentile(lags, 99), 2),
+        "lag_max_ms": round(max(lags, default=0.0), 2),
+        "blocked_ms": round(sum(lags), 1),
+        "stalls": sum(lag >= stall_ms for lag in lags),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _compare(report: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """Print changes against the baseline; returns the regressions"""
+    regressions = []
+    for endpoint, now in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(endpoint)
+        if not before:
+            continue
+        for key in ("rps", *LOWER_IS_BETTER):
+            if not before.get(key):
+                continue
+            change = (now[key] - before[key]) / before[key]
+            worse = change > max_regression if key in LOWER_IS_BETTER else change < -max_regression
+            flag = "  REGRESSION" if worse else ""
+            print(f"  {endpoint:<8} {key:<7} {before[key]:>10.2f} -> {now[key]:>10.2f} ({change:+.1%}){flag}")
+            if worse:
+                regressions.append(f"{endpoint}.{key}")
+    loop_now, loop_before = report.get("loop"), baseline.get("loop")
+    if loop_now and loop_before:
+        print(f"  loop     lag_p99 {loop_before['lag_p99_ms']:>10.2f} -> {loop_now['lag_p99_ms']:>10.2f}")
+    return regressions
+
+
+def _start_backend(args, stack: ExitStack) -> tuple:
+    """Start the stand-ins and the backend; returns (backend URL, loop lag probe)"""
+    # Settings read at import time; background BigQuery readers would only query the fake
+    os.environ.setdefault("ROOT_CAUSE_ENABLED", "false")
+    os.environ.setdefault("STATS_RECONCILE_SECONDS", "0")
+    os.environ.setdefault("SLOW_REQUEST_MS", "600000")
+
+    from benchmarks import fake_bigquery
+    from benchmarks.fake_ollama import STUB_INSTRUCTION, create_fake_ollama
+    from benchmarks.stub_agent import create_stub_agent
+
+    fake_bigquery.install(insert_latency_ms=args.bq_insert_ms, query_latency_ms=args.bq_query_ms)
+    from app.main import app
+    from app.services import agent_client, ollama_engine
+
+    if not args.caches:
+        # Every analysis reaches the model
+        agent_client.ANALYSIS_CACHE_ENABLED = False
+        agent_client.PRECLASSIFIER_ENABLED = False
+        agent_client.AGENT_SINGLEFLIGHT = False
+        agent_client.semantic_cache = None
+
+    timing = dict(
+        prefill_tps=args.prefill_tps, decode_tps=args.decode_tps, parallel=args.parallel,
+        jitter=args.jitter, seed=args.seed,
+    )
+    ollama_url = stack.enter_context(serve(create_fake_ollama(rtt_ms=args.rtt_ms, **timing)))
+    stub = create_stub_agent(rtt_ms=args.rtt_ms, generate_ms=args.generate_ms, instruction=STUB_INSTRUCTION, **timing)
+    agent_client.AGENT_URL = stack.enter_context(serve(stub))
+    agent_client.AGENT_ENGINE = args.engine
+    ollama_engine.OLLAMA_URL = ollama_url
+
+    probe = LoopLagProbe(app, args.lag_interval_ms / 1000)
+    return stack.enter_context(serve(probe)), probe
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32, help="Closed-loop clients")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Seconds before measuring")
+    parser.add_argument("--query-share", type=float, default=0.2, help="Fraction of requests to /api/query")
+    parser.add_argument("--distinct", type=int, default=0, help="Distinct feedback texts (0 = every request unique)")
+    parser.add_argument("--caches", action="store_true", help="Keep the analysis caches, pre-classifier and coalescing on")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Client timeout per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend-url", help="Drive a running backend instead of starting one")
+    parser.add_argument("--engine", choices=("adk", "ollama"), default="adk", help="AGENT_ENGINE of the started backend")
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="Emulated network round trip per hop")
+    parser.add_argument("--generate-ms", type=float, default=0.0, help="Fixed model time per agent run")
+    parser.add_argument("--prefill-tps", type=float, default=2000.0, help="Emulated prompt tokens per second")
+    parser.add_argument("--decode-tps", type=float, default=50.0, help="Emulated output tokens per second")
+    parser.add_argument("--parallel", type=int, default=4, help="Generations the emulated model serves at once")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Random +/- fraction on each generation time")
+    parser.add_argument("--bq-insert-ms", type=float, default=50.0, help="Fake BigQuery insert latency")
+    parser.add_argument("--bq-query-ms", type=float, default=300.0, help="Fake BigQuery query latency")
+    parser.add_argument("--lag-interval-ms", type=float, default=10.0, help="Event-loop probe period")
+    parser.add_argument("--stall-ms", type=float, default=20.0, help="Loop lag counted as a stall")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Compare with an earlier --output file")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="Allowed relative change vs the baseline")
+    args = parser.parse_args()
+
+    with ExitStack() as stack:
+        probe = None
+        base_url = args.backend_url
+        if base_url is None:
+            base_url, probe = _start_backend(args, stack)
+
+        start = time.perf_counter() + args.warmup
+        window = {"start": start, "end": start + args.duration}
+        stages_before: Dict[str, tuple] = {}
+
+        async def run():
+            nonlocal stages_before
+            driving = asyncio.create_task(_drive(args, base_url, window))
+            await asyncio.sleep(max(0.0, window["start"] - time.perf_counter()))
+            stages_before = await asyncio.to_thread(_stage_totals, base_url)
+            return await driving
+
+        results = asyncio.run(run())
+        elapsed = max(time.perf_counter(), window["end"]) - window["start"]
+        stages_after = _stage_totals(base_url)
+
+    stages = {}
+    for name, (total, count) in stages_after.items():
+        prev_total, prev_count = stages_before.get(name, (0.0, 0.0))
+        if count > prev_count:
+            stages[name] = round((total - prev_total) / (count - prev_count) * 1000, 2)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "config": vars(args),
+        "elapsed_s": round(elapsed, 2),
+        "endpoints": _summarize(results, elapsed),
+        "loop": _loop_summary(probe, window, args.stall_ms),
+        "stage_mean_ms": stages,
+    }
+
+    for endpoint, r in report["endpoints"].items():
+        print(
+            f"{endpoint:<8} {r['rps']:>8.2f} req/s ok={r['ok']}/{r['requests']} 503={r['shed_503']} "
+            f"errors={r['errors']} p50={r['p50_ms']:.1f}ms p95={r['p95_ms']:.1f}ms p99={r['p99_ms']:.1f}ms"
+        )
+    if report["loop"]:
+        loop = report["loop"]
+        print(
+            f"loop lag p50={loop['lag_p50_ms']:.2f}ms p99={loop['lag_p99_ms']:.2f}ms max={loop['lag_max_ms']:.1f}ms "
+            f"blocked={loop['blocked_ms']:.0f}ms stalls(>={args.stall_ms:.0f}ms)={loop['stalls']}"
+        )
+    if stages:
+        print("stages   " + " ".join(f"{name}={ms:.1f}ms" for name, ms in sorted(stages.items())))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"vs {args.baseline} ({baseline.get('git_commit')}, {baseline.get('timestamp')}):")
+        regressions = _compare(report, baseline, args.max_regression)
+        if regressions:
+            print(f"regressed beyond {args.max_regression:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Agent server memory over many analyses, per session store
+
+In-process mode (default) drives an ADK session service the way the agent
+server does for each analysis: get or create a session and append the
+user message and the model's answer. It also deletes the session when the
+backend would. RSS is sampled every --every runs. Compare ``--store
+bounded`` with ``--store memory`` (ADK's unbounded default) and
+``--mode leak`` (sessions created and never deleted, as the backend
+used to do).
+
+With --agent-url, it drives a running agent (e.g. backed by
+benchmarks.fake_ollama) through agent_client in the given
+AGENT_SESSION_MODE, and reads RSS from the agent's /session-stats.
+
+Usage: python -m benchmarks.soak_agent_sessions [--runs 100000] [--store bounded|memory]
+       [--mode leak|pool|per_request|stateless] [--agent-url URL]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from benchmarks.stub_agent import SAMPLE_ANALYSIS
+
+AGENT_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "adk-agent")
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+async def _soak_in_process(args) -> list:
+    sys.path.insert(0, os.path.abspath(AGENT_DIR))
+    from google.adk.events import Event
+    from google.adk.sessions import InMemorySessionService
+    from google.genai import types
+
+    import session_store
+
+    service = session_store.BoundedSessionService() if args.store == "bounded" else InMemorySessionService()
+    answer = json.dumps(SAMPLE_ANALYSIS)
+    pool: list = []  # [(session_id, uses)]
+    samples = []
+    for i in range(1, args.runs + 1):
+        if args.mode == "pool" and pool:
+            session_id, uses = pool.pop()
+            session = await service.get_session(app_name="tanggap_agent", user_id="default_user", session_id=session_id)
+        else:
+            session, uses = None, 0
+        if session is None:
+            session = await service.create_session(app_name="tanggap_agent", user_id="default_user")
+        for author, role, text in (("user", "user", f"Analyze this feedback: order #{i} arrived late"), ("tanggap_agent", "model", answer)):
+            event = Event(author=author, invocation_id=f"run-{i}", content=types.Content(role=role, parts=[types.Part(text=text)]))
+            await service.append_event(session, event)
+        if args.mode == "pool" and uses + 1 < 50:
+            pool.append((session.id, uses + 1))
+        elif args.mode in ("per_request", "stateless", "pool"):
+            await service.delete_session(app_name="tanggap_agent", user_id="default_user", session_id=session.id)
+        if i % args.every == 0:
+            samples.append((i, _rss_mb()))
+    return samples
+
+
+async def _soak_http(args) -> list:
+    import httpx
+
+    from app.services import agent_client
+
+    # Every analysis must reach the agent
+    agent_client.ANALYSIS_CACHE_ENABLED = False
+    agent_client.PRECLASSIFIER_ENABLED = False
+    agent_client.AGENT_SINGLEFLIGHT = False
+    agent_client.semantic_cache = None
+    agent_client.AGENT_URL = args.agent_url
+    agent_client.AGENT_SESSION_MODE = args.mode
+    await agent_client.start_client()
+    samples = []
+    async with httpx.AsyncClient(timeout=10) as http:
+        done = 0
+        while done < args.runs:
+            n = min(args.concurrency, args.runs - done)
+            await asyncio.gather(
+                *(agent_client.analyze_feedback(f"order #{done + j} arrived late", f"soak-{done + j}", "") for j in range(n)),
+                return_exceptions=True,
+            )
+            done += n
+            if done % args.every < n:
+                stats = (await http.get(f"{args.agent_url}/session-stats")).json()
+                samples.append((done, stats["rss_mb"]))
+    await agent_client.close_client()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=100_000)
+    parser.add_argument("--every", type=int, default=10_000, help="Sample RSS every N runs")
+    parser.add_argument("--store", choices=("bounded", "memory"), default="bounded", help="In-process session store")
+    parser.add_argument("--mode", choices=("leak", "pool", "per_request", "stateless"), default="leak")
+    parser.add_argument("--agent-url", help="Soak a running agent instead of an in-process session store")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent analyses with --agent-url")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.agent_url:
+        samples = asyncio.run(_soak_http(args))
+    else:
+        samples = asyncio.run(_soak_in_process(args))
+    elapsed = time.perf_counter() - start
+
+    for runs, rss in samples:
+        print(f"{runs:>8} runs: rss={rss:.1f}MB")
+    if len(samples) >= 2:
+        growth = samples[-1][1] - samples[0][1]
+        print(
+            f"store={'agent' if args.agent_url else args.store} mode={args.mode}: "
+            f"{growth:+.1f}MB from {samples[0][0]} to {samples[-1][0]} runs, {args.runs / elapsed:.0f} runs/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Local stand-in for the ADK agent server (sessions + /run_sse)"""
+import asyncio
+import contextlib
+import json
+import random
+import re
+import uuid
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+SAMPLE_ANALYSIS = {
+    "sentiment": "negative",
+    "category": "delivery",
+    "priority": 4,
+    "keywords": ["delivery", "late"],
+    "root_cause": "Shipping delay",
+    "recommendation": "Improve logistics tracking",
+    "summary": "Delivery arrived late.",
+}
+
+
+# Roughly the size of TANGGAP_INSTRUCTION / TANGGAP_BATCH_INSTRUCTION
+INSTRUCTION_TOKENS = 430
+
+_BATCH_ITEM = re.compile(r"^\[(\d+)\] ", re.MULTILINE)
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _sse(event: dict) -> str:
+    return f"data: {json.dumps(event)}\n\n"
+
+
+def create_stub_agent(
+    rtt_ms: float = 0.0,
+    generate_ms: float = 0.0,
+    prefill_tps: float = 0.0,
+    decode_tps: float = 0.0,
+    parallel: int = 0,
+    ollama_url: str = None,
+    instruction: str = "",
+    shared: bool = False,
+    jitter: float = 0.0,
+    seed: int = None,
+) -> FastAPI:
+    """Build a stub agent app
+
+    Args:
+        rtt_ms: Delay added to every HTTP request to emulate network round trips
+        generate_ms: Extra delay on /run_sse to emulate model generation
+        prefill_tps: Prompt tokens processed per second (0 = free)
+        decode_tps: Output tokens generated per second (0 = free)
+        parallel: Generations served at once, like OLLAMA_NUM_PARALLEL (0 = unlimited)
+        ollama_url: Forward generations to this (fake) Ollama, like ADK -> LiteLLM -> Ollama;
+            the timing arguments above are then ignored
+        instruction: System prompt sent to Ollama when forwarding
+        shared: Instead of queueing, run every generation at once and slow all of them
+            down when more than ``parallel`` are active, like one GPU under overload
+        jitter: Scale each generation's time by a random factor in [1 - jitter, 1 + jitter]
+        seed: Seed for the jitter
+
+    With streaming requested, partial events are paced at ``decode_tps`` after
+    the prefill, so time to first token and total time differ as with a real model.
+    """
+    app = FastAPI()
+    app.state.sessions = set()
+    app.state.stats = {"sessions_created": 0, "runs": 0}
+    app.state.active = 0
+    slots = asyncio.Semaphore(parallel) if parallel and not shared else None
+    rng = random.Random(seed)
+
+    @app.middleware("http")
+    async def add_rtt(request: Request, call_next):
+        if rtt_ms:
+            await asyncio.sleep(rtt_ms / 1000)
+        return await call_next(request)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy", "service": "stub-agent"}
+
+    @app.get("/agent-info")
+    async def agent_info():
+        info = {"app_name": "tanggap_agent", "model": "stub", "instruction_sha256": "stub"}
+        if instruction:
+            info.update(instruction=instruction, batch_instruction=instruction)
+        return info
+
+    @app.post("/apps/{app_name}/users/{user_id}/sessions")
+    async def create_session(app_name: str, user_id: str):
+        session_id = str(uuid.uuid4())
+        app.state.sessions.add(session_id)
+        app.state.stats["sessions_created"] += 1
+        return {"id": session_id, "appName": app_name, "userId": user_id}
+
+    @app.delete("/apps/{app_name}/users/{user_id}/sessions/{session_id}")
+    async def delete_session(app_name: str, user_id: str, session_id: str):
+        app.state.sessions.discard(session_id)
+        return None
+
+    @app.post("/run_sse")
+    async def run_sse(body: dict):
+        if body.get("session_id") not in app.state.sessions:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return await _run(body)
+
+    @app.post("/run_stateless")
+    async def run_stateless(body: dict):
+        return await _run(body)
+
+    async def _run(body: dict):
+        app.state.stats["runs"] += 1
+        prompt = "".join(part.get("text", "") for part in body["newMessage"]["parts"])
+        if body.get("app_name") == "tanggap_batch_agent":
+            indices = [int(i) for i in _BATCH_ITEM.findall(prompt)]
+            text = json.dumps([{"index": i, **SAMPLE_ANALYSIS} for i in indices])
+        else:
+            text = json.dumps(SAMPLE_ANALYSIS)
+        usage = {
+            "promptTokenCount": INSTRUCTION_TOKENS + _tokens(prompt),
+            "candidatesTokenCount": _tokens(text),
+        }
+        scale = rng.uniform(1 - jitter, 1 + jitter) if jitter else 1.0
+        prefill = generate_ms / 1000
+        if prefill_tps:
+            prefill += usage["promptTokenCount"] / prefill_tps
+        decode = usage["candidatesTokenCount"] / decode_tps if decode_tps else 0.0
+        prefill, decode = prefill * scale, decode * scale
+
+        if ollama_url:
+            return StreamingResponse(_forwarded(body, prompt), media_type="text/event-stream")
+
+        async def events():
+            pace = decode
+            async with slots or contextlib.nullcontext():
+                if shared and prefill + decode:
+                    await _shared_generate(prefill + decode)
+                    pace = 0.0
+                elif prefill:
+                    await asyncio.sleep(prefill)
+                if body.get("streaming"):
+                    # Token-sized partial deltas, then the aggregated final event
+                    chunks = [text[i:i + 4] for i in range(0, len(text), 4)]
+                    for chunk in chunks:
+                        if pace:
+                            await asyncio.sleep(pace / len(chunks))
+                        yield _sse({"content": {"parts": [{"text": chunk}], "role": "model"}, "partial": True})
+                elif pace:
+                    await asyncio.sleep(pace)
+            yield _sse({
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "author": body.get("app_name", "tanggap_agent"),
+                "usageMetadata": usage,
+            })
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def _shared_generate(delay: float):
+        """Make ``delay`` seconds of progress at a rate shared by all active generations"""
+        app.state.active += 1
+        try:
+            remaining = delay
+            while remaining > 0:
+                await asyncio.sleep(0.01)
+                remaining -= 0.01 * min(1.0, max(parallel, 1) / app.state.active)
+        finally:
+            app.state.active -= 1
+
+    async def _forwarded(body: dict, prompt: str):
+        if getattr(app.state, "http", None) is None:
+            app.state.http = httpx.AsyncClient(timeout=60)
+        response = await app.state.http.post(f"{ollama_url}/api/chat", json={
+            "model": "stub",
+            "messages": [{"role": "system", "content": instruction}, {"role": "user", "content": prompt}],
+            "stream": False,
+        })
+        data = response.json()
+        yield _sse({
+            "content": {"parts": [{"text": data["message"]["content"]}], "role": "model"},
+            "author": body.get("app_name", "tanggap_agent"),
+            "usageMetadata": {
+                "promptTokenCount": data.get("prompt_eval_count"),
+                "candidatesTokenCount": data.get("eval_count"),
+            },
+        })
+
+    return app
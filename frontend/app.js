@@ -13,8 +13,13 @@ const CONFIG = {
 const API = {
     ANALYZE: `${CONFIG.API_BASE_URL}/api/analyze`,
     QUERY: `${CONFIG.API_BASE_URL}/api/query`,
+    JOBS: `${CONFIG.API_BASE_URL}/api/jobs`,
 };
 
+// Polling fallback when the job event stream is unavailable
+const JOB_POLL_INTERVAL_MS = 1000;
+const JOB_POLL_MAX_ATTEMPTS = 120;
+
 // DOM Elements
 const feedbackForm = document.getElementById("feedbackForm");
 const feedbackInput = document.getElementById("feedbackInput");
@@ -66,7 +71,8 @@ async function handleFormSubmit(e) {
     hideResult();
 
     try {
-        const response = await fetch(API.ANALYZE, {
+        // Submit as an async job; the backend answers 202 right away
+        const response = await fetch(API.JOBS, {
             method: "POST",
             headers: {
                 "Content-Type": "application/json",
@@ -78,7 +84,8 @@ async function handleFormSubmit(e) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
 
-        const data = await response.json();
+        const job = await response.json();
+        const data = await waitForJob(job);
         displayResult(data);
 
         // Reload history to show new entry
@@ -94,6 +101,50 @@ async function handleFormSubmit(e) {
     }
 }
 
+// Wait for a job result over SSE, falling back to polling
+function waitForJob(job) {
+    return new Promise((resolve, reject) => {
+        const finish = (state) => {
+            if (state.status === "done") {
+                resolve(state.result);
+            } else {
+                reject(new Error(state.error || "Analysis failed"));
+            }
+        };
+
+        if (!window.EventSource) {
+            pollJob(job).then(finish, reject);
+            return;
+        }
+
+        const events = new EventSource(`${CONFIG.API_BASE_URL}${job.events_url}`);
+        events.addEventListener("result", (e) => {
+            events.close();
+            finish(JSON.parse(e.data));
+        });
+        events.onerror = () => {
+            events.close();
+            pollJob(job).then(finish, reject);
+        };
+    });
+}
+
+// Poll job status until it finishes
+async function pollJob(job) {
+    for (let attempt = 0; attempt < JOB_POLL_MAX_ATTEMPTS; attempt++) {
+        const response = await fetch(`${CONFIG.API_BASE_URL}${job.status_url}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const state = await response.json();
+        if (state.status === "done" || state.status === "failed") {
+            return state;
+        }
+        await new Promise((r) => setTimeout(r, JOB_POLL_INTERVAL_MS));
+    }
+    throw new Error("Timed out waiting for analysis");
+}
+
 // Display analysis result
 function displayResult(data) {
     // Update sentiment
@@ -134,6 +185,10 @@ async function loadHistory() {
         // Build query parameters
         const params = new URLSearchParams();
         params.append("limit", "20");
+        params.append(
+            "fields",
+            "created_at,feedback_text,sentiment,category,priority_score,root_cause"
+        );
 
         const sentiment = filterSentiment.value;
         if (sentiment) params.append("sentiment", sentiment);